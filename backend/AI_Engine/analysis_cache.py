@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from AI_Engine.model_loader import model_version
+from AI_Engine.gemini_advisor import PROMPT_VERSION, generate_dynamic_advice, generate_dynamic_advice_async
+from AI_Engine.sentiment_analyzer import analyze_sentiment, analyze_sentiment_async, sentiment_batcher
+
+# --- Cache configuration ---
+# In-process LRU tier size, and an optional SQLite file for the persistent tier
+# (leave ANALYSIS_CACHE_PATH empty to keep the cache in memory only).
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_SIZE", "2048"))
+CACHE_DB_PATH = os.getenv("ANALYSIS_CACHE_PATH", "")
+
+# Max Gemini advice calls in flight for one batch request
+BATCH_ADVICE_CONCURRENCY = int(os.getenv("BATCH_ADVICE_CONCURRENCY", "8"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalizes the text and collapses whitespace."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache for {sentiment, analysis} results.
+
+    Keys hash the normalized text together with the model and prompt versions,
+    so new weights or a prompt change never serve stale entries. Persistent
+    rows written under an older version are pruned when the cache opens.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, db_path: str = CACHE_DB_PATH):
+        self.max_entries = max(1, max_entries)
+        self.version = f"{model_version()}|{PROMPT_VERSION}"
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()  # LRU + counters
+        self._db_lock = threading.Lock()  # the SQLite connection
+        self._counters = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "stores": 0}
+
+        self._db = None
+        if db_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                    "key TEXT PRIMARY KEY, version TEXT, value TEXT, created_at REAL)"
+                )
+                pruned = self._db.execute(
+                    "DELETE FROM analysis_cache WHERE version != ?", (self.version,)
+                ).rowcount
+                self._db.commit()
+                if pruned:
+                    print(f"[AnalysisCache] Invalidated {pruned} entries from an older model/prompt version")
+            except sqlite3.Error as e:
+                print(f"[AnalysisCache] Persistent tier disabled: {e}")
+                self._db = None
+
+    def key(self, text: str) -> str:
+        payload = f"{self.version}\n{normalize_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # The in-process LRU is cheap and used directly, also on the event loop.
+    # SQLite calls are serialized by _db_lock and, from async code, run on a
+    # worker thread (aget / aget_many / aput), so the loop never waits on disk.
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            raw = self._lru.get(key)
+            if raw is not None:
+                self._lru.move_to_end(key)
+                self._counters["memory_hits"] += 1
+            return raw
+
+    def _persistent_get(self, keys: List[str]) -> Dict[str, str]:
+        """Rows for `keys` from the SQLite tier (added to the LRU); misses are counted."""
+        found: Dict[str, str] = {}
+        if self._db is not None and keys:
+            try:
+                with self._db_lock:
+                    for start in range(0, len(keys), 500):
+                        chunk = keys[start:start + 500]
+                        found.update(self._db.execute(
+                            f"SELECT key, value FROM analysis_cache WHERE key IN ({','.join('?' * len(chunk))})",
+                            chunk,
+                        ).fetchall())
+            except sqlite3.Error as e:
+                print(f"[AnalysisCache] Read failed: {e}")
+        with self._lock:
+            for key, raw in found.items():
+                self._remember(key, raw)
+            self._counters["persistent_hits"] += len(found)
+            self._counters["misses"] += len(set(keys) - found.keys())
+        return found
+
+    def _persistent_put(self, key: str, raw: str):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, version, value, created_at) VALUES (?, ?, ?, ?)",
+                    (key, self.version, raw, time.time()),
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"[AnalysisCache] Write failed: {e}")
+
+    def get(self, text: str) -> Optional[Dict[str, Any]]:
+        key = self.key(text)
+        raw = self._memory_get(key) or self._persistent_get([key]).get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def aget(self, text: str) -> Optional[Dict[str, Any]]:
+        """get() for async callers: only a persistent-tier lookup leaves the event loop."""
+        return (await self.aget_many([text]))[0]
+
+    async def aget_many(self, texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Lookups for many texts; LRU misses go to SQLite in one query on a worker thread."""
+        keys = [self.key(text) for text in texts]
+        raws = {key: self._memory_get(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, raw in raws.items() if raw is None]
+        if missing:
+            if self._db is not None:
+                raws.update(await asyncio.to_thread(self._persistent_get, missing))
+            else:
+                with self._lock:
+                    self._counters["misses"] += len(missing)
+        return [json.loads(raws[key]) if raws.get(key) is not None else None for key in keys]
+
+    def _store(self, text: str, value: Dict[str, Any]) -> Tuple[str, str]:
+        key = self.key(text)
+        raw = json.dumps(value, default=str)
+        with self._lock:
+            self._remember(key, raw)
+            self._counters["stores"] += 1
+        return key, raw
+
+    def put(self, text: str, value: Dict[str, Any]):
+        self._persistent_put(*self._store(text, value))
+
+    async def aput(self, text: str, value: Dict[str, Any]):
+        """put() for async callers: the SQLite write runs on a worker thread."""
+        key, raw = self._store(text, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._persistent_put, key, raw)
+
+    def _remember(self, key: str, raw: str):
+        self._lru[key] = raw
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._lru)
+        hits = counters["memory_hits"] + counters["persistent_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": size,
+            "max_entries": self.max_entries,
+            "persistent": self._db is not None,
+            "version": self.version,
+        }
+
+
+analysis_cache = AnalysisCache()
+
+
+def _cacheable(analysis: dict) -> bool:
+    # Never cache the "AI advice unavailable" fallback
+    return isinstance(analysis, dict) and "error" not in analysis
+
+
+def analyze_entry(text: str) -> Tuple[dict, dict]:
+    """
+    Returns (sentiment_result, analysis) for a journal text, skipping both the
+    RoBERTa pass and the Gemini call when the same text was analyzed before.
+    """
+    cached = analysis_cache.get(text)
+    if cached is not None:
+        return cached["sentiment"], cached["analysis"]
+
+    sentiment_result = analyze_sentiment(text)
+    analysis = generate_dynamic_advice(text, sentiment_result)
+    if _cacheable(analysis):
+        analysis_cache.put(text, {"sentiment": sentiment_result, "analysis": analysis})
+    return sentiment_result, analysis
+
+
+async def analyze_entry_async(text: str) -> Tuple[dict, dict]:
+    """Async variant of analyze_entry for the route handlers."""
+    cached = await analysis_cache.aget(text)
+    if cached is not None:
+        return cached["sentiment"], cached["analysis"]
+
+    sentiment_result = await analyze_sentiment_async(text)
+    analysis = await generate_dynamic_advice_async(text, sentiment_result)
+    if _cacheable(analysis):
+        await analysis_cache.aput(text, {"sentiment": sentiment_result, "analysis": analysis})
+    return sentiment_result, analysis
+
+
+async def analyze_entries_async(
+    texts: List[str],
+    advice_concurrency: int = BATCH_ADVICE_CONCURRENCY,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Analyzes many journal texts and yields one result dict per text, in input order.
+
+    Cache misses are queued on the shared sentiment batcher together (so they
+    run as batched forward passes), and advice generation fans out with at most
+    `advice_concurrency` Gemini calls in flight. Duplicate texts are analyzed
+    once. A failing item yields {"index", "status": "error", "error"} instead
+    of aborting the whole batch.
+    """
+    semaphore = asyncio.Semaphore(max(1, advice_concurrency))
+    cached = await analysis_cache.aget_many(texts)
+
+    async def analyze(text: str, sentiment_future):
+        sentiment_result = await asyncio.wrap_future(sentiment_future)
+        async with semaphore:
+            analysis = await generate_dynamic_advice_async(text, sentiment_result)
+        if _cacheable(analysis):
+            await analysis_cache.aput(text, {"sentiment": sentiment_result, "analysis": analysis})
+        return sentiment_result, analysis
+
+    # One task per distinct uncached text
+    tasks: Dict[str, asyncio.Task] = {}
+    for text, hit in zip(texts, cached):
+        key = normalize_text(text)
+        if hit is None and key not in tasks:
+            tasks[key] = asyncio.create_task(analyze(text, sentiment_batcher.submit(text)))
+
+    try:
+        for index, text in enumerate(texts):
+            if cached[index] is not None:
+                yield {
+                    "index": index,
+                    "status": "success",
+                    "sentiment_analysis": cached[index]["sentiment"],
+                    "gemini_advice": cached[index]["analysis"],
+                }
+                continue
+            try:
+                sentiment_result, analysis = await tasks[normalize_text(text)]
+                yield {
+                    "index": index,
+                    "status": "success",
+                    "sentiment_analysis": sentiment_result,
+                    "gemini_advice": analysis,
+                }
+            except Exception as e:
+                yield {"index": index, "status": "error", "error": str(e)}
+    finally:
+        # Client went away (or the generator was closed early): stop pending work
+        for task in tasks.values():
+            task.cancel()
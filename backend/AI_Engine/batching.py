@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from queue import Queue, Empty
+from typing import Any, Callable, Dict, List
+
+
+def percentile(ordered: List[float], q: float, digits: int = 3) -> float:
+    """Nearest-rank percentile of an already sorted list (0.0 when empty)."""
+    if not ordered:
+        return 0.0
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], digits)
+
+
+class MicroBatcher:
+    """
+    Collects concurrent submissions for a short window (or until the batch is full)
+    and hands them to `process_fn` as one list. Each caller gets back a Future
+    resolving to its own item of the returned list.
+    """
+
+    def __init__(
+        self,
+        process_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        window_ms: float = 10.0,
+        name: str = "batcher",
+        stats_window: int = 1000,
+    ):
+        self.process_fn = process_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window_s = max(0.0, float(window_ms)) / 1000.0
+        self.name = name
+
+        self._queue: Queue = Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        # Statistics (recent waits/sizes are kept in bounded deques)
+        self._batches = 0
+        self._items = 0
+        self._max_seen = 0
+        self._recent_sizes = deque(maxlen=stats_window)
+        self._recent_waits_ms = deque(maxlen=stats_window)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name=f"{self.name}-worker", daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue a single item and return a Future for its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.window_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Window closed: still drain whatever is already waiting
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            items = [entry[0] for entry in batch]
+            futures = [entry[1] for entry in batch]
+
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._max_seen = max(self._max_seen, len(batch))
+                self._recent_sizes.append(len(batch))
+                for _, _, enqueued in batch:
+                    self._recent_waits_ms.append((started - enqueued) * 1000.0)
+
+            try:
+                results = self.process_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: expected {len(items)} results, got {len(results)}"
+                    )
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch-size and queue-wait statistics (waits over the most recent window)."""
+        with self._lock:
+            sizes = list(self._recent_sizes)
+            waits = sorted(self._recent_waits_ms)
+            batches, items, max_seen = self._batches, self._items, self._max_seen
+
+        return {
+            "name": self.name,
+            "window_ms": self.window_s * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": self._queue.qsize(),
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": round(items / batches, 3) if batches else 0.0,
+            "recent_avg_batch_size": round(sum(sizes) / len(sizes), 3) if sizes else 0.0,
+            "max_batch_size_seen": max_seen,
+            "queue_wait_ms": {
+                "avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "p50": percentile(waits, 0.50),
+                "p95": percentile(waits, 0.95),
+                "max": round(waits[-1], 3) if waits else 0.0,
+            },
+        }
@@ -0,0 +1,140 @@
+"""
+Tune the confidence-gated cascade on a sample of journal texts.
+
+    python -m AI_Engine.cascade_eval --csv labeled.csv --text-column text \
+        --sentiment-column sentiment --sarcasm-column sarcasm
+
+Both tiers run once over the sample. Each threshold is then scored for
+escalation rate, agreement with roberta-large, accuracy against the labels
+(when label columns are given) and estimated cost per item.
+"""
+
+import argparse
+import csv
+import random
+import sys
+import time
+from typing import List, Optional
+
+import torch
+
+from AI_Engine.model_loader import (
+    CASCADE_CONFIDENCE_THRESHOLD, REVERSE_SENTIMENT, REVERSE_SARCASM,
+    load_and_initialize_model, load_small_model
+)
+from AI_Engine.sentiment_analyzer import _run_model, cascade_confidence
+from AI_Engine.export_model import SAMPLE_CSV
+
+DEFAULT_THRESHOLDS = [0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 0.98]
+
+SENTIMENT_IDS = {label: i for i, label in REVERSE_SENTIMENT.items()}
+SARCASM_IDS = {label: i for i, label in REVERSE_SARCASM.items()}
+
+
+def _label_id(value: str, mapping: dict) -> Optional[int]:
+    value = (value or "").strip().lower()
+    if value in mapping:
+        return mapping[value]
+    return int(value) if value.isdigit() else None
+
+
+def load_labeled_sample(path, text_column, sentiment_column=None, sarcasm_column=None, n=1000, seed=13):
+    """Returns (texts, sentiment_ids, sarcasm_ids); label lists are None when no column is given."""
+    with open(path, encoding="utf-8") as f:
+        rows = [row for row in csv.DictReader(f) if row.get(text_column)]
+    random.Random(seed).shuffle(rows)
+    rows = rows[:n]
+
+    texts = [row[text_column] for row in rows]
+    sentiments = [_label_id(row.get(sentiment_column), SENTIMENT_IDS) for row in rows] if sentiment_column else None
+    sarcasms = [_label_id(row.get(sarcasm_column), SARCASM_IDS) for row in rows] if sarcasm_column else None
+    return texts, sentiments, sarcasms
+
+
+def _timed_run(tokenizer, model, texts: List[str], batch_size: int):
+    sentiment, sarcasm = [], []
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        s, c = _run_model(tokenizer, model, texts[start:start + batch_size])
+        sentiment.append(s)
+        sarcasm.append(c)
+    return torch.cat(sentiment), torch.cat(sarcasm), time.perf_counter() - started
+
+
+def _accuracy(preds, labels):
+    pairs = [(p, l) for p, l in zip(preds, labels) if l is not None]
+    return round(sum(p == l for p, l in pairs) / len(pairs), 4) if pairs else None
+
+
+def evaluate(texts, sentiment_labels=None, sarcasm_labels=None, thresholds=DEFAULT_THRESHOLDS, batch_size=16):
+    small_tokenizer, small_model = load_small_model()
+    small_sent, small_sarc, small_secs = _timed_run(small_tokenizer, small_model, texts, batch_size)
+    del small_model
+
+    tokenizer, model = load_and_initialize_model()
+    large_sent, large_sarc, large_secs = _timed_run(tokenizer, model, texts, batch_size)
+
+    n = len(texts)
+    small_ms, large_ms = 1000 * small_secs / n, 1000 * large_secs / n
+    confidence = cascade_confidence(small_sent, small_sarc)
+    large_labels = list(zip(large_sent.argmax(1).tolist(), large_sarc.argmax(1).tolist()))
+    small_labels = list(zip(small_sent.argmax(1).tolist(), small_sarc.argmax(1).tolist()))
+
+    def scores(labels):
+        report = {"agreement_with_large": round(sum(a == b for a, b in zip(labels, large_labels)) / n, 4)}
+        if sentiment_labels:
+            report["sentiment_accuracy"] = _accuracy([l[0] for l in labels], sentiment_labels)
+        if sarcasm_labels:
+            report["sarcasm_accuracy"] = _accuracy([l[1] for l in labels], sarcasm_labels)
+        return report
+
+    sweep = []
+    for threshold in thresholds:
+        escalate = (confidence < threshold).tolist()
+        labels = [large if esc else small for esc, small, large in zip(escalate, small_labels, large_labels)]
+        rate = sum(escalate) / n
+        sweep.append({
+            "threshold": threshold,
+            "escalation_rate": round(rate, 4),
+            "est_ms_per_item": round(small_ms + rate * large_ms, 2),
+            **scores(labels),
+        })
+
+    return {
+        "samples": n,
+        "small_ms_per_item": round(small_ms, 2),
+        "large_ms_per_item": round(large_ms, 2),
+        "small_only": scores(small_labels),
+        "large_only": scores(large_labels),
+        "sweep": sweep,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cascade agreement and escalation rate.")
+    parser.add_argument("--csv", default=SAMPLE_CSV)
+    parser.add_argument("--text-column", default="user_input")
+    parser.add_argument("--sentiment-column", default=None)
+    parser.add_argument("--sarcasm-column", default=None)
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--thresholds", default=",".join(str(t) for t in DEFAULT_THRESHOLDS))
+    args = parser.parse_args(argv)
+
+    texts, sentiments, sarcasms = load_labeled_sample(
+        args.csv, args.text_column, args.sentiment_column, args.sarcasm_column, args.samples
+    )
+    thresholds = [float(t) for t in args.thresholds.split(",") if t.strip()]
+    report = evaluate(texts, sentiments, sarcasms, thresholds, args.batch_size)
+
+    print(f"\n📊 Cascade evaluation on {report['samples']} texts")
+    print(f"  small: {report['small_ms_per_item']} ms/item  {report['small_only']}")
+    print(f"  large: {report['large_ms_per_item']} ms/item  {report['large_only']}")
+    print(f"\n  (current CASCADE_CONFIDENCE_THRESHOLD = {CASCADE_CONFIDENCE_THRESHOLD})")
+    for row in report["sweep"]:
+        print("  " + "  ".join(f"{key}={value}" for key, value in row.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
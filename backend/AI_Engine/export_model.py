@@ -0,0 +1,164 @@
+"""
+Export and validate the CPU inference backends for RobertaMultiTaskClassifier.
+
+    python -m AI_Engine.export_model export [--quantize]
+    python -m AI_Engine.export_model validate --backend int8 --samples 300
+
+`validate` runs the fp32 model and the candidate backend on a held-out sample
+of journal-like texts and reports label agreement and per-item latency.
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+from typing import List
+
+import torch
+
+from AI_Engine.model_loader import (
+    MAX_LEN, ONNX_MODEL_PATH, DEVICE, INFERENCE_BACKENDS,
+    load_tokenizer, load_fp32_model, load_and_initialize_model
+)
+
+SAMPLE_CSV = os.path.join(os.path.dirname(__file__), "..", "DataEngine", "data", "reflecto_dataset.csv")
+
+
+def export_onnx(onnx_path: str = ONNX_MODEL_PATH, quantize: bool = False, opset: int = 17):
+    """Exports the fp32 model to ONNX with dynamic batch/sequence axes."""
+    tokenizer = load_tokenizer()
+    model = load_fp32_model(tokenizer).to("cpu")
+
+    dummy = tokenizer(["Exporting Reflecto sentiment model."], return_tensors="pt")
+    os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+
+    print(f"📦 Exporting ONNX graph to {onnx_path} ...")
+    torch.onnx.export(
+        model,
+        (dummy["input_ids"], dummy["attention_mask"]),
+        onnx_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["sentiment_logits", "sarcasm_logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "sentiment_logits": {0: "batch"},
+            "sarcasm_logits": {0: "batch"},
+        },
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+
+    if quantize:
+        # Weight-only INT8 quantization of the exported graph
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        fp32_path = onnx_path + ".fp32"
+        os.replace(onnx_path, fp32_path)
+        quantize_dynamic(fp32_path, onnx_path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+        print("✅ Quantized ONNX graph to INT8 weights.")
+
+    print(f"✅ Saved ONNX model at {onnx_path}")
+    return onnx_path
+
+
+def load_sample_texts(path: str = SAMPLE_CSV, column: str = "user_input", n: int = 300, seed: int = 13) -> List[str]:
+    """Reads a reproducible random sample of texts from a CSV column."""
+    with open(path, encoding="utf-8") as f:
+        texts = [row[column] for row in csv.DictReader(f) if row.get(column)]
+    random.Random(seed).shuffle(texts)
+    return texts[:n]
+
+
+def predict_labels(tokenizer, model, texts: List[str], batch_size: int = 16):
+    """Returns (sentiment_ids, sarcasm_ids, seconds) for the given texts."""
+    sentiments, sarcasms = [], []
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        encoding = tokenizer(
+            texts[start:start + batch_size],
+            max_length=MAX_LEN,
+            padding="longest",
+            truncation=True,
+            return_tensors="pt",
+        )
+        with torch.no_grad():
+            sentiment_logits, sarcasm_logits = model(
+                input_ids=encoding["input_ids"].to(DEVICE),
+                attention_mask=encoding["attention_mask"].to(DEVICE),
+            )
+        sentiments.extend(torch.argmax(sentiment_logits, dim=1).tolist())
+        sarcasms.extend(torch.argmax(sarcasm_logits, dim=1).tolist())
+    return sentiments, sarcasms, time.perf_counter() - started
+
+
+def validate_backend(backend: str, texts: List[str], batch_size: int = 16) -> dict:
+    """Compares a backend's labels and latency against the fp32 reference model."""
+    tokenizer = load_tokenizer()
+    reference = load_fp32_model(tokenizer)
+    ref_sent, ref_sarc, ref_secs = predict_labels(tokenizer, reference, texts, batch_size)
+    del reference
+
+    _, candidate = load_and_initialize_model(backend)
+    cand_sent, cand_sarc, cand_secs = predict_labels(tokenizer, candidate, texts, batch_size)
+
+    n = len(texts)
+    sentiment_agree = sum(a == b for a, b in zip(ref_sent, cand_sent)) / n
+    sarcasm_agree = sum(a == b for a, b in zip(ref_sarc, cand_sarc)) / n
+    both_agree = sum(
+        a == b and c == d for a, b, c, d in zip(ref_sent, cand_sent, ref_sarc, cand_sarc)
+    ) / n
+
+    return {
+        "backend": backend,
+        "samples": n,
+        "sentiment_agreement": round(sentiment_agree, 4),
+        "sarcasm_agreement": round(sarcasm_agree, 4),
+        "label_agreement": round(both_agree, 4),
+        "fp32_ms_per_item": round(1000 * ref_secs / n, 2),
+        "backend_ms_per_item": round(1000 * cand_secs / n, 2),
+        "speedup": round(ref_secs / cand_secs, 2) if cand_secs else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and validate sentiment inference backends.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = sub.add_parser("export", help="Export the fp32 model to ONNX")
+    export_cmd.add_argument("--output", default=ONNX_MODEL_PATH)
+    export_cmd.add_argument("--quantize", action="store_true", help="Also quantize ONNX weights to INT8")
+
+    validate_cmd = sub.add_parser("validate", help="Check label agreement against the fp32 model")
+    validate_cmd.add_argument("--backend", choices=INFERENCE_BACKENDS, required=True)
+    validate_cmd.add_argument("--csv", default=SAMPLE_CSV)
+    validate_cmd.add_argument("--column", default="user_input")
+    validate_cmd.add_argument("--samples", type=int, default=300)
+    validate_cmd.add_argument("--batch-size", type=int, default=16)
+    validate_cmd.add_argument("--min-agreement", type=float, default=0.97)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_onnx(args.output, quantize=args.quantize)
+        return 0
+
+    texts = load_sample_texts(args.csv, args.column, args.samples)
+    report = validate_backend(args.backend, texts, args.batch_size)
+
+    print("\n📊 Backend validation")
+    for key, value in report.items():
+        print(f"  {key}: {value}")
+
+    if report["label_agreement"] < args.min_agreement:
+        print(f"❌ Label agreement below {args.min_agreement}")
+        return 1
+    print("✅ Backend agrees with the fp32 model.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
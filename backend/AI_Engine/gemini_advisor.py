@@ -1,9 +1,15 @@
+import asyncio
 import os
+import hashlib
 import json
 import re
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+from AI_Engine.llm_client import gemini_llm
+from AI_Engine.prompt_budget import count_tokens, fit_journal, token_usage, usage_from_response
+from AI_Engine.semantic_cache import SemanticCache
+
 # Load environment variables
 load_dotenv()
 
@@ -12,32 +18,15 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 genai.configure(api_key=GEMINI_API_KEY)
 
 DEBUG = True  # Set to False in production to suppress debug logs
+ADVICE_DEBUG = False  # Prints raw Gemini output for advice calls
 
-def generate_dynamic_advice(journal_text: str, sentiment_data: dict):
-    import re, json
-    import google.generativeai as genai
-
-    DEBUG = False
-
-    # Extract sentiment and sarcasm safely
-    sentiment = sentiment_data.get("sentiment", "neutral")
-    sarcasm = sentiment_data.get("sarcasm", "not sarcastic")
+ADVICE_MODEL_NAME = "gemini-2.5-flash"
 
-    # Interpret emotional tone
-    if sarcasm == "sarcastic":
-        if sentiment == "positive":
-            true_tone = "hidden frustration or emotional conflict behind a playful tone"
-        elif sentiment == "neutral":
-            true_tone = "quiet dissatisfaction masked with dry humor or detachment"
-        elif sentiment == "negative":
-            true_tone = "emotional pain or disappointment hidden behind sarcasm"
-        else:
-            true_tone = "mixed emotions expressed indirectly through sarcasm"
-    else:
-        true_tone = f"a genuinely {sentiment} emotional state"
+# Bump when the tone mapping or response handling changes in a way that should
+# invalidate cached advice (template edits are picked up automatically).
+ADVICE_PROMPT_REVISION = "1"
 
-    # Refined Gemini prompt
-    prompt = f"""
+ADVICE_PROMPT_TEMPLATE = """
     You are Reflecto — a calm, kind, and emotionally aware companion.
     You are not a therapist or coach. You respond like a real friend who listens deeply and speaks simply.
 
@@ -83,28 +72,197 @@ def generate_dynamic_advice(journal_text: str, sentiment_data: dict):
     }}
     """
 
+# Identifies the prompt + model used for advice (part of the analysis cache key)
+PROMPT_VERSION = hashlib.sha256(
+    f"{ADVICE_MODEL_NAME}|{ADVICE_PROMPT_REVISION}|{ADVICE_PROMPT_TEMPLATE}".encode("utf-8")
+).hexdigest()[:16]
+
+# --- Shared client + concurrency limits ---
+# One GenerativeModel is reused for every call; async callers are limited to
+# GEMINI_MAX_CONCURRENCY in-flight requests and each call (including retries)
+# must finish within GEMINI_TIMEOUT_S.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "30"))
+
+_advice_model = None
+_advice_semaphore = None
+
+# Retries, hedging, breaker and rate limit shared with the chat LLM (see llm_client.py)
+advice_llm = gemini_llm("advice")
+
+# Near-paraphrase journal entries with the same sentiment/sarcasm reading reuse advice
+advice_semantic_cache = SemanticCache("advice")
+
+
+def get_advice_model():
+    """Returns the shared Gemini model used for advice generation."""
+    global _advice_model
+    if _advice_model is None:
+        _advice_model = genai.GenerativeModel(ADVICE_MODEL_NAME)
+    return _advice_model
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _advice_semaphore
+    if _advice_semaphore is None:
+        _advice_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+    return _advice_semaphore
+
+
+def build_advice_prompt(journal_text: str, sentiment_data: dict) -> str:
+    # Extract sentiment and sarcasm safely
+    sentiment = sentiment_data.get("sentiment", "neutral")
+    sarcasm = sentiment_data.get("sarcasm", "not sarcastic")
+
+    # Interpret emotional tone
+    if sarcasm == "sarcastic":
+        if sentiment == "positive":
+            true_tone = "hidden frustration or emotional conflict behind a playful tone"
+        elif sentiment == "neutral":
+            true_tone = "quiet dissatisfaction masked with dry humor or detachment"
+        elif sentiment == "negative":
+            true_tone = "emotional pain or disappointment hidden behind sarcasm"
+        else:
+            true_tone = "mixed emotions expressed indirectly through sarcasm"
+    else:
+        true_tone = f"a genuinely {sentiment} emotional state"
+
+    # Refined Gemini prompt
+    return ADVICE_PROMPT_TEMPLATE.format(
+        journal_text=journal_text,
+        sentiment=sentiment,
+        sarcasm=sarcasm,
+        true_tone=true_tone,
+    )
+
+
+def _advice_labels(sentiment_data: dict) -> tuple:
+    return (
+        PROMPT_VERSION,
+        sentiment_data.get("sentiment", "neutral"),
+        sentiment_data.get("sarcasm", "not sarcastic"),
+    )
+
+
+def _budgeted_prompt(journal_text: str, sentiment_data: dict):
+    """Builds the advice prompt with the journal text capped to its token budget."""
+    journal_text, sections = fit_journal(journal_text)
+    prompt = build_advice_prompt(journal_text, sentiment_data)
+    sections["instructions"] = count_tokens(prompt) - sections["journal"]
+    return prompt, sections
+
+
+def _record_usage(sections: dict, response):
+    if response is None:
+        return
+    input_tokens, output_tokens = usage_from_response(response)
+    token_usage.record(
+        "advice",
+        sections,
+        output_tokens if output_tokens is not None else count_tokens(_raw_text(response)),
+        input_tokens=input_tokens,
+        measured=input_tokens is not None,
+    )
+
+
+def _raw_text(response) -> str:
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
-        text = response.text.strip()
+        return response.text if response is not None else "No response"
+    except Exception:
+        return "No response"
+
 
-        if DEBUG:
-            print("Gemini Raw Output:")
-            print(text)
+def _parse_advice(response) -> dict:
+    text = response.text.strip()
 
-        # Clean possible code block wrappers
-        clean_text = re.sub(r"```json|```", "", text).strip()
-        return json.loads(clean_text)
+    if ADVICE_DEBUG:
+        print("Gemini Raw Output:")
+        print(text)
 
+    # Clean possible code block wrappers
+    clean_text = re.sub(r"```json|```", "", text).strip()
+    return json.loads(clean_text)
+
+
+# Cheap canned advice served while Gemini is failing or the breaker is open.
+# Results carrying "error" are never cached and are retried by the enrichment queue.
+FALLBACK_ADVICE = {
+    "emotional_summary": "Thanks for writing this down — putting feelings into words takes effort.",
+    "reflection": "We couldn't put together a personal reflection right now. "
+                  "Please try again in a little while.",
+    "suggestions": [
+        "Take a few slow breaths before moving on.",
+        "Reread what you wrote and notice one thing you'd like to remember.",
+        "Check back later for a fuller reflection on this entry.",
+    ],
+}
+
+
+def _advice_unavailable(error: Exception, response) -> dict:
+    if ADVICE_DEBUG:
+        print("⚠️ Gemini parsing failed:", error)
+        print("Raw response:", _raw_text(response))
+
+    return {
+        "error": "AI advice unavailable",
+        "raw_output": _raw_text(response),
+        **FALLBACK_ADVICE,
+    }
+
+
+def generate_dynamic_advice(journal_text: str, sentiment_data: dict):
+    labels = _advice_labels(sentiment_data)
+    vector = advice_semantic_cache.embed(journal_text)
+    cached = advice_semantic_cache.get(journal_text, labels, vector) if vector is not None else None
+    if cached is not None:
+        return cached
+
+    prompt, sections = _budgeted_prompt(journal_text, sentiment_data)
+    response = None
+    try:
+        response = advice_llm.call(
+            lambda timeout: get_advice_model().generate_content(prompt, request_options={"timeout": timeout}),
+            deadline_s=GEMINI_TIMEOUT_S,
+        )
+        _record_usage(sections, response)
+        advice = _parse_advice(response)
     except Exception as e:
-        if DEBUG:
-            print("⚠️ Gemini parsing failed:", e)
-            print("Raw response:", response.text if 'response' in locals() else 'No response')
-
-        return {
-            "error": "AI advice unavailable",
-            "raw_output": response.text if 'response' in locals() else 'No response'
-        }
+        return _advice_unavailable(e, response)
+
+    if vector is not None:
+        advice_semantic_cache.put(journal_text, advice, labels, vector)
+    return advice
+
+
+async def generate_dynamic_advice_async(journal_text: str, sentiment_data: dict, timeout: float = GEMINI_TIMEOUT_S):
+    """Non-blocking variant for async routes: awaits the Gemini call under the shared concurrency limit."""
+    labels = _advice_labels(sentiment_data)
+    vector = await asyncio.to_thread(advice_semantic_cache.embed, journal_text)
+    cached = advice_semantic_cache.get(journal_text, labels, vector) if vector is not None else None
+    if cached is not None:
+        return cached
+
+    prompt, sections = _budgeted_prompt(journal_text, sentiment_data)
+
+    async def attempt():
+        # Held per request, so backoff sleeps and hedge waits do not occupy a slot
+        async with _get_semaphore():
+            return await get_advice_model().generate_content_async(prompt)
+
+    response = None
+    try:
+        response = await advice_llm.call_async(
+            lambda attempt_timeout: asyncio.wait_for(attempt(), timeout=attempt_timeout),
+            deadline_s=timeout,
+        )
+        _record_usage(sections, response)
+        advice = _parse_advice(response)
+    except Exception as e:  # includes asyncio.TimeoutError
+        return _advice_unavailable(e, response)
+
+    if vector is not None:
+        advice_semantic_cache.put(journal_text, advice, labels, vector)
+    return advice
 
 
 
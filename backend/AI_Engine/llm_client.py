@@ -0,0 +1,362 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from AI_Engine.batching import percentile
+
+# --- Shared Gemini call policy ---
+# Token bucket sized to the provider quota (requests per minute, plus burst)
+LLM_RATE_PER_MIN = float(os.getenv("LLM_RATE_PER_MIN", "60"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+# Retries inside the caller's deadline, with full-jitter exponential backoff
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "4"))
+# Hedging: send one duplicate request when the first is slower than the recent p95
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Circuit breaker: open after N consecutive failures, probe again after a cool-down
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the provider while the circuit breaker is open."""
+
+
+class RateLimitedError(RuntimeError):
+    """Raised when no rate-limit token frees up before the call's deadline."""
+
+
+class TokenBucket:
+    """Client-side rate limiter: `rate_per_s` tokens refill continuously up to `burst`."""
+
+    def __init__(self, rate_per_s: float, burst: int):
+        self.rate_per_s = max(rate_per_s, 1e-6)
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Takes a token (possibly going negative) and returns how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_per_s)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate_per_s
+
+    def _release(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    def try_acquire(self) -> bool:
+        if self._reserve() > 0:
+            self._release()
+            return False
+        return True
+
+    def acquire(self, deadline: float):
+        delay = self._reserve()
+        if time.monotonic() + delay > deadline:
+            self._release()
+            raise RateLimitedError("LLM rate limit: no capacity before the deadline")
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, deadline: float):
+        delay = self._reserve()
+        if time.monotonic() + delay > deadline:
+            self._release()
+            raise RateLimitedError("LLM rate limit: no capacity before the deadline")
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. While open, calls fail fast; after `reset_s`
+    a single probe is let through and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_s: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_s = reset_s
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_s else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_s:
+                return False
+            # One probe at a time; a probe that never reported back (cancelled) expires
+            if self._probe_started is not None and now - self._probe_started < self.reset_s:
+                return False
+            self._probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_started is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probe_started = None
+
+
+class ResilientLLM:
+    """
+    Deadline-aware wrapper around one kind of LLM call.
+
+    `call`/`call_async` take a function of the per-attempt timeout (seconds
+    left before the deadline) that performs a single provider request. Failed
+    attempts are retried with jittered backoff while the deadline allows; when
+    hedging is on and enough latencies were seen, a duplicate request is sent
+    once the first exceeds the recent p95 and the first to succeed wins. The
+    rate limiter and breaker are shared between instances that hit the same
+    provider quota.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limiter: TokenBucket,
+        breaker: CircuitBreaker,
+        max_attempts: int = LLM_MAX_ATTEMPTS,
+        hedge: bool = LLM_HEDGE,
+    ):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_attempts = max(1, max_attempts)
+        self.hedge = hedge
+        self._latencies = deque(maxlen=500)
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._counters = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0,
+            "hedges": 0, "hedge_wins": 0, "short_circuited": 0, "rate_limited": 0,
+        }
+
+    # --- bookkeeping ---
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def _hedge_delay(self) -> Optional[float]:
+        with self._lock:
+            if not self.hedge or len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            values = sorted(self._latencies)
+        return percentile(values, 0.95)
+
+    def _succeeded(self, started: float):
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+            self._counters["successes"] += 1
+        self.breaker.record_success()
+
+    def _failed(self, error: Exception):
+        self._count("rate_limited" if isinstance(error, RateLimitedError) else "failures")
+        if not isinstance(error, RateLimitedError):
+            self.breaker.record_failure()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * (2 ** (attempt - 1))))
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix=f"llm-{self.name}")
+        return self._pool
+
+    def _admit(self):
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError(f"{self.name}: provider circuit open, failing fast")
+
+    # --- sync ---
+    def call(self, fn: Callable[[float], Any], deadline_s: float) -> Any:
+        """Runs fn(timeout) with retries/hedging inside `deadline_s`; raises on final failure."""
+        self._admit()
+        deadline = time.monotonic() + deadline_s
+        last_error: Exception = TimeoutError(f"{self.name}: deadline exceeded")
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.limiter.acquire(deadline)
+                return self._attempt(fn, deadline)
+            except Exception as e:
+                last_error = e
+                self._failed(e)
+                if isinstance(e, RateLimitedError):
+                    break
+            pause = self._backoff(attempt)
+            if attempt == self.max_attempts or time.monotonic() + pause >= deadline:
+                break
+            self._count("retries")
+            time.sleep(pause)
+        raise last_error
+
+    def _attempt(self, fn: Callable[[float], Any], deadline: float) -> Any:
+        started = time.monotonic()
+        pool = self._executor()
+        futures = [pool.submit(fn, deadline - started)]
+
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is not None:
+            done, _ = wait(futures, timeout=min(hedge_delay, deadline - started))
+            if not done and time.monotonic() < deadline and self.limiter.try_acquire():
+                self._count("hedges")
+                futures.append(pool.submit(fn, deadline - time.monotonic()))
+
+        # Threads cannot be cancelled; a losing or timed-out request just finishes unobserved
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"{self.name}: deadline exceeded")
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._count("hedge_wins")
+                    self._succeeded(started)
+                    return future.result()
+            if not pending:
+                raise next(iter(done)).exception()
+        raise TimeoutError(f"{self.name}: deadline exceeded")
+
+    # --- async ---
+    async def call_async(self, fn: Callable[[float], Awaitable[Any]], deadline_s: float) -> Any:
+        """Async variant of call(); fn(timeout) must return an awaitable for one request."""
+        self._admit()
+        deadline = time.monotonic() + deadline_s
+        last_error: Exception = TimeoutError(f"{self.name}: deadline exceeded")
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self.limiter.acquire_async(deadline)
+                return await self._attempt_async(fn, deadline)
+            except Exception as e:
+                last_error = e
+                self._failed(e)
+                if isinstance(e, RateLimitedError):
+                    break
+            pause = self._backoff(attempt)
+            if attempt == self.max_attempts or time.monotonic() + pause >= deadline:
+                break
+            self._count("retries")
+            await asyncio.sleep(pause)
+        raise last_error
+
+    async def _attempt_async(self, fn: Callable[[float], Awaitable[Any]], deadline: float) -> Any:
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(fn(deadline - started))]
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=min(hedge_delay, deadline - started))
+                if not done and time.monotonic() < deadline and self.limiter.try_acquire():
+                    self._count("hedges")
+                    tasks.append(asyncio.ensure_future(fn(deadline - time.monotonic())))
+
+            pending = list(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError(f"{self.name}: deadline exceeded")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._count("hedge_wins")
+                        self._succeeded(started)
+                        return task.result()
+                if not pending:
+                    raise next(iter(done)).exception()
+            raise asyncio.TimeoutError(f"{self.name}: deadline exceeded")
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def stream_async(
+        self, factory: Callable[[], AsyncIterator[Any]], deadline_s: float
+    ) -> AsyncIterator[Any]:
+        """
+        Streams chunks from factory(). Failures before the first chunk are
+        retried like call_async; once output has reached the caller an error
+        propagates (a restart would duplicate text). Not hedged.
+        """
+        self._admit()
+        deadline = time.monotonic() + deadline_s
+
+        for attempt in range(1, self.max_attempts + 1):
+            started = time.monotonic()
+            emitted = False
+            try:
+                await self.limiter.acquire_async(deadline)
+                stream = factory().__aiter__()
+                first = await asyncio.wait_for(stream.__anext__(), timeout=max(0.0, deadline - started))
+                emitted = True
+                yield first
+                async for chunk in stream:
+                    yield chunk
+                self._succeeded(started)
+                return
+            except StopAsyncIteration:
+                self._succeeded(started)
+                return
+            except Exception as e:
+                self._failed(e)
+                pause = self._backoff(attempt)
+                if (emitted or isinstance(e, RateLimitedError) or attempt == self.max_attempts
+                        or time.monotonic() + pause >= deadline):
+                    raise
+            self._count("retries")
+            await asyncio.sleep(pause)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            latencies_ms = sorted(latency * 1000.0 for latency in self._latencies)
+        return {
+            **counters,
+            "breaker": self.breaker.state,
+            "latency_ms": {"p50": percentile(latencies_ms, 0.50), "p95": percentile(latencies_ms, 0.95)},
+            "hedging": self.hedge,
+        }
+
+
+# One quota and one health state for everything that calls Gemini
+gemini_rate_limiter = TokenBucket(LLM_RATE_PER_MIN / 60.0, LLM_BURST)
+gemini_breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_S)
+
+
+def gemini_llm(name: str, **kwargs) -> ResilientLLM:
+    """Returns a call policy for one Gemini call site, sharing the quota and breaker."""
+    return ResilientLLM(name, gemini_rate_limiter, gemini_breaker, **kwargs)
@@ -1,3 +1,4 @@
+import torch
 from torch import nn
 from transformers import RobertaModel  # if needed elsewhere
 
@@ -19,3 +20,31 @@ class RobertaMultiTaskClassifier(nn.Module):
         sentiment_logits = self.sentiment_classifier(pooled_output)
         sarcasm_logits = self.sarcasm_classifier(pooled_output)
         return sentiment_logits, sarcasm_logits
+
+
+class OnnxMultiTaskClassifier:
+    """
+    Drop-in replacement for RobertaMultiTaskClassifier backed by an exported
+    ONNX graph. Takes and returns torch tensors so callers don't need to change.
+    """
+    def __init__(self, onnx_path, num_threads=None):
+        import onnxruntime as ort  # optional dependency, only needed for the "onnx" backend
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, attention_mask):
+        sentiment_logits, sarcasm_logits = self.session.run(
+            ["sentiment_logits", "sarcasm_logits"],
+            {
+                "input_ids": input_ids.cpu().numpy(),
+                "attention_mask": attention_mask.cpu().numpy(),
+            },
+        )
+        return torch.from_numpy(sentiment_logits), torch.from_numpy(sarcasm_logits)
@@ -1,7 +1,9 @@
-import torch
-from transformers import RobertaTokenizer, RobertaModel
-from .model_classes import RobertaMultiTaskClassifier
 import os
+import threading
+import time
+import torch
+from transformers import AutoModel, AutoTokenizer, RobertaConfig, RobertaTokenizerFast, RobertaModel
+from .model_classes import RobertaMultiTaskClassifier, OnnxMultiTaskClassifier
 
 # --- Configuration (Centralized Constants) ---
 MODEL_NAME = 'roberta-large'
@@ -9,43 +11,310 @@ NEW_TOKENS = ['[POS]', '[NEU]', '[NEG]']
 N_SENTIMENT_CLASSES = 3
 N_SARCASM_CLASSES = 2
 MAX_LEN = 128
+# Dynamic padding: inputs are grouped into length buckets of this many tokens
+# and each group is padded only to its longest item (rounded up to PAD_TO_MULTIPLE_OF)
+LENGTH_BUCKET_SIZE = int(os.getenv("SENTIMENT_LENGTH_BUCKET_SIZE", "32"))
+PAD_TO_MULTIPLE_OF = 8
 # Paths are relative to the project root (../..)
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "model_weights", "best_roberta_large_cueing_final.bin")
+# Exported graph used by the "onnx" backend (written by AI_Engine/export_model.py)
+ONNX_MODEL_PATH = os.getenv(
+    "SENTIMENT_ONNX_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "model_weights", "roberta_multitask.onnx")
+)
+# Inference backend: "torch" (eager fp32), "int8" (dynamic quantization) or "onnx" (ONNX Runtime)
+INFERENCE_BACKENDS = ("torch", "int8", "onnx")
+INFERENCE_BACKEND = os.getenv("SENTIMENT_BACKEND", "torch").lower()
+# Confidence-gated cascade: a compact distilled model answers first and
+# roberta-large only runs when its softmax confidence is below the threshold
+CASCADE_ENABLED = os.getenv("SENTIMENT_CASCADE", "0").lower() in {"1", "true", "yes"}
+CASCADE_SMALL_MODEL_NAME = os.getenv("CASCADE_SMALL_MODEL_NAME", "distilroberta-base")
+CASCADE_SMALL_MODEL_PATH = os.getenv(
+    "CASCADE_SMALL_MODEL_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "model_weights", "distilroberta_cueing_final.bin")
+)
+CASCADE_CONFIDENCE_THRESHOLD = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", "0.9"))
+# Multi-worker deployments: how weights are shared between worker processes
+# - "mmap":    weights are memory-mapped from MODEL_PATH, so workers share the page cache (default)
+# - "preload": the gunicorn master loads the model before forking (copy-on-write, see gunicorn.conf.py)
+# - "none":    every worker keeps a private copy (previous behaviour)
+MODEL_SHARE_MODE = os.getenv("MODEL_SHARE_MODE", "mmap").lower()
+# Intra-op threads per process; 0 = derive from CPU count / WEB_CONCURRENCY
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+# How long a request waits for a model that is still loading before getting a 503
+MODEL_READY_TIMEOUT_S = float(os.getenv("MODEL_READY_TIMEOUT_S", "5"))
+# After a failed load, the next request re-attempts it once this backoff has
+# passed (doubling per consecutive failure, capped at MODEL_RETRY_MAX_S)
+MODEL_RETRY_BASE_S = float(os.getenv("MODEL_RETRY_BASE_S", "30"))
+MODEL_RETRY_MAX_S = float(os.getenv("MODEL_RETRY_MAX_S", "600"))
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 # Reverse mappings
 REVERSE_SENTIMENT = {0: 'positive', 1: 'neutral', 2: 'negative'}
 REVERSE_SARCASM = {0: 'not sarcastic', 1: 'sarcastic'}
 
-def load_and_initialize_model():
-    """Loads the tokenizer and model with pretrained weights."""
+def model_version(backend: str = None) -> str:
+    """
+    Cheap fingerprint of the weights a backend serves (file size + mtime), used
+    to invalidate cached analyses when the weights change. Does not load the model.
+    """
+    backend = (backend or INFERENCE_BACKEND).lower()
+    path = ONNX_MODEL_PATH if backend == "onnx" else MODEL_PATH
     try:
-        # Load tokenizer
-        tokenizer = RobertaTokenizer.from_pretrained(MODEL_NAME)
-        tokenizer.add_tokens(NEW_TOKENS)
+        stat = os.stat(path)
+        fingerprint = f"{stat.st_size}-{stat.st_mtime_ns}"
+    except OSError:
+        fingerprint = "missing"
+    version = f"{MODEL_NAME}|{backend}|{os.path.basename(path)}|{fingerprint}"
+
+    if CASCADE_ENABLED:
+        try:
+            stat = os.stat(CASCADE_SMALL_MODEL_PATH)
+            small = f"{stat.st_size}-{stat.st_mtime_ns}"
+        except OSError:
+            small = "missing"
+        version += f"|cascade:{CASCADE_SMALL_MODEL_NAME}|{small}|{CASCADE_CONFIDENCE_THRESHOLD}"
+    return version
+
+
+def load_tokenizer():
+    """Loads the fast tokenizer with the cueing tokens added."""
+    tokenizer = RobertaTokenizerFast.from_pretrained(MODEL_NAME)
+    tokenizer.add_tokens(NEW_TOKENS)
+    return tokenizer
+
 
+def configure_threads(workers: int = None) -> int:
+    """
+    Sets this process's torch thread count so N workers don't oversubscribe the
+    cores (TORCH_NUM_THREADS, else CPU count divided by the worker count).
+    """
+    threads = TORCH_NUM_THREADS
+    if threads <= 0:
+        workers = workers or int(os.getenv("WEB_CONCURRENCY", "1"))
+        threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Can only be set before the first parallel op
+    return threads
+
+
+def load_fp32_model(tokenizer, mmap: bool = None):
+    """
+    Builds the eager fp32 multitask model and loads the trained weights.
+    With mmap (MODEL_SHARE_MODE=mmap, CPU only) the fine-tuned tensors stay
+    backed by the weights file, so every worker process shares one copy.
+    """
+    if mmap is None:
+        mmap = MODEL_SHARE_MODE == "mmap"
+    mmap = mmap and DEVICE.type == "cpu"
+
+    if mmap:
+        # The fine-tuned state dict overwrites every encoder weight, so only the
+        # architecture is needed here (no download/copy of the pretrained weights)
+        config = RobertaConfig.from_pretrained(MODEL_NAME, vocab_size=len(tokenizer))
+        roberta_model = RobertaModel(config)
+    else:
         # Load base RoBERTa model
         roberta_model = RobertaModel.from_pretrained(MODEL_NAME)
         roberta_model.resize_token_embeddings(len(tokenizer))  # Resize token embeddings for new tokens
 
-        # Initialize the multitask model with our custom head
-        model = RobertaMultiTaskClassifier(
-            roberta_model=roberta_model,
-            n_sentiment_classes=N_SENTIMENT_CLASSES,
-            n_sarcasm_classes=N_SARCASM_CLASSES
-        )
+    # Initialize the multitask model with our custom head
+    model = RobertaMultiTaskClassifier(
+        roberta_model=roberta_model,
+        n_sentiment_classes=N_SENTIMENT_CLASSES,
+        n_sarcasm_classes=N_SARCASM_CLASSES
+    )
 
-        # Load trained weights
+    # Load trained weights
+    if mmap:
+        state_dict = torch.load(MODEL_PATH, map_location="cpu", mmap=True, weights_only=True)
+        model.load_state_dict(state_dict, assign=True)  # keep the file-backed tensors
+    else:
         model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
-        model.to(DEVICE)
-        model.eval()  # Set to evaluation mode
+    model.to(DEVICE)
+    model.eval()  # Set to evaluation mode
+    return model
+
+
+def load_small_model():
+    """Loads the compact distilled multitask model used as the first cascade tier."""
+    tokenizer = AutoTokenizer.from_pretrained(CASCADE_SMALL_MODEL_NAME, use_fast=True)
+    tokenizer.add_tokens(NEW_TOKENS)
+
+    base_model = AutoModel.from_pretrained(CASCADE_SMALL_MODEL_NAME)
+    base_model.resize_token_embeddings(len(tokenizer))
+
+    model = RobertaMultiTaskClassifier(
+        roberta_model=base_model,
+        n_sentiment_classes=N_SENTIMENT_CLASSES,
+        n_sarcasm_classes=N_SARCASM_CLASSES
+    )
+    mmap = MODEL_SHARE_MODE == "mmap" and DEVICE.type == "cpu"
+    model.load_state_dict(
+        torch.load(CASCADE_SMALL_MODEL_PATH, map_location="cpu" if mmap else DEVICE, mmap=mmap),
+        assign=mmap
+    )
+    model.to(DEVICE)
+    model.eval()
+    return tokenizer, model
+
+
+def load_and_initialize_model(backend: str = None):
+    """
+    Loads the tokenizer and the model for the selected inference backend:
+    - "torch": eager fp32 PyTorch (default)
+    - "int8":  PyTorch dynamic INT8 quantization of the Linear layers (CPU only)
+    - "onnx":  exported ONNX graph run by ONNX Runtime (see AI_Engine/export_model.py)
+    """
+    backend = (backend or INFERENCE_BACKEND).lower()
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {INFERENCE_BACKENDS}")
+
+    tokenizer = load_tokenizer()
+
+    if backend == "onnx":
+        model = OnnxMultiTaskClassifier(ONNX_MODEL_PATH, num_threads=torch.get_num_threads())
+    else:
+        model = load_fp32_model(tokenizer)
+        if backend == "int8":
+            if DEVICE.type != "cpu":
+                print("⚠️ INT8 dynamic quantization is CPU-only, keeping the fp32 model.")
+            else:
+                model = torch.ao.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+
+    print(f"✅ Model and tokenizer loaded successfully (backend: {backend}).")
+    return tokenizer, model
+
+
+# --- Deferred loading ---
+# The model is loaded on a background thread after the server starts (see
+# start_background_load), followed by a warm-up forward pass. Callers use
+# wait_for_model / get_model instead of module-level globals.
 
-        print("✅ Model and tokenizer loaded successfully.")
-        return tokenizer, model
+class ModelNotReadyError(RuntimeError):
+    """Raised when the model is still loading or failed to load (re-attempted after a backoff). Safe to retry."""
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_tokenizer = None
+_model = None
+_small = None  # (tokenizer, model) of the cascade's first tier, when enabled
+_ready = threading.Event()
+_state_lock = threading.Lock()
+_loader_thread = None
+_retry_at = 0.0  # time.monotonic() after which a failed load is re-attempted
+_state = {
+    "status": "not_loaded",  # not_loaded | loading | ready | failed
+    "backend": INFERENCE_BACKEND,
+    "cascade": CASCADE_ENABLED,
+    "share_mode": MODEL_SHARE_MODE,
+    "error": None,
+    "failures": 0,  # consecutive failed loads
+    "load_seconds": None,
+    "warmup_seconds": None,
+}
+
+
+def _warm_up(tokenizer, model):
+    """Runs one forward pass so the first real request doesn't pay for lazy init."""
+    encoding = tokenizer(["Warming up the Reflecto sentiment model."], return_tensors="pt")
+    with torch.no_grad():
+        model(
+            input_ids=encoding["input_ids"].to(DEVICE),
+            attention_mask=encoding["attention_mask"].to(DEVICE)
+        )
+
+
+def _load_in_background():
+    global _tokenizer, _model, _small, _retry_at
+    try:
+        started = time.perf_counter()
+        tokenizer, model = load_and_initialize_model()
+        small = load_small_model() if CASCADE_ENABLED else None
+        loaded = time.perf_counter()
+        _warm_up(tokenizer, model)
+        if small is not None:
+            _warm_up(*small)
+
+        with _state_lock:
+            _tokenizer, _model, _small = tokenizer, model, small
+            _state.update(
+                status="ready",
+                failures=0,
+                load_seconds=round(loaded - started, 2),
+                warmup_seconds=round(time.perf_counter() - loaded, 2),
+            )
+        _ready.set()
+        print(f"🔥 Model warmed up and ready ({_state['load_seconds']}s load, {_state['warmup_seconds']}s warm-up).")
 
     except Exception as e:
-        print(f"❌ Error during model loading: {e}")
-        return None, None
+        with _state_lock:
+            failures = _state["failures"] + 1
+            backoff = min(MODEL_RETRY_MAX_S, MODEL_RETRY_BASE_S * 2 ** (failures - 1))
+            _retry_at = time.monotonic() + backoff
+            _state.update(status="failed", error=str(e), failures=failures)
+        print(f"❌ Error during model loading (retrying after {backoff:.0f}s): {e}")
+
+
+def start_background_load():
+    """Starts loading the model on a daemon thread (no-op if loading or ready)."""
+    global _loader_thread
+    with _state_lock:
+        if _state["status"] in ("loading", "ready"):
+            return
+        _state.update(status="loading", error=None)
+        _loader_thread = threading.Thread(target=_load_in_background, name="model-loader", daemon=True)
+        _loader_thread.start()
+
+
+def load_model_blocking():
+    """Loads and warms up the model on the calling thread (used by the preload mode)."""
+    with _state_lock:
+        if _state["status"] in ("loading", "ready"):
+            return
+        _state.update(status="loading", error=None)
+    _load_in_background()
+
+
+def model_status() -> dict:
+    """Snapshot of the model loading state for the readiness endpoint."""
+    with _state_lock:
+        return {**_state, "ready": _ready.is_set()}
+
+
+def wait_for_model(timeout: float = None):
+    """
+    Returns (tokenizer, model), waiting up to `timeout` seconds for a load in progress.
+    Raises ModelNotReadyError if the model is not ready in time or failed to load.
+    """
+    if not _ready.is_set():
+        if _state["status"] == "not_loaded" or (_state["status"] == "failed" and time.monotonic() >= _retry_at):
+            start_background_load()
+        if _state["status"] != "failed":
+            _ready.wait(MODEL_READY_TIMEOUT_S if timeout is None else timeout)
+
+    if not _ready.is_set():
+        if _state["status"] == "failed":
+            retry_after = max(1, int(_retry_at - time.monotonic() + 0.999))
+            raise ModelNotReadyError(f"AI model failed to load: {_state['error']}", retry_after=retry_after)
+        raise ModelNotReadyError("AI model is still loading, please retry shortly.")
+    return _tokenizer, _model
+
+
+def get_model():
+    """Returns (tokenizer, model) without waiting."""
+    return wait_for_model(timeout=0)
+
 
-# Global variables for single loading instance
-global_tokenizer, global_model = load_and_initialize_model()
+def get_small_model():
+    """Returns the cascade's (tokenizer, model), or None when the cascade is disabled."""
+    wait_for_model(timeout=0)
+    return _small
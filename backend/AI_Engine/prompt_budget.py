@@ -0,0 +1,149 @@
+import math
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# --- Prompt budgets (approximate tokens) ---
+ADVICE_JOURNAL_MAX_TOKENS = int(os.getenv("ADVICE_JOURNAL_MAX_TOKENS", "1500"))
+CHAT_PROMPT_BUDGET = int(os.getenv("CHAT_PROMPT_BUDGET", "4000"))  # system + context + history + input
+CHAT_INPUT_MAX_TOKENS = int(os.getenv("CHAT_INPUT_MAX_TOKENS", "800"))
+CHAT_CONTEXT_MAX_TOKENS = int(os.getenv("CHAT_CONTEXT_MAX_TOKENS", "1200"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))  # rolling conversation summary
+
+# Gemini averages roughly four characters of English per token. Counting
+# locally keeps the budget check free; reported usage prefers the real
+# counts from the API response when it includes them.
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = " […] "
+
+
+def count_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts `text` to about `max_tokens`, keeping the beginning and the end
+    (journal entries and questions often carry the point in the last lines).
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max(0, max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARKER))
+    head = text[: keep * 2 // 3].rstrip()
+    tail = text[len(text) - (keep - keep * 2 // 3):].lstrip()
+    return f"{head}{TRUNCATION_MARKER}{tail}"
+
+
+def _content(message: Any) -> str:
+    return getattr(message, "content", message) or ""
+
+
+def fit_journal(journal_text: str, max_tokens: int = ADVICE_JOURNAL_MAX_TOKENS) -> Tuple[str, Dict[str, int]]:
+    """Returns the journal text to inline in the advice prompt, plus a per-section report."""
+    original = count_tokens(journal_text)
+    text = truncate_to_tokens(journal_text, max_tokens)
+    return text, {"journal": count_tokens(text), "journal_truncated": original - count_tokens(text)}
+
+
+def fit_chat(
+    system_tokens: int,
+    question: str,
+    history: Sequence[Any],
+    docs: List[str],
+    budget: int = CHAT_PROMPT_BUDGET,
+) -> Tuple[str, List[Any], str, Dict[str, int]]:
+    """
+    Fits one chat turn into `budget` tokens. The system prompt is fixed; the
+    user input and retrieved context are capped first (lowest-ranked documents
+    are dropped before the top one is truncated), then the most recent history
+    messages are kept while they fit. Returns (question, history, context, report).
+    """
+    question = truncate_to_tokens(question, CHAT_INPUT_MAX_TOKENS)
+    input_tokens = count_tokens(question)
+
+    context_limit = max(0, min(CHAT_CONTEXT_MAX_TOKENS, budget - system_tokens - input_tokens))
+    kept_docs, context_tokens = [], 0
+    for doc in docs:
+        tokens = count_tokens(doc)
+        if context_tokens + tokens > context_limit:
+            if not kept_docs and context_limit:
+                kept_docs.append(truncate_to_tokens(doc, context_limit))
+                context_tokens = count_tokens(kept_docs[0])
+            break
+        kept_docs.append(doc)
+        context_tokens += tokens
+    context = "\n\n".join(kept_docs)
+
+    history_limit = max(0, budget - system_tokens - input_tokens - context_tokens)
+    kept_history, history_tokens = [], 0
+    for message in reversed(list(history)):
+        tokens = count_tokens(_content(message))
+        if history_tokens + tokens > history_limit:
+            break
+        kept_history.append(message)
+        history_tokens += tokens
+    kept_history.reverse()
+
+    report = {
+        "system": system_tokens,
+        "input": input_tokens,
+        "context": context_tokens,
+        "history": history_tokens,
+        "docs_dropped": len(docs) - len(kept_docs),
+        "history_dropped": len(history) - len(kept_history),
+    }
+    return question, kept_history, context, report
+
+
+def usage_from_response(response: Any) -> Tuple[Optional[int], Optional[int]]:
+    """(input, output) token counts reported by Gemini / LangChain, when present."""
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None:
+        return None, None
+    if isinstance(meta, dict):  # LangChain AIMessage / AIMessageChunk
+        return meta.get("input_tokens"), meta.get("output_tokens")
+    return getattr(meta, "prompt_token_count", None), getattr(meta, "candidates_token_count", None)
+
+
+class TokenUsage:
+    """Per-endpoint prompt/answer token accounting (cumulative since start)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, Any]] = {}
+
+    def record(
+        self,
+        endpoint: str,
+        sections: Dict[str, int],
+        output_tokens: int,
+        input_tokens: Optional[int] = None,
+        measured: bool = False,
+    ):
+        estimated_input = sum(v for k, v in sections.items() if not k.endswith(("_truncated", "_dropped")))
+        truncated = any(v for k, v in sections.items() if k.endswith(("_truncated", "_dropped")))
+        with self._lock:
+            entry = self._endpoints.setdefault(endpoint, {
+                "calls": 0, "measured_calls": 0, "truncated_calls": 0,
+                "input_tokens": 0, "output_tokens": 0, "sections": {},
+            })
+            entry["calls"] += 1
+            entry["measured_calls"] += measured
+            entry["truncated_calls"] += truncated
+            entry["input_tokens"] += input_tokens if input_tokens is not None else estimated_input
+            entry["output_tokens"] += output_tokens
+            for name, tokens in sections.items():
+                entry["sections"][name] = entry["sections"].get(name, 0) + tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = {name: {**e, "sections": dict(e["sections"])} for name, e in self._endpoints.items()}
+        for entry in snapshot.values():
+            calls = entry["calls"] or 1
+            entry["avg_input_tokens"] = round(entry["input_tokens"] / calls, 1)
+            entry["avg_output_tokens"] = round(entry["output_tokens"] / calls, 1)
+            entry["avg_sections"] = {k: round(v / calls, 1) for k, v in entry.pop("sections").items()}
+        return snapshot
+
+
+token_usage = TokenUsage()
@@ -1,15 +1,41 @@
-import csv, os
-from typing import List
+import argparse, csv, hashlib, json, os, random, time
+from typing import Dict, Iterator, List, Optional, Tuple
 from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from AI_Engine.batching import percentile
+from AI_Engine.rag.compact_store import write_compact_docs
 
 DATA_CSV = os.path.join(os.path.dirname(__file__), "../../DataEngine/data/reflecto_dataset.csv")
 DB_FAISS_PATH = os.path.join(os.path.dirname(__file__), "../../vectorstore/db_faiss")
 EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
-def load_csv_as_documents(path: str) -> List[Document]:
-    docs = []
+# --- Index configuration ---
+# flat: exact search | ivf: inverted lists, FAISS_NPROBE lists probed per query
+# hnsw: graph search, FAISS_HNSW_EF_SEARCH candidates | ivfpq: ivf + product-quantized vectors
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))  # 0 = about 4 * sqrt(n), capped by training size
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "8"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "16"))  # sub-quantizers; must divide the embedding size (384)
+FAISS_PQ_BITS = int(os.getenv("FAISS_PQ_BITS", "8"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+# Row key -> content hash of everything indexed, used by incremental builds
+MANIFEST_FILE = "manifest.json"
+
+def row_key(row: Dict) -> str:
+    """Stable identity of a dataset row (its id, or a hash of the user input)."""
+    return row.get("id") or "sha1:" + hashlib.sha1(row["user_input"].encode("utf-8")).hexdigest()[:16]
+
+def doc_hash(doc: Document) -> str:
+    payload = doc.page_content + "\n" + json.dumps(doc.metadata, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+def iter_csv_documents(path: str) -> Iterator[Tuple[str, Document]]:
+    """Streams (row key, Document) pairs from the dataset CSV without loading it all."""
     with open(path, encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
@@ -24,20 +50,246 @@ def load_csv_as_documents(path: str) -> List[Document]:
                 "is_crisis": is_crisis,
                 "full_response": row["bot_response"]
             }
-            docs.append(Document(page_content=page_content, metadata=metadata))
+            yield row_key(row), Document(page_content=page_content, metadata=metadata)
+
+def load_csv_as_documents(path: str) -> List[Document]:
+    docs = [doc for _, doc in iter_csv_documents(path)]
     print(f"Loaded {len(docs)} docs from CSV")
     return docs
 
-def build_index():
-    docs = load_csv_as_documents(DATA_CSV)
-    if not docs:
+def load_manifest(store_path: str = DB_FAISS_PATH) -> Optional[Dict]:
+    try:
+        with open(os.path.join(store_path, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_manifest(rows: Dict[str, str], index_type: str, store_path: str = DB_FAISS_PATH):
+    manifest = {
+        "embed_model": EMBED_MODEL,
+        "index_type": index_type,
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "rows": rows,
+    }
+    tmp_path = os.path.join(store_path, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(store_path, MANIFEST_FILE))
+
+def embed_texts(embeddings, texts: List[str]):
+    import numpy as np
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        vectors.extend(embeddings.embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+    return np.asarray(vectors, dtype="float32")
+
+def make_index(index_type: str, vectors, nlist: int = FAISS_NLIST):
+    """Builds (and trains, if needed) a raw FAISS index of the given type over `vectors`."""
+    import faiss
+    n, dim = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M)
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    elif index_type in ("ivf", "ivfpq"):
+        # k-means wants ~39 training points per list
+        nlist = nlist or int(4 * n ** 0.5)
+        nlist = max(1, min(nlist, n // 39))
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, FAISS_PQ_M, FAISS_PQ_BITS)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown FAISS index type '{index_type}' (expected one of {', '.join(INDEX_TYPES)})")
+    index.add(vectors)
+    apply_search_params(index)
+    return index
+
+def apply_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Applies query-time knobs (IVF nprobe, HNSW efSearch); also used after loading a saved index."""
+    import faiss
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe or FAISS_NPROBE
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search or FAISS_HNSW_EF_SEARCH
+    return index
+
+def evaluate_index(index, exact, queries, k: int = 5) -> Dict:
+    """recall@k against the exact index, plus single-query and batched search latency."""
+    import numpy as np
+    _, truth = exact.search(queries, k)
+    latencies = []
+    found = []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        found.append(ids[0])
+    start = time.perf_counter()
+    index.search(queries, k)
+    batch_ms = (time.perf_counter() - start) * 1000.0
+
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    latencies.sort()
+    return {
+        "recall_at_k": round(float(recall), 4),
+        "k": k,
+        "p50_ms": percentile(latencies, 0.50, 4),
+        "p95_ms": percentile(latencies, 0.95, 4),
+        "batch_qps": round(len(queries) / (batch_ms / 1000.0), 1) if batch_ms else 0.0,
+        "ntotal": index.ntotal,
+    }
+
+def sample_queries(embeddings, path: str = DATA_CSV, n: int = 500, seed: int = 13):
+    """Embeds a sample of raw user_input texts, which is what live chat queries look like."""
+    with open(path, encoding="utf-8") as f:
+        inputs = [row["user_input"] for row in csv.DictReader(f) if row.get("user_input")]
+    random.Random(seed).shuffle(inputs)
+    return embed_texts(embeddings, inputs[:n])
+
+def _unique_rows(path: str) -> Iterator[Tuple[str, Document]]:
+    seen = set()
+    for key, doc in iter_csv_documents(path):
+        if key in seen:
+            print(f"⚠️ Skipping duplicate row id {key}")
+            continue
+        seen.add(key)
+        yield key, doc
+
+def build_index(index_type: str = FAISS_INDEX_TYPE, evaluate: bool = True, eval_queries: int = 500,
+                k: int = 5, compare: bool = False):
+    rows = list(_unique_rows(DATA_CSV))
+    if not rows:
         raise RuntimeError("No documents loaded from CSV.")
+    print(f"Loaded {len(rows)} docs from CSV")
+    keys = [key for key, _ in rows]
+    docs = [doc for _, doc in rows]
     embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+    print("Embedding documents...")
+    texts = [doc.page_content for doc in docs]
+    vectors = embed_texts(embeddings, texts)
+
     print("Building FAISS index...")
-    db = FAISS.from_documents(docs, embeddings)
+    db = FAISS.from_embeddings(
+        list(zip(texts, vectors.tolist())), embeddings, metadatas=[doc.metadata for doc in docs], ids=keys
+    )
+    exact = db.index
+    if index_type != "flat":
+        print(f"Building '{index_type}' index over {len(texts)} vectors...")
+        db.index = make_index(index_type, vectors)
+
+    if evaluate or compare:
+        queries = sample_queries(embeddings, n=eval_queries)
+        candidates = INDEX_TYPES if compare else (index_type,)
+        for kind in candidates:
+            index = db.index if kind == index_type else make_index(kind, vectors)
+            report = evaluate_index(index, exact, queries, k)
+            marker = " ← saved" if kind == index_type else ""
+            print(f"  {kind:6s} recall@{k}={report['recall_at_k']:.4f}  p50={report['p50_ms']}ms  "
+                  f"p95={report['p95_ms']}ms  batch={report['batch_qps']} q/s{marker}")
+
     os.makedirs(os.path.dirname(DB_FAISS_PATH), exist_ok=True)
     db.save_local(DB_FAISS_PATH)
-    print(f"✅ Saved FAISS at {DB_FAISS_PATH}")
+    write_compact_docs(db, DB_FAISS_PATH)
+    save_manifest({key: doc_hash(doc) for key, doc in rows}, index_type)
+    print(f"✅ Saved FAISS ({index_type}) at {DB_FAISS_PATH}")
+
+def update_index(batch_size: int = EMBED_BATCH_SIZE):
+    """
+    Incremental build: streams the CSV, embeds only new or changed rows in
+    batches of `batch_size`, deletes removed rows and saves the updated store.
+    Only the current batch is held besides the store itself, so a one-line
+    dataset change costs one embedding call. Works on flat stores (FAISS
+    ANN indexes do not renumber on delete); other types need a full build.
+    """
+    manifest = load_manifest()
+    embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+    if manifest is None or manifest.get("embed_model") != EMBED_MODEL:
+        print("No usable manifest, building a fresh flat store incrementally")
+        rows, db = {}, None
+    elif manifest.get("index_type") != "flat":
+        raise RuntimeError(
+            f"Incremental updates need a flat store (found '{manifest.get('index_type')}'); "
+            "run a full build instead"
+        )
+    else:
+        rows = manifest["rows"]
+        db = FAISS.load_local(DB_FAISS_PATH, embeddings, allow_dangerous_deserialization=True)
+
+    counts = {"unchanged": 0, "added": 0, "changed": 0, "removed": 0}
+    seen = set()
+    pending: List[Tuple[str, str, Document]] = []
+
+    def flush():
+        nonlocal db
+        texts = [doc.page_content for _, _, doc in pending]
+        vectors = embeddings.embed_documents(texts)
+        ids = [key for key, _, _ in pending]
+        metadatas = [doc.metadata for _, _, doc in pending]
+        if db is None:
+            db = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=ids)
+        else:
+            stale = [key for key in ids if key in rows]
+            if stale:
+                db.delete(stale)
+            db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        for key, digest, _ in pending:
+            counts["changed" if key in rows else "added"] += 1
+            rows[key] = digest
+        pending.clear()
+
+    for key, doc in iter_csv_documents(DATA_CSV):
+        if key in seen:
+            continue
+        seen.add(key)
+        digest = doc_hash(doc)
+        if rows.get(key) == digest:
+            counts["unchanged"] += 1
+            continue
+        pending.append((key, digest, doc))
+        if len(pending) >= batch_size:
+            flush()
+    if pending:
+        flush()
+
+    removed = [key for key in rows if key not in seen]
+    if removed and db is not None:
+        db.delete(removed)
+        for key in removed:
+            rows.pop(key)
+        counts["removed"] = len(removed)
+    if db is None:
+        raise RuntimeError("No documents loaded from CSV.")
+
+    if counts["added"] or counts["changed"] or counts["removed"] or manifest is None:
+        os.makedirs(os.path.dirname(DB_FAISS_PATH), exist_ok=True)
+        db.save_local(DB_FAISS_PATH)
+        write_compact_docs(db, DB_FAISS_PATH)
+        save_manifest(rows, "flat")
+    print(f"✅ Incremental update: {counts['added']} added, {counts['changed']} changed, "
+          f"{counts['removed']} removed, {counts['unchanged']} unchanged ({db.index.ntotal} vectors)")
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the Reflecto FAISS vector store")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=FAISS_INDEX_TYPE)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--eval-queries", type=int, default=500)
+    parser.add_argument("--no-eval", action="store_true", help="skip the recall/latency report")
+    parser.add_argument("--compare", action="store_true", help="report every index type, save --index-type")
+    parser.add_argument("--incremental", action="store_true",
+                        help="embed only new/changed rows and update the saved flat store in place")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    if args.incremental:
+        update_index(args.batch_size)
+        return
+    build_index(args.index_type, evaluate=not args.no_eval, eval_queries=args.eval_queries,
+                k=args.k, compare=args.compare)
 
 if __name__ == "__main__":
-    build_index()
+    main()
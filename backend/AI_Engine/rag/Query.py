@@ -1,30 +1,38 @@
+import asyncio
 import os
-from typing import Dict, List, Any
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import AsyncIterator, Dict, List, Any, Optional
 
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnableParallel
 
-from AI_Engine.rag.crisis_detection import detect_crisis
+from AI_Engine.batching import percentile
+from AI_Engine.llm_client import gemini_llm
+from AI_Engine.prompt_budget import (
+    CHAT_SUMMARY_MAX_TOKENS, count_tokens, fit_chat, token_usage, truncate_to_tokens, usage_from_response
+)
+from AI_Engine.rag.compact_store import load_vector_store
+from AI_Engine.rag.crisis_detection import crisis_engine, detect_crisis
+from AI_Engine.rag.retrieval import RetrievalService
+from AI_Engine.semantic_cache import SemanticCache, get_embeddings
+from core.resources import resource
 
-# Natural-language tools
-import nltk
-from nltk.tokenize import word_tokenize
+# Natural-language tools. The word tokenizer is rule-based, so unlike
+# word_tokenize it needs no punkt download (messages here are <= 15 chars).
+from nltk.tokenize import NLTKWordTokenizer
 
-# Download tokenizer resources
-nltk.download('punkt', quiet=True)
+_word_tokenizer = NLTKWordTokenizer()
 
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv("GEMINI_API_KEY")
 if not API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in the .env file")
+    print("⚠️ GEMINI_API_KEY not found in the .env file; chat answers will fail until it is set")
 
-EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 DB_FAISS_PATH = os.path.join(os.path.dirname(__file__), "../../vectorstore/db_faiss")
 
 # Crisis response template
@@ -35,22 +43,54 @@ CRISIS_RESPONSE = (
     "You are not alone, please seek help now."
 )
 
-# Initialize LLM (Gemini)
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    google_api_key=API_KEY,
-    temperature=0.3,
-    max_tokens=1024,
+# Served when Gemini keeps failing or the shared circuit breaker is open
+CHAT_UNAVAILABLE_RESPONSE = (
+    "I'm having a little trouble finding my words right now. "
+    "Could you give me a moment and send that again?"
 )
 
-# Load embeddings and vectorstore
-embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
-vectorstore = FAISS.load_local(
-    DB_FAISS_PATH,
-    embeddings,
-    allow_dangerous_deserialization=True,
-)
-retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
+# Deadline for a chat answer, retries included (for streams: until the first token)
+CHAT_TIMEOUT_S = float(os.getenv("CHAT_TIMEOUT_S", "30"))
+
+def _build_chat_model():
+    # Initialize LLM (Gemini). Retries are handled by chat_llm, not by the client.
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    if not API_KEY:
+        raise ValueError("GEMINI_API_KEY not found in the .env file")
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        google_api_key=API_KEY,
+        temperature=0.3,
+        max_tokens=1024,
+        max_retries=1,
+        timeout=CHAT_TIMEOUT_S,
+    )
+
+
+def _build_retrieval_service():
+    # Embeddings (shared with the semantic cache) and the compact vectorstore
+    # (memory-mapped index + lazily read documents, no pickle)
+    from AI_Engine.rag.BuildStore import apply_search_params
+    embeddings = get_embeddings()
+    vectorstore = load_vector_store(DB_FAISS_PATH, embeddings)
+    apply_search_params(vectorstore.index)  # FAISS_NPROBE / FAISS_HNSW_EF_SEARCH for ivf/hnsw stores
+    # Cached query embeddings + cross-request batched search (used by the chat paths)
+    return RetrievalService(vectorstore, embeddings, k=5)
+
+
+# Built on first use or by the startup warmer (see core/resources.py), never at import
+chat_model = resource("chat_model", _build_chat_model)
+retrieval_resource = resource("retrieval", _build_retrieval_service)
+chat_llm = gemini_llm("chat")
+
+
+def get_retrieval_service() -> RetrievalService:
+    return retrieval_resource.get()
+
+# Answers to first messages of a session are reused for near-paraphrases.
+# Follow-up turns depend on the history, so they are never cached.
+CHAT_CACHE_LABELS = ("chat", "gemini-2.5-flash")
+chat_semantic_cache = SemanticCache("chat")
 
 # Dynamic short acknowledgment list for detecting quick user confirmations
 SHORT_ACK_WORDS = {
@@ -70,7 +110,7 @@ def is_short_acknowledgment(text: str) -> bool:
     if len(text) > 15 or len(text.split()) > 3:
         return False
 
-    tokens = word_tokenize(text)
+    tokens = _word_tokenizer.tokenize(text)
     return all(word in SHORT_ACK_WORDS for word in tokens)
 
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
@@ -104,6 +144,7 @@ qa_prompt = ChatPromptTemplate.from_messages([
         "- Keep each message short, clear, and heartfelt.\n"
         "- Let your words breathe — use spacing like in a real conversation.\n\n"
         "Context (if available):\n{context}"
+        "{summary}"
     ),
     MessagesPlaceholder("chat_history"),
     ("user", "{input}")
@@ -112,28 +153,93 @@ qa_prompt = ChatPromptTemplate.from_messages([
 
 
 
-# Create language chain
-langchain_rag = RunnableParallel(
-    {
-        "context": lambda x: "\n\n".join(
-            [doc.page_content for doc in retriever.invoke(x["input"])]
-        ),
-        "chat_history": lambda x: x.get("chat_history", []),
-        "input": lambda x: x["input"],
-    }
-).assign(answer=qa_prompt | llm)
+# Create language chain (on first use, with the chat model); used for streaming,
+# while query_chain binds a per-attempt timeout to the model
+rag_chain_resource = resource("rag_chain", lambda: qa_prompt | chat_model.get())
+
+# Fixed cost of the system prompt (everything except the {context} and {summary} slots)
+SYSTEM_PROMPT_TOKENS = count_tokens(
+    qa_prompt.messages[0].prompt.template.replace("{context}", "").replace("{summary}", "")
+)
+SUMMARY_HEADER = "\n\nEarlier in this conversation (summary):\n"
+
+
+def prefetch_retrieval(question: str) -> Optional[Future]:
+    """
+    Starts retrieval for `question` so it overlaps with the caller's own work
+    (e.g. the history fetch). Returns None when the turn will be answered
+    without retrieval (pattern-stage crisis or a short acknowledgment).
+    """
+    if detect_crisis(question) or is_short_acknowledgment(question):
+        return None
+    try:
+        return get_retrieval_service().submit(question)
+    except Exception as e:
+        # Surfaced by query_chain / stream_chain when they wait for the result
+        failed = Future()
+        failed.set_exception(e)
+        return failed
+
+
+async def aprefetch_retrieval(question: str) -> Optional[Future]:
+    """
+    prefetch_retrieval() for async callers. Until the retrieval store is
+    built (or while the startup warmer is building it) the call runs on a
+    worker thread, so the event loop never waits for MiniLM + FAISS.
+    """
+    if retrieval_resource.ready:
+        return prefetch_retrieval(question)
+    return await asyncio.to_thread(prefetch_retrieval, question)
+
+
+def _prepare_turn(question: str, chat_history: List[Any], retrieved: List[Any], summary: str = ""):
+    """
+    Fits question, retrieved context and history into the chat prompt budget.
+    A rolling summary of older turns (if any) is part of the fixed system cost.
+    """
+    docs = [doc.page_content for doc in retrieved]
+    summary = SUMMARY_HEADER + truncate_to_tokens(summary, CHAT_SUMMARY_MAX_TOKENS) if summary else ""
+    summary_tokens = count_tokens(summary)
+    question, chat_history, context, sections = fit_chat(
+        SYSTEM_PROMPT_TOKENS + summary_tokens, question, chat_history, docs
+    )
+    sections["system"] = SYSTEM_PROMPT_TOKENS
+    sections["summary"] = summary_tokens
+    inputs = {"context": context, "summary": summary, "chat_history": chat_history, "input": question}
+    return inputs, sections, len(docs) - sections["docs_dropped"]
+
+
+def _record_usage(endpoint: str, sections: Dict[str, int], answer: str, usage=(None, None)):
+    input_tokens, output_tokens = usage
+    token_usage.record(
+        endpoint,
+        sections,
+        output_tokens if output_tokens is not None else count_tokens(answer),
+        input_tokens=input_tokens,
+        measured=input_tokens is not None,
+    )
 
 
 def query_chain(
     question: str,
     chat_history: List[Any] = None,
-    verbose: bool = False
+    verbose: bool = False,
+    retrieval: Optional[Future] = None,
+    timings: Optional[Dict[str, float]] = None,
+    summary: str = "",
 ) -> Dict[str, Any]:
+    """
+    Answers one chat turn. `retrieval` is a future from prefetch_retrieval()
+    when the caller started retrieval early; otherwise it is started here.
+    If `timings` is given, the time spent waiting for retrieval and for
+    Gemini is added to it (ms). `summary` is the rolling summary of turns
+    older than `chat_history`.
+    """
     chat_history = chat_history or []
+    timings = {} if timings is None else timings
 
-    # Crisis detection check
-    is_crisis = detect_crisis(question)
-    if is_crisis:
+    # Crisis detection, stage 1 (patterns)
+    if crisis_engine.match_patterns(question) is not None:
         return {"answer": CRISIS_RESPONSE, "crisis": True}
 
     # Detect and shortcut for short acknowledgments
@@ -145,29 +251,187 @@ def query_chain(
         }
 
     try:
-        response = langchain_rag.invoke(
-            {"input": question, "chat_history": chat_history}
+        stage = time.perf_counter()
+        docs, query_vector = (retrieval or get_retrieval_service().submit(question)).result()
+        timings["retrieval_wait"] = (time.perf_counter() - stage) * 1000.0
+
+        # Crisis detection, stage 2 (exemplar similarity on the retrieval embedding)
+        if crisis_engine.check_vector(query_vector).is_crisis:
+            return {"answer": CRISIS_RESPONSE, "crisis": True}
+
+        vector = None
+        if not chat_history and not summary:
+            vector = chat_semantic_cache.from_vector(query_vector)
+            cached = chat_semantic_cache.get(question, CHAT_CACHE_LABELS, vector) if vector is not None else None
+            if cached is not None:
+                return {**cached, "crisis": False, "cached": True}
+
+        inputs, sections, num_docs = _prepare_turn(question, chat_history, docs, summary)
+        stage = time.perf_counter()
+        # Each attempt's request carries its own timeout, so an abandoned one does not run on
+        answer = chat_llm.call(
+            lambda timeout: (qa_prompt | chat_model.get().bind(timeout=timeout)).invoke(inputs),
+            deadline_s=CHAT_TIMEOUT_S,
         )
-        answer = response.get("answer", "Sorry, I couldn't process your request.")
-        context = response.get("context", [])
+        timings["llm"] = (time.perf_counter() - stage) * 1000.0
+        context = inputs["context"]
+        _record_usage("chat", sections, getattr(answer, "content", answer), usage_from_response(answer))
+
+        if vector is not None:
+            chat_semantic_cache.put(question, {
+                "answer": getattr(answer, "content", answer),
+                "num_docs": num_docs,
+                "context": context,
+            }, CHAT_CACHE_LABELS, vector)
 
         return {
             "answer": answer,
             "crisis": False,
-            "num_docs": len(context),
+            "num_docs": num_docs,
             "context": context,
         }
 
     except Exception as e:
+        print(f"[Query] Chat answer failed: {e}")
         return {
-            "answer": f"Sorry, an error occurred while handling your message. ({str(e)})",
+            "answer": CHAT_UNAVAILABLE_RESPONSE,
             "crisis": False,
             "num_docs": 0,
         }
 
 
+# --- Streaming metrics (time to first token / full answer, recent window) ---
+_stream_lock = threading.Lock()
+_stream_counts = {"streams": 0, "errors": 0}
+_recent_ttft_ms = deque(maxlen=1000)
+_recent_total_ms = deque(maxlen=1000)
+
+
+def _record_stream(ttft_ms: float, total_ms: float):
+    with _stream_lock:
+        _stream_counts["streams"] += 1
+        _recent_ttft_ms.append(ttft_ms)
+        _recent_total_ms.append(total_ms)
+
+
+def get_stream_stats() -> Dict[str, Any]:
+    """Time-to-first-token and full-answer latency for streamed chat answers."""
+    with _stream_lock:
+        counts = dict(_stream_counts)
+        ttft = sorted(_recent_ttft_ms)
+        total = sorted(_recent_total_ms)
+
+    def summary(values):
+        if not values:
+            return {"avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "avg": round(sum(values) / len(values), 3),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "max": round(values[-1], 3),
+        }
+
+    return {**counts, "ttft_ms": summary(ttft), "total_ms": summary(total)}
+
+
+async def stream_chain(
+    question: str,
+    chat_history: List[Any] = None,
+    retrieval: Optional[Future] = None,
+    timings: Optional[Dict[str, float]] = None,
+    summary: str = "",
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming variant of query_chain. Yields {"type": "token", "text"} events
+    as Gemini produces them, then one {"type": "done", "answer", "crisis",
+    "num_docs"} event with the assembled answer. Crisis replies, short
+    acknowledgments and semantic-cache hits are sent as a single token.
+    """
+    chat_history = chat_history or []
+    timings = {} if timings is None else timings
+
+    if crisis_engine.match_patterns(question) is not None:
+        yield {"type": "token", "text": CRISIS_RESPONSE}
+        yield {"type": "done", "answer": CRISIS_RESPONSE, "crisis": True, "num_docs": 0}
+        return
+
+    if is_short_acknowledgment(question):
+        answer = "You're most welcome 😊 Let me know if there's anything else I can help you with."
+        yield {"type": "token", "text": answer}
+        yield {"type": "done", "answer": answer, "crisis": False, "num_docs": 0}
+        return
+
+    started = time.perf_counter()
+    ttft_ms = None
+    parts = []
+    usage = (None, None)
+    try:
+        if retrieval is None:
+            # Built on a worker thread if needed, never on the event loop
+            service = retrieval_resource.peek() or await asyncio.to_thread(get_retrieval_service)
+            retrieval = service.submit(question)
+        docs, query_vector = await asyncio.wrap_future(retrieval)
+        timings["retrieval_wait"] = (time.perf_counter() - started) * 1000.0
+
+        if crisis_engine.check_vector(query_vector).is_crisis:
+            yield {"type": "token", "text": CRISIS_RESPONSE}
+            yield {"type": "done", "answer": CRISIS_RESPONSE, "crisis": True, "num_docs": 0}
+            return
+
+        vector = None
+        if not chat_history and not summary:
+            vector = chat_semantic_cache.from_vector(query_vector)
+            cached = chat_semantic_cache.get(question, CHAT_CACHE_LABELS, vector) if vector is not None else None
+            if cached is not None:
+                yield {"type": "token", "text": cached["answer"]}
+                yield {"type": "done", "answer": cached["answer"], "crisis": False,
+                       "num_docs": cached.get("num_docs", 0), "cached": True}
+                return
+
+        inputs, sections, num_docs = _prepare_turn(question, chat_history, docs, summary)
+        context = inputs["context"]
+
+        async for chunk in chat_llm.stream_async(
+            lambda: rag_chain_resource.get().astream(inputs), deadline_s=CHAT_TIMEOUT_S
+        ):
+            if getattr(chunk, "usage_metadata", None):
+                usage = usage_from_response(chunk)  # sent with the final chunk
+            text = getattr(chunk, "content", chunk)
+            if not text:
+                continue
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000.0
+            parts.append(text)
+            yield {"type": "token", "text": text}
+    except Exception as e:
+        print(f"[Query] Chat stream failed: {e}")
+        with _stream_lock:
+            _stream_counts["errors"] += 1
+        answer = ("\n\n" if parts else "") + CHAT_UNAVAILABLE_RESPONSE
+        yield {"type": "token", "text": answer}
+        yield {"type": "done", "answer": "".join(parts) + answer, "crisis": False, "num_docs": 0}
+        return
+
+    answer = "".join(parts)
+    total_ms = (time.perf_counter() - started) * 1000.0
+    _record_stream(ttft_ms if ttft_ms is not None else total_ms, total_ms)
+    _record_usage("chat_stream", sections, answer, usage)
+
+    if vector is not None and answer:
+        chat_semantic_cache.put(question, {
+            "answer": answer,
+            "num_docs": num_docs,
+            "context": context,
+        }, CHAT_CACHE_LABELS, vector)
+
+    yield {"type": "done", "answer": answer, "crisis": False, "num_docs": num_docs}
+
+
 def chatbot(
     question: str,
-    chat_history: List[Any] = None
+    chat_history: List[Any] = None,
+    retrieval: Optional[Future] = None,
+    timings: Optional[Dict[str, float]] = None,
+    summary: str = "",
 ) -> Dict[str, Any]:
-    return query_chain(question, chat_history)
+    return query_chain(question, chat_history, retrieval=retrieval, timings=timings, summary=summary)
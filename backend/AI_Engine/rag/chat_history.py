@@ -1,18 +1,108 @@
 # backend/AI_Engine/rag/chat_history.py
 
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+import asyncio
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
 from langchain_core.messages import HumanMessage, AIMessage
+from AI_Engine.batching import percentile
 from core.firebase import db as firestoreDB
-from .Query import chatbot
+from .Query import aprefetch_retrieval, chatbot, prefetch_retrieval, stream_chain
+from .history_writer import HistoryWriter, history_writer
+from .session_cache import CachedSession, SessionHistoryCache, session_cache
+from .summarizer import (
+    CHAT_SUMMARY_ENABLED, CHAT_SUMMARY_TRIGGER, ConversationSummarizer, conversation_summarizer, split_history
+)
+
+
+class ChatStageStats:
+    """Per-stage latency (ms) of recent chat turns, for GET /api/ai/chat/stats."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._window = window
+        self._stages: Dict[str, deque] = {}
+        self._turns = 0
+
+    def record(self, timings: Dict[str, float]):
+        with self._lock:
+            self._turns += 1
+            for stage, ms in timings.items():
+                self._stages.setdefault(stage, deque(maxlen=self._window)).append(ms)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {stage: sorted(values) for stage, values in self._stages.items()}
+            turns = self._turns
+
+        def summary(values):
+            return {
+                "avg": round(sum(values) / len(values), 3),
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "samples": len(values),
+            }
+
+        return {"turns": turns, "stages_ms": {stage: summary(values) for stage, values in stages.items()}}
+
+
+chat_stage_stats = ChatStageStats()
+
+
+def _utc_naive(timestamp: Optional[datetime]) -> datetime:
+    # Firestore returns aware UTC datetimes; messages not yet committed carry naive UTC ones
+    if timestamp is None:
+        return datetime.min
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
 
 class ChatHistoryPipeline:
-    def __init__(self, db=None):
+    def __init__(
+        self,
+        db=None,
+        writer: Optional[HistoryWriter] = None,
+        cache: Optional[SessionHistoryCache] = None,
+        summarizer: Optional[ConversationSummarizer] = None,
+    ):
         self.db = db or firestoreDB
+        # Pipelines on the default client share one writer, history cache and summarizer
+        self.writer = writer or (history_writer if db is None else HistoryWriter(db))
+        self.cache = cache or (session_cache if db is None else SessionHistoryCache())
+        self.summarizer = summarizer or (conversation_summarizer if db is None else ConversationSummarizer(db=db))
         self.collection = "users"
         self.subcollection = "chat_history"
+        self.sessions = "chat_sessions"  # per-session metadata (version stamp, rolling summary)
         self.history_limit = 14  # Max messages per chat history
 
+    def _chat_path(self, user_id: str, session_id: str) -> str:
+        return f"{self.collection}/{user_id}/{self.subcollection}_{session_id}"
+
+    def _session_path(self, user_id: str, session_id: str) -> str:
+        return f"{self.collection}/{user_id}/{self.sessions}/{session_id}"
+
+    def _session_meta(self, user_id: str, session_id: str) -> Dict[str, Any]:
+        try:
+            snapshot = self.db.document(self._session_path(user_id, session_id)).get()
+            return (snapshot.to_dict() or {}) if snapshot.exists else {}
+        except Exception as e:
+            # Without the stamp the cached history is served as is
+            print(f"[ChatHistoryPipeline] Error reading session metadata: {e}")
+            return {}
+
+    def _to_messages(self, records: List) -> List:
+        messages = []
+        for _, role, content in records:
+            if role == "user":
+                messages.append(HumanMessage(content=content))
+            elif role == "assistant":
+                messages.append(AIMessage(content=content))
+        return messages
+
     def _chat_ref(self, user_id: str, session_id: str):
         """
         Add session_id separation so each chat remains isolated.
@@ -25,8 +115,60 @@ class ChatHistoryPipeline:
 
     def retrieve_history(self, user_id: str, session_id: str) -> List:
         """
-        Retrieve history for given user and session_id
+        Retrieve history for given user and session_id (the latest
+        `history_limit` messages, without the summary).
+        """
+        messages, _, _ = self.load_session(user_id, session_id)
+        return self._to_messages(messages)
+
+    def load_session(self, user_id: str, session_id: str) -> CachedSession:
+        """
+        (id, role, content) messages plus the rolling summary for a session.
+        Served from the session cache when possible; Firestore is read only
+        on a cold miss (or when the version stamp shows another worker wrote
+        the session).
+        """
+        key = self._chat_path(user_id, session_id)
+        meta = self._session_meta(user_id, session_id) if self.cache.versioned else None
+        cached = self.cache.get(key, meta.get("version") if meta else None)
+        if cached is None:
+            return self._load_session(user_id, session_id, meta)
+        if meta:
+            # Another worker may have refreshed the summary since this entry was loaded
+            return cached[0], meta.get("summary"), meta.get("summary_through")
+        return cached
+
+    def prompt_history(self, user_id: str, session_id: str) -> Tuple[List, str]:
+        """
+        History and summary for the chat prompt: the messages the summary does
+        not cover yet (normally just the recent window) plus the summary.
+        Schedules a background summary refresh once enough messages have left
+        the recent window.
+        """
+        messages, summary, through = self.load_session(user_id, session_id)
+        if not CHAT_SUMMARY_ENABLED:
+            return self._to_messages(messages), ""
+
+        if through is not None and all(message[0] != through for message in messages):
+            # Refreshes kept failing (or lagging) until the summary boundary left
+            # the window: read everything after it so no message is skipped
+            messages = self._messages_after(user_id, session_id, through) or messages
+        history, older = split_history(messages, through)
+        if len(older) >= CHAT_SUMMARY_TRIGGER:
+            key = self._chat_path(user_id, session_id)
+            self.summarizer.refresh(
+                self._session_path(user_id, session_id), summary, older,
+                lambda updated, updated_through: self.cache.set_summary(key, updated, updated_through),
+            )
+        return self._to_messages(history), summary or ""
+
+    def _load_session(self, user_id: str, session_id: str, meta: Optional[Dict[str, Any]] = None) -> CachedSession:
         """
+        Reads the latest messages from Firestore, including messages the
+        background writer has not committed yet, and caches them together
+        with the session's summary.
+        """
+        key = self._chat_path(user_id, session_id)
         try:
             docs = (
                 self._chat_ref(user_id, session_id)
@@ -34,51 +176,157 @@ class ChatHistoryPipeline:
                 .limit(self.history_limit)
                 .stream()
             )
+            entries = self._entries(key, docs)[-self.history_limit:]
 
-            messages = []
-            for doc in list(docs)[::-1]:
-                data = doc.to_dict()
-                if data.get("role") == "user":
-                    messages.append(HumanMessage(content=data.get("content", "")))
-                elif data.get("role") == "assistant":
-                    messages.append(AIMessage(content=data.get("content", "")))
-            return messages
+            if meta is None:
+                meta = self._session_meta(user_id, session_id) if CHAT_SUMMARY_ENABLED else {}
+            summary, through = meta.get("summary"), meta.get("summary_through")
+            self.cache.load(
+                key, entries, self.history_limit, [meta.get("version")] + [entry[0] for entry in entries],
+                summary, through,
+            )
+            return entries, summary, through
         except Exception as e:
             print(f"[ChatHistoryPipeline] Error fetching history: {e}")
-            return []
+            return [], None, None
+
+    def _entries(self, key: str, docs, after: Optional[datetime] = None) -> List[Tuple[str, str, str]]:
+        """(id, role, content) of the given documents plus uncommitted messages, oldest first."""
+        records = {doc.id: {**doc.to_dict(), "id": doc.id} for doc in docs}
+        for message in self.writer.pending(key):
+            records.setdefault(message["id"], {
+                **message, "timestamp": datetime.fromisoformat(message["timestamp"])
+            })
+        ordered = sorted(records.values(), key=lambda data: _utc_naive(data.get("timestamp")))
+        if after is not None:
+            ordered = [data for data in ordered if _utc_naive(data.get("timestamp")) > _utc_naive(after)]
+        return [(data["id"], data.get("role"), data.get("content", "")) for data in ordered]
+
+    def _messages_after(self, user_id: str, session_id: str, message_id: str) -> Optional[List[Tuple[str, str, str]]]:
+        """
+        All messages after `message_id`, oldest first, read from Firestore.
+        None if that message is gone or the read fails.
+        """
+        ref = self._chat_ref(user_id, session_id)
+        try:
+            anchor = ref.document(message_id).get()
+            if not anchor.exists:
+                return None
+            docs = ref.order_by("timestamp").start_after(anchor).stream()
+            return self._entries(self._chat_path(user_id, session_id), docs, after=anchor.to_dict().get("timestamp"))
+        except Exception as e:
+            print(f"[ChatHistoryPipeline] Error fetching messages after the summary: {e}")
+            return None
+
+    def _submit(self, user_id: str, session_id: str, messages: List[dict]):
+        """Queues messages for the background writer and writes them through to the cache."""
+        key = self._chat_path(user_id, session_id)
+        self.writer.submit({
+            "path": key,
+            "session_path": self._session_path(user_id, session_id),
+            "messages": messages,
+        })
+        self.cache.append(key, [(m["id"], m["role"], m["content"]) for m in messages], messages[-1]["id"])
+
+    def _message(self, role: str, content: Any, timestamp: datetime, metadata: Optional[Dict] = None) -> dict:
+        if hasattr(content, "content"):
+            content = content.content  # Strip LLM wrapper
+        return {
+            "id": uuid.uuid4().hex,
+            "role": role,
+            "content": content,
+            "timestamp": timestamp.isoformat(),
+            "metadata": metadata or {},
+        }
 
     def store(self, user_id: str, session_id: str, role: str, content: Any, metadata: Optional[Dict] = None):
         """
         Store a single message in the session-specific chat history
+        (cached immediately, committed in the background by HistoryWriter)
         """
         try:
-            if hasattr(content, "content"):
-                content = content.content  # Strip LLM wrapper
-
-            self._chat_ref(user_id, session_id).add({
-                "role": role,
-                "content": content,
-                "timestamp": datetime.utcnow(),
-                "metadata": metadata or {}
-            })
+            self._submit(user_id, session_id, [self._message(role, content, datetime.utcnow(), metadata)])
             return True
         except Exception as e:
             print(f"[ChatHistoryPipeline] Error storing message: {e}")
             return False
 
+    def store_turn(self, user_id: str, session_id: str, query: str, answer: Any, metadata: Optional[Dict] = None):
+        """
+        Queues the user message and the answer as one batched write. The
+        answer is stamped 1 ms after the question so history keeps their order.
+        """
+        now = datetime.utcnow()
+        try:
+            self._submit(user_id, session_id, [
+                self._message("user", query, now),
+                self._message("assistant", answer, now + timedelta(milliseconds=1), metadata),
+            ])
+            return True
+        except Exception as e:
+            print(f"[ChatHistoryPipeline] Error storing turn: {e}")
+            return False
+
     def process(self, user_id: str, session_id: str, query: str) -> Dict[str, any]:
         """
-        Main function: retrieves session-specific history, runs chatbot, stores result.
+        Main function: retrieves session-specific history (recent messages plus
+        a rolling summary of older ones), runs chatbot, stores result.
+
+        The crisis pattern and short-ack checks run first (microseconds); unless
+        one of them answers the turn, retrieval (with the semantic crisis check)
+        runs in the batcher thread while history is fetched here. Both messages
+        are then queued as one write, off the response path.
         """
-        history = self.retrieve_history(user_id, session_id)
-        result = chatbot(query, history)
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+
+        retrieval = prefetch_retrieval(query)
+        history, summary = [], ""
+        if retrieval is not None:  # crisis and acknowledgment replies do not use history
+            stage = time.perf_counter()
+            history, summary = self.prompt_history(user_id, session_id)
+            timings["history"] = (time.perf_counter() - stage) * 1000.0
+
+        stage = time.perf_counter()
+        result = chatbot(query, history, retrieval, timings, summary)
+        timings["answer"] = (time.perf_counter() - stage) * 1000.0
 
         result.setdefault("num_docs", 0)
         result.setdefault("crisis", False)
 
-        self.store(user_id, session_id, "user", query)
-        self.store(
-            user_id, session_id, "assistant", result["answer"],
+        stage = time.perf_counter()
+        self.store_turn(
+            user_id, session_id, query, result["answer"],
             {"num_docs": result["num_docs"], "crisis": result.get("crisis")}
         )
+        timings["store"] = (time.perf_counter() - stage) * 1000.0
+        timings["total"] = (time.perf_counter() - started) * 1000.0
+        chat_stage_stats.record(timings)
         return result
+
+    async def process_stream(self, user_id: str, session_id: str, query: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of process(): yields the token/done events from
+        stream_chain and queues both messages once the answer is complete.
+        Nothing is stored if the client disconnects mid-stream.
+        """
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+
+        retrieval = await aprefetch_retrieval(query)
+        history, summary = [], ""
+        if retrieval is not None:
+            history, summary = await asyncio.to_thread(self.prompt_history, user_id, session_id)
+            timings["history"] = (time.perf_counter() - started) * 1000.0
+
+        async for event in stream_chain(query, history, retrieval, timings, summary):
+            if event["type"] == "token" and "first_token" not in timings:
+                timings["first_token"] = (time.perf_counter() - started) * 1000.0
+            if event["type"] == "done":
+                self.store_turn(
+                    user_id, session_id, query, event["answer"],
+                    {"num_docs": event["num_docs"], "crisis": event["crisis"]}
+                )
+                timings["total"] = (time.perf_counter() - started) * 1000.0
+                chat_stage_stats.record({f"stream_{stage}": ms for stage, ms in timings.items()})
+            yield event
@@ -0,0 +1,120 @@
+import json
+import mmap
+import os
+from typing import List, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Files next to LangChain's index.faiss in the vector store directory.
+# docs.jsonl holds one {"id", "page_content", "metadata"} line per FAISS
+# position; docs.offsets.npy holds ntotal + 1 byte offsets into it.
+INDEX_FILE = "index.faiss"
+DOCS_FILE = "docs.jsonl"
+OFFSETS_FILE = "docs.offsets.npy"
+
+
+def write_compact_docs(db, path: str):
+    """Writes the docs/offsets files for a LangChain FAISS store, in FAISS position order."""
+    offsets = [0]
+    docs_tmp = os.path.join(path, DOCS_FILE + ".tmp")
+    with open(docs_tmp, "wb") as f:
+        for position in range(db.index.ntotal):
+            doc_id = db.index_to_docstore_id[position]
+            doc = db.docstore.search(doc_id)
+            line = json.dumps(
+                {"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata},
+                ensure_ascii=False,
+            ).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+
+    offsets_tmp = os.path.join(path, OFFSETS_FILE + ".tmp.npy")
+    np.save(offsets_tmp, np.asarray(offsets, dtype=np.int64))
+    os.replace(docs_tmp, os.path.join(path, DOCS_FILE))
+    os.replace(offsets_tmp, os.path.join(path, OFFSETS_FILE))
+
+
+def has_compact_docs(path: str) -> bool:
+    return all(os.path.exists(os.path.join(path, name)) for name in (INDEX_FILE, DOCS_FILE, OFFSETS_FILE))
+
+
+def _read_index(index_path: str):
+    """
+    Memory-maps the index so vectors stay in the page cache, shared by all
+    workers: IVF inverted lists with IO_FLAG_MMAP, flat (and HNSW) vector
+    storage with the zero-copy IO_FLAG_MMAP_IFC reader (faiss >= 1.10).
+    """
+    import faiss
+    with open(index_path, "rb") as f:
+        ivf = f.read(2) == b"Iw"  # fourcc of the IndexIVF* family
+    if ivf:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    else:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+    try:
+        if flags == faiss.IO_FLAG_READ_ONLY:
+            raise RuntimeError(f"faiss {faiss.__version__} has no IO_FLAG_MMAP_IFC")
+        return faiss.read_index(index_path, flags)
+    except RuntimeError as e:
+        print(
+            f"[CompactVectorStore] ⚠️ Could not memory-map {index_path} ({e}); "
+            "reading it into memory, one copy per worker"
+        )
+        return faiss.read_index(index_path)
+
+
+class CompactVectorStore:
+    """
+    Read-only vector store over a FAISS index file plus an offset-indexed
+    JSONL document file. Nothing is unpickled: the index is memory-mapped
+    (see _read_index) and documents are decoded only when a search
+    returns their position.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index = _read_index(os.path.join(path, INDEX_FILE))
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        if len(self._offsets) - 1 != self.index.ntotal:
+            raise ValueError(
+                f"{path}: {DOCS_FILE} has {len(self._offsets) - 1} documents but the index has "
+                f"{self.index.ntotal} vectors; rebuild the store"
+            )
+        self._file = open(os.path.join(path, DOCS_FILE), "rb")
+        self._docs = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.index.ntotal else b""
+
+    def __len__(self) -> int:
+        return self.index.ntotal
+
+    def document(self, position: int) -> Document:
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = json.loads(self._docs[start:end])
+        return Document(page_content=record["page_content"], metadata=record["metadata"], id=record["id"])
+
+    def documents(self, positions: Sequence[int]) -> List[Document]:
+        """Documents for FAISS result positions, skipping -1 (fewer than k matches)."""
+        return [self.document(int(p)) for p in positions if p != -1]
+
+    def search_by_vectors(self, vectors: np.ndarray, k: int) -> List[List[Document]]:
+        _, ids = self.index.search(np.ascontiguousarray(vectors, dtype="float32"), k)
+        return [self.documents(row) for row in ids]
+
+    def similarity_search(self, query: str, embeddings, k: int = 5) -> List[Document]:
+        vector = np.asarray([embeddings.embed_query(query)], dtype="float32")
+        return self.search_by_vectors(vector, k)[0]
+
+
+def load_vector_store(path: str, embeddings=None) -> CompactVectorStore:
+    """
+    Opens the compact store at `path`. A store saved before the compact format
+    existed (index.pkl only) is converted once, which is the only time the
+    LangChain pickle is read.
+    """
+    if not has_compact_docs(path):
+        from langchain_community.vectorstores import FAISS
+        print(f"[CompactVectorStore] Converting {path} to the compact document format (one-time)")
+        db = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+        write_compact_docs(db, path)
+        del db
+    return CompactVectorStore(path)
@@ -1,13 +1,182 @@
+import os
 import re
+import threading
+import unicodedata
+from typing import Any, Dict, List, NamedTuple, Optional
 
-# 🔎 Crisis-related keywords to look for
-CRISIS_KEYWORDS = [
-    r"\bkill myself\b", r"\bsuicide\b", r"\bi want to die\b",
-    r"\bself[- ]?harm\b", r"\boverdose\b", r"\bjump off\b", 
-    r"\bhang myself\b", r"\bcut myself\b", r"\bcan.?t go on\b"
+# --- Crisis engine configuration ---
+# Stage 2 flags a message whose MiniLM embedding is at least this similar
+# (cosine) to any curated crisis exemplar.
+CRISIS_SEMANTIC_ENABLED = os.getenv("CRISIS_SEMANTIC", "1") == "1"
+CRISIS_SIMILARITY_THRESHOLD = float(os.getenv("CRISIS_SIMILARITY_THRESHOLD", "0.72"))
+
+# 🔎 Crisis-related phrases, written against normalized text (see normalize_for_crisis)
+CRISIS_PATTERNS = [
+    r"kill(?:ing)? myself", r"kms", r"suicid(?:e|al)",
+    r"end(?:ing)? (?:my life|it all)", r"take my (?:own )?life",
+    r"(?:want|wish|plan|planning|ready) to die", r"wish i (?:was|were) dead", r"better off dead",
+    r"(?:do not|no longer) want to (?:live|be alive|be here|exist|wake up)",
+    r"(?:want|wish|hope|pray)(?: \w+){0,6} (?:never|not) wake up(?! until| before| in time)",
+    r"no reason to (?:live|go on|continue|keep going)", r"not see any reason to (?:live|go on|continue|keep going)",
+    r"not worth living", r"self ?harm(?:ing)?", r"(?:harm|harming) myself",
+    r"(?:want|wanted|going|plan|planning|urge|urges|tempted) to (?:hurt|cut|harm) myself",
+    r"(?:thinking|thought) (?:about|of) (?:hurting|cutting) myself",
+    r"(?:keep|kept|been|started|stop) (?:hurting|cutting) myself",
+    r"overdos(?:e|ing)", r"jump(?:ing)? off", r"hang(?:ing)? myself",
+    r"can not (?:go on|do this anymore|keep going)", r"(?:do something|going) to end it",
+]
+
+# Curated stage-2 exemplars: indirect phrasings the patterns above do not cover
+CRISIS_EXEMPLARS = [
+    "I don't want to be here anymore.",
+    "Everyone would be better off without me.",
+    "I want to disappear forever.",
+    "I've been thinking about ending things.",
+    "I have a plan to hurt myself tonight.",
+    "I just want the pain to stop for good.",
+    "I'm saying goodbye to everyone.",
+    "There's no point in living anymore.",
+    "I can't take it anymore, I want it all to be over.",
+    "I've been giving away my things because I won't need them.",
+    "I keep thinking about how to end my pain permanently.",
+    "I wish I could go to sleep and never wake up.",
+    "Nobody would notice if I was gone.",
+    "I feel like a burden and want to stop existing.",
+    "I've stockpiled pills.",
+    "I'm standing on the edge of the bridge.",
+    "I wrote a note for my family.",
+    "Life isn't worth it and I'm done trying.",
+    "I don't see a future for myself at all, I want out.",
+    "I hurt myself again last night.",
 ]
 
+_CONTRACTIONS = [
+    (re.compile(r"\b(?:can ?'?t|cannot)\b"), "can not"),
+    (re.compile(r"\bwon ?'?t\b"), "will not"),
+    (re.compile(r"\b(do|does|did|is|are|was|were|could|would|should|have|has)n ?'?t\b"), r"\1 not"),
+    (re.compile(r"\bi ?'?m\b"), "i am"),
+    (re.compile(r"\bi ?'?ve\b"), "i have"),
+    (re.compile(r"\bi ?'?ll\b"), "i will"),
+    (re.compile(r"\bi ?'?d\b"), "i would"),
+    (re.compile(r"\bwanna\b"), "want to"),
+    (re.compile(r"\bgonna\b"), "going to"),
+]
+_QUOTES = str.maketrans({"’": "'", "‘": "'", "`": "'", "´": "'"})
+_REPEATS = re.compile(r"(\w)\1+")
+_NON_WORD = re.compile(r"[^\w']+|'")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _squeeze(text: str) -> str:
+    # "sooo" / "killl" / "kill" all become one letter per run, in text and patterns alike
+    return _REPEATS.sub(r"\1", text)
+
+
+def normalize_for_crisis(text: str) -> str:
+    """Lowercases, expands contractions, folds repeated letters and strips punctuation."""
+    text = unicodedata.normalize("NFKC", text or "").lower().translate(_QUOTES)
+    for pattern, replacement in _CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+    text = _NON_WORD.sub(" ", text)
+    return _WHITESPACE.sub(" ", _squeeze(text)).strip()
+
+
+# One compiled alternation instead of a search per pattern
+_CRISIS_RE = re.compile(r"\b(?:" + "|".join(_squeeze(p) for p in CRISIS_PATTERNS) + r")\b")
+
+
 def detect_crisis(text: str) -> bool:
-    """Returns True if the input contains known crisis phrases."""
-    text = text.lower().strip()
-    return any(re.search(pattern, text) for pattern in CRISIS_KEYWORDS)
+    """Returns True if the input contains known crisis phrases (stage 1 only, no model needed)."""
+    return _CRISIS_RE.search(normalize_for_crisis(text)) is not None
+
+
+class CrisisResult(NamedTuple):
+    is_crisis: bool
+    stage: Optional[str]  # "pattern" | "semantic" | None
+    score: float          # best exemplar similarity (0.0 when stage 2 did not run)
+    match: Optional[str]
+
+
+class CrisisEngine:
+    """
+    Two-stage crisis detector: the compiled pattern matcher first, then
+    cosine similarity of the message embedding against CRISIS_EXEMPLARS.
+    Stage 2 takes the query vector the retriever already computed, so it
+    costs one small matrix product.
+    """
+
+    def __init__(
+        self,
+        exemplars: List[str] = CRISIS_EXEMPLARS,
+        threshold: float = CRISIS_SIMILARITY_THRESHOLD,
+        semantic: bool = CRISIS_SEMANTIC_ENABLED,
+    ):
+        self.exemplars = exemplars
+        self.threshold = threshold
+        self.semantic = semantic
+        self._matrix = None
+        self._lock = threading.Lock()
+        # Counted across all callers (chat turns and semantic-cache bypass checks)
+        self._counters = {"pattern_checks": 0, "pattern_hits": 0, "semantic_checks": 0, "semantic_hits": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def _exemplar_matrix(self):
+        if self._matrix is None:
+            with self._lock:
+                if self._matrix is None:
+                    import numpy as np
+                    from AI_Engine.semantic_cache import get_embeddings
+                    vectors = np.asarray(get_embeddings().embed_documents(self.exemplars), dtype="float32")
+                    self._matrix = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return self._matrix
+
+    def match_patterns(self, text: str) -> Optional[str]:
+        """Stage 1: the matched phrase (normalized), or None."""
+        self._count("pattern_checks")
+        found = _CRISIS_RE.search(normalize_for_crisis(text))
+        if found is None:
+            return None
+        self._count("pattern_hits")
+        return found.group(0)
+
+    def similarity(self, vector) -> float:
+        import numpy as np
+        vector = np.asarray(vector, dtype="float32")
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return 0.0
+        return float(np.max(self._exemplar_matrix() @ (vector / norm)))
+
+    def check_vector(self, vector) -> CrisisResult:
+        """Stage 2 only, for callers that already ran the pattern stage."""
+        if not self.semantic or vector is None:
+            return CrisisResult(False, None, 0.0, None)
+        self._count("semantic_checks")
+        score = self.similarity(vector)
+        if score >= self.threshold:
+            self._count("semantic_hits")
+            return CrisisResult(True, "semantic", score, None)
+        return CrisisResult(False, None, score, None)
+
+    def check(self, text: str, vector=None) -> CrisisResult:
+        """
+        Runs both stages. Pass the message embedding if one was already
+        computed; otherwise stage 2 embeds the text itself.
+        """
+        match = self.match_patterns(text)
+        if match is not None:
+            return CrisisResult(True, "pattern", 0.0, match)
+        if self.semantic and vector is None:
+            from AI_Engine.semantic_cache import get_embeddings
+            vector = get_embeddings().embed_query(text)
+        return self.check_vector(vector)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "threshold": self.threshold, "semantic": self.semantic}
+
+
+crisis_engine = CrisisEngine()
@@ -0,0 +1,325 @@
+import glob
+import json
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: other workers' spools cannot be checked for a live owner
+    fcntl = None
+
+# --- Chat history write-behind configuration ---
+CHAT_WRITE_MAX_ATTEMPTS = int(os.getenv("CHAT_WRITE_MAX_ATTEMPTS", "5"))
+CHAT_WRITE_RETRY_BASE_S = float(os.getenv("CHAT_WRITE_RETRY_BASE_S", "0.5"))
+# Turns that still fail after all attempts are spooled and replayed on the
+# next start and then every CHAT_WRITE_REPLAY_S. Each worker process writes
+# its own file next to this path (chat_write_spool.<pid>.jsonl)
+CHAT_WRITE_SPOOL = os.getenv(
+    "CHAT_WRITE_SPOOL", os.path.join(os.path.dirname(__file__), "../../chat_write_spool.jsonl")
+)
+CHAT_WRITE_REPLAY_S = float(os.getenv("CHAT_WRITE_REPLAY_S", "30"))
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """
+    Write-behind committer for chat turns.
+
+    A job is one turn: {"path": <Firestore collection path>, "messages": [...]}
+    where every message carries its own document id and ISO timestamp, plus
+    an optional "session_path" document that gets the turn's version stamp
+    (its last message id). Each job is committed as a single Firestore batch,
+    so the messages and the stamp land together, and the fixed ids make
+    retries and spool replays idempotent. Until a job is committed its
+    messages are returned by `pending()` so the next turn still sees them.
+
+    Every process spools to its own file and holds an flock on it while the
+    writer runs. Spools whose lock can be taken belong to a worker that is
+    gone; they are adopted into this worker's spool and replayed here.
+    """
+
+    def __init__(
+        self,
+        db=None,
+        spool_path: str = CHAT_WRITE_SPOOL,
+        max_attempts: int = CHAT_WRITE_MAX_ATTEMPTS,
+        retry_base_s: float = CHAT_WRITE_RETRY_BASE_S,
+    ):
+        self._db = db
+        self.spool_path = spool_path
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_s = retry_base_s
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._timers: Dict[threading.Timer, dict] = {}  # retry timer -> job
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._owner_lock = None  # open lock file, flocked while the writer runs
+        self._pending: Dict[str, Dict[str, dict]] = {}  # path -> message id -> message
+        self._counters = {"submitted": 0, "committed": 0, "retried": 0, "spooled": 0, "replayed": 0, "inline": 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            from core.firebase import db
+            self._db = db
+        return self._db
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._owner_lock = self._lock_spool(self._own_spool)
+        self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._thread.start()
+        self._replay_spool(startup=True)
+        print("🧵 Chat history writer started")
+
+    def stop(self, timeout: float = 10.0):
+        """Drains the queue; jobs still waiting on a retry timer are spooled."""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        drained = not self._thread.is_alive()
+        self._thread = None
+        with self._lock:
+            timers, self._timers = list(self._timers.items()), {}
+        for timer, job in timers:
+            timer.cancel()
+            self._spool(job)
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                self._spool(item[0])
+        if self._owner_lock is not None:
+            # The next worker to start adopts whatever is left in our spool
+            spool = self._own_spool
+            if drained and os.path.exists(spool + ".replay"):
+                # Every replayed turn is committed or spooled again by now
+                os.remove(spool + ".replay")
+            if not os.path.exists(spool) and not os.path.exists(spool + ".replay"):
+                os.remove(spool + ".lock")
+            self._owner_lock.close()
+            self._owner_lock = None
+
+    def submit(self, job: dict):
+        """
+        Queues a turn for commit. Without a running writer (scripts, tests) it
+        is committed inline, once, and spooled if that fails.
+        """
+        with self._lock:
+            self._counters["submitted"] += 1
+            bucket = self._pending.setdefault(job["path"], {})
+            for message in job["messages"]:
+                bucket[message["id"]] = message
+        if self.running:
+            self._queue.put((job, 1))
+            return
+        with self._lock:
+            self._counters["inline"] += 1
+        self._attempt(job, self.max_attempts)
+
+    def pending(self, path: str) -> List[dict]:
+        """Messages submitted for `path` that are not committed yet."""
+        with self._lock:
+            return list(self._pending.get(path, {}).values())
+
+    def _commit(self, job: dict):
+        collection = self.db.collection(job["path"])
+        batch = self.db.batch()
+        for message in job["messages"]:
+            batch.set(collection.document(message["id"]), {
+                "role": message["role"],
+                "content": message["content"],
+                "timestamp": datetime.fromisoformat(message["timestamp"]),
+                "metadata": message.get("metadata") or {},
+            })
+        if job.get("session_path"):
+            last = job["messages"][-1]
+            batch.set(self.db.document(job["session_path"]), {
+                "version": last["id"],
+                "updated_at": datetime.fromisoformat(last["timestamp"]),
+            }, merge=True)
+        batch.commit()
+
+    def _attempt(self, job: dict, attempt: int):
+        try:
+            self._commit(job)
+        except Exception as e:
+            if attempt >= self.max_attempts:
+                print(f"[HistoryWriter] Commit to {job['path']} failed {attempt} times, spooling: {e}")
+                self._spool(job)
+                return
+            with self._lock:
+                self._counters["retried"] += 1
+            delay = self.retry_base_s * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+            self._retry_later(job, attempt + 1, delay)
+            return
+        with self._lock:
+            self._counters["committed"] += 1
+            bucket = self._pending.get(job["path"], {})
+            for message in job["messages"]:
+                bucket.pop(message["id"], None)
+            if not bucket:
+                self._pending.pop(job["path"], None)
+
+    def _retry_later(self, job: dict, attempt: int, delay: float):
+        def fire():
+            with self._lock:
+                self._timers.pop(timer, None)
+            self._queue.put((job, attempt))
+
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        with self._lock:
+            self._timers[timer] = job
+        timer.start()
+
+    def _run(self):
+        next_replay = time.monotonic() + CHAT_WRITE_REPLAY_S
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, next_replay - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                return
+            if item is not None:
+                self._attempt(*item)
+            if time.monotonic() >= next_replay:
+                self._replay_spool()
+                next_replay = time.monotonic() + CHAT_WRITE_REPLAY_S
+
+    @property
+    def _own_spool(self) -> str:
+        # Resolved per call: preloaded writers are created before the fork
+        root, ext = os.path.splitext(self.spool_path)
+        return f"{root}.{os.getpid()}{ext}"
+
+    @staticmethod
+    def _lock_spool(spool: str):
+        """Opens and flocks `spool`.lock; None if another live process holds it."""
+        if fcntl is None:
+            return None
+        handle = open(spool + ".lock", "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+        return handle
+
+    def _adopt_orphans(self):
+        """Moves spooled turns of workers that are gone into this worker's spool (call with _spool_lock)."""
+        own = self._own_spool
+        root, ext = os.path.splitext(self.spool_path)
+        owners = {self.spool_path}  # single shared file from earlier versions
+        for path in glob.glob(f"{glob.escape(root)}.*{ext}") + glob.glob(f"{glob.escape(root)}.*{ext}.replay"):
+            owners.add(path[:-len(".replay")] if path.endswith(".replay") else path)
+        owners.discard(own)
+
+        for spool in owners:
+            lock = None
+            if spool != self.spool_path:
+                lock = self._lock_spool(spool)
+                if lock is None:
+                    continue  # owner still running (or no flock to tell)
+            try:
+                jobs = self._read_jobs(spool + ".replay") + self._read_jobs(spool)
+                if jobs:
+                    with open(own, "a", encoding="utf-8") as f:
+                        f.writelines(json.dumps(job, ensure_ascii=False) + "\n" for job in jobs)
+                    print(f"[HistoryWriter] Adopted {len(jobs)} spooled chat turns from {os.path.basename(spool)}")
+                for leftover in (spool + ".replay", spool) + ((spool + ".lock",) if lock else ()):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+            except OSError as e:
+                print(f"[HistoryWriter] Could not adopt {spool}: {e}")
+            finally:
+                if lock is not None:
+                    lock.close()
+
+    def _spool(self, job: dict):
+        with self._spool_lock, open(self._own_spool, "a", encoding="utf-8") as f:
+            f.write(json.dumps(job, ensure_ascii=False) + "\n")
+        with self._lock:
+            self._counters["spooled"] += 1
+
+    def _read_jobs(self, path: str) -> List[dict]:
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _replay_spool(self, startup: bool = False):
+        """
+        Re-queues this worker's spooled turns, after adopting those of workers
+        that are gone. They are moved to a ".replay" file that is kept until
+        everything queued before it has drained, so a crash mid-replay loses
+        nothing (replaying a turn twice is harmless: message ids are fixed).
+        """
+        spool = self._own_spool
+        replaying = spool + ".replay"
+        with self._spool_lock:
+            self._adopt_orphans()
+            if startup:
+                jobs = self._read_jobs(replaying) + self._read_jobs(spool)
+                if not jobs:
+                    return
+                tmp = replaying + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(job, ensure_ascii=False) + "\n" for job in jobs)
+                os.replace(tmp, replaying)
+                if os.path.exists(spool):
+                    os.remove(spool)
+            else:
+                with self._lock:
+                    busy = bool(self._timers) or not self._queue.empty()
+                if os.path.exists(replaying):
+                    if busy:
+                        return
+                    # Everything from the previous replay is committed or spooled again
+                    os.remove(replaying)
+                if not os.path.exists(spool):
+                    return
+                os.replace(spool, replaying)
+                jobs = self._read_jobs(replaying)
+
+        print(f"[HistoryWriter] Replaying {len(jobs)} spooled chat turns")
+        for job in jobs:
+            with self._lock:
+                self._counters["replayed"] += 1
+                bucket = self._pending.setdefault(job["path"], {})
+                for message in job["messages"]:
+                    bucket[message["id"]] = message
+            self._queue.put((job, 1))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            waiting = len(self._timers)
+            pending = sum(len(bucket) for bucket in self._pending.values())
+        return {
+            **counters,
+            "running": self.running,
+            "queue_depth": self._queue.qsize(),
+            "waiting_retry": waiting,
+            "pending_messages": pending,
+        }
+
+
+history_writer = HistoryWriter()
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from AI_Engine.batching import MicroBatcher
+
+# --- Retrieval service configuration ---
+RETRIEVAL_K = 5
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "4096"))
+RETRIEVAL_BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5"))
+RETRIEVAL_MAX_BATCH_SIZE = int(os.getenv("RETRIEVAL_MAX_BATCH_SIZE", "32"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    # all-MiniLM-L6-v2 is uncased, so case never changes the embedding
+    return _WHITESPACE.sub(" ", text or "").strip().lower()
+
+
+class RetrievalService:
+    """
+    Shared top-k retrieval over the compact FAISS vector store.
+
+    Query embeddings are kept in a bounded LRU keyed by normalized text, and
+    concurrent requests are coalesced by a MicroBatcher into one encode call
+    for the cache misses and one batched FAISS search for the whole batch.
+    Each result carries its query vector so callers (the crisis engine, the
+    semantic cache) can reuse it instead of embedding the text again.
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        embeddings,
+        k: int = RETRIEVAL_K,
+        cache_size: int = RETRIEVAL_CACHE_SIZE,
+        window_ms: float = RETRIEVAL_BATCH_WINDOW_MS,
+        max_batch_size: int = RETRIEVAL_MAX_BATCH_SIZE,
+    ):
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings
+        self.k = k
+        self.cache_size = max(1, cache_size)
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"embedding_hits": 0, "embedding_misses": 0}
+        self.batcher = MicroBatcher(
+            self._search_batch, max_batch_size=max_batch_size, window_ms=window_ms, name="retrieval"
+        )
+
+    def _embed_batch(self, keys: List[str]) -> np.ndarray:
+        vectors: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    vectors[key] = cached
+            hits = sum(1 for key in keys if key in vectors)
+            self._counters["embedding_hits"] += hits
+            self._counters["embedding_misses"] += len(keys) - hits
+
+        misses = list(dict.fromkeys(key for key in keys if key not in vectors))
+        if misses:
+            encoded = np.asarray(self.embeddings.embed_documents(misses), dtype="float32")
+            with self._lock:
+                for key, vector in zip(misses, encoded):
+                    vectors[key] = vector
+                    self._cache[key] = vector
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return np.stack([vectors[key] for key in keys])
+
+    def _search_batch(self, questions: List[str]) -> List[Tuple[List[Document], np.ndarray]]:
+        matrix = self._embed_batch([normalize_query(q) for q in questions])
+        return list(zip(self.vectorstore.search_by_vectors(matrix, self.k), matrix))
+
+    def submit(self, question: str) -> "Future[Tuple[List[Document], np.ndarray]]":
+        """Starts retrieval without waiting; the future resolves to (docs, query vector)."""
+        return self.batcher.submit(question)
+
+    def retrieve_with_vector(self, question: str) -> Tuple[List[Document], np.ndarray]:
+        return self.submit(question).result()
+
+    def retrieve(self, question: str) -> List[Document]:
+        """Top-k documents for one question (blocks until its batch has run)."""
+        return self.retrieve_with_vector(question)[0]
+
+    async def aretrieve(self, question: str) -> List[Document]:
+        docs, _ = await asyncio.wrap_future(self.submit(question))
+        return docs
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._cache)
+        lookups = counters["embedding_hits"] + counters["embedding_misses"]
+        return {
+            "batching": self.batcher.stats(),
+            "embedding_cache": {
+                **counters,
+                "hit_rate": round(counters["embedding_hits"] / lookups, 4) if lookups else 0.0,
+                "entries": size,
+                "max_entries": self.cache_size,
+            },
+        }
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# --- Chat history cache configuration ---
+CHAT_HISTORY_CACHE_SESSIONS = int(os.getenv("CHAT_HISTORY_CACHE_SESSIONS", "2048"))
+CHAT_HISTORY_CACHE_IDLE_S = float(os.getenv("CHAT_HISTORY_CACHE_IDLE_S", "1800"))
+# "version": compare the session's version stamp in Firestore (one document
+# read) before serving a cached history and summary, and reload them if
+# another worker wrote. The default whenever more than one worker runs
+# (WEB_CONCURRENCY, set by gunicorn.conf.py), since turns are not routed sticky.
+# "off": trust the cache; opt in for a single worker or sticky sessions.
+CHAT_HISTORY_COHERENCE = os.getenv("CHAT_HISTORY_COHERENCE") or (
+    "version" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "off"
+)
+
+# How many of its own recent turn versions an entry remembers; a retried write
+# may land after a newer one, so the stamp in Firestore can briefly lag
+_KNOWN_VERSIONS = 32
+
+
+class _Session:
+    __slots__ = ("messages", "versions", "summary", "summary_through", "last_used")
+
+    def __init__(self, limit: int):
+        self.messages: deque = deque(maxlen=limit)  # (id, role, content), oldest first
+        self.versions: deque = deque(maxlen=_KNOWN_VERSIONS)
+        self.summary: Optional[str] = None          # rolling summary of older turns
+        self.summary_through: Optional[str] = None  # id of the last message it covers
+        self.last_used = time.monotonic()
+
+
+# (messages, summary, summary_through) as returned by SessionHistoryCache.get
+CachedSession = Tuple[List[Tuple[str, str, str]], Optional[str], Optional[str]]
+
+
+class SessionHistoryCache:
+    """
+    Write-through cache of the most recent chat messages per session.
+
+    Entries are filled from Firestore on a cold miss and then kept current
+    by ChatHistoryPipeline.store, so later turns of the same session need no
+    history read. Sessions are evicted least-recently-used beyond
+    `max_sessions` and after `idle_s` without a turn.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = CHAT_HISTORY_CACHE_SESSIONS,
+        idle_s: float = CHAT_HISTORY_CACHE_IDLE_S,
+        coherence: str = CHAT_HISTORY_COHERENCE,
+    ):
+        self.max_sessions = max(1, max_sessions)
+        self.idle_s = idle_s
+        self.coherence = coherence
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "expired": 0, "evicted": 0}
+
+    @property
+    def versioned(self) -> bool:
+        return self.coherence == "version"
+
+    def _live(self, key: str, now: float) -> Optional[_Session]:
+        entry = self._sessions.get(key)
+        if entry is None:
+            return None
+        if now - entry.last_used > self.idle_s:
+            del self._sessions[key]
+            self._counters["expired"] += 1
+            return None
+        return entry
+
+    def get(self, key: str, remote_version: Optional[str] = None) -> Optional[CachedSession]:
+        """
+        Cached (id, role, content) messages plus the rolling summary for a
+        session, or None on a miss.
+        With version coherence, `remote_version` is the stamp read from
+        Firestore; an entry that has not seen it is dropped as stale.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if self.versioned and remote_version is not None and remote_version not in entry.versions:
+                del self._sessions[key]
+                self._counters["stale"] += 1
+                self._counters["misses"] += 1
+                return None
+            entry.last_used = now
+            self._sessions.move_to_end(key)
+            self._counters["hits"] += 1
+            return list(entry.messages), entry.summary, entry.summary_through
+
+    def load(
+        self,
+        key: str,
+        messages: Iterable[Tuple[str, str, str]],
+        limit: int,
+        versions: Iterable[str] = (),
+        summary: Optional[str] = None,
+        summary_through: Optional[str] = None,
+    ):
+        """
+        Fills an entry from a Firestore read (replacing any previous one).
+        `versions` are the stamps this read already reflects: the session's
+        current stamp and the ids of the messages it returned.
+        """
+        entry = _Session(limit)
+        entry.messages.extend(messages)
+        entry.versions.extend(v for v in versions if v is not None)
+        entry.summary, entry.summary_through = summary, summary_through
+        with self._lock:
+            self._sessions[key] = entry
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._counters["evicted"] += 1
+
+    def append(self, key: str, messages: Iterable[Tuple[str, str, str]], version: Optional[str] = None):
+        """
+        Write-through for a stored turn. Sessions that are not cached stay
+        uncached: their next read is a cold miss that sees the new messages.
+        """
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            if entry is None:
+                return
+            entry.messages.extend(messages)
+            if version is not None:
+                entry.versions.append(version)
+            entry.last_used = time.monotonic()
+            self._sessions.move_to_end(key)
+
+    def set_summary(self, key: str, summary: str, summary_through: str):
+        """Records a refreshed summary for a cached session (no-op if it is not cached)."""
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None:
+                entry.summary, entry.summary_through = summary, summary_through
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            sessions = len(self._sessions)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "sessions": sessions,
+            "max_sessions": self.max_sessions,
+            "idle_s": self.idle_s,
+            "coherence": self.coherence,
+        }
+
+
+session_cache = SessionHistoryCache()
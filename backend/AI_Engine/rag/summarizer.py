@@ -0,0 +1,155 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from AI_Engine.llm_client import gemini_llm
+from AI_Engine.prompt_budget import (
+    CHAT_SUMMARY_MAX_TOKENS, count_tokens, token_usage, truncate_to_tokens, usage_from_response
+)
+
+# --- Conversation summary configuration ---
+CHAT_SUMMARY_ENABLED = os.getenv("CHAT_SUMMARY", "1") == "1"
+# Messages replayed verbatim in the chat prompt; older ones are summarized
+CHAT_RECENT_MESSAGES = int(os.getenv("CHAT_RECENT_MESSAGES", "6"))
+# Refresh the summary once this many messages have left the recent window
+CHAT_SUMMARY_TRIGGER = int(os.getenv("CHAT_SUMMARY_TRIGGER", "4"))
+CHAT_SUMMARY_TIMEOUT_S = float(os.getenv("CHAT_SUMMARY_TIMEOUT_S", "30"))
+CHAT_SUMMARY_WORKERS = int(os.getenv("CHAT_SUMMARY_WORKERS", "2"))
+
+summary_prompt = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        "You keep a short running summary of a conversation between a user and Reflecto, "
+        "a gentle mental health companion. Update the summary with the new messages.\n"
+        "- Keep what matters for the rest of the conversation: what the user is going through, "
+        "how they feel, people and events they mentioned, and anything they asked Reflecto to remember.\n"
+        "- Write plain sentences in the third person (\"The user...\"), no lists or markdown.\n"
+        f"- Stay under {CHAT_SUMMARY_MAX_TOKENS * 3 // 4} words. Drop details that no longer matter.\n"
+        "- Reply with the updated summary only."
+    ),
+    ("user", "Current summary:\n{summary}\n\nNew messages:\n{messages}"),
+])
+
+# (id, role, content) as kept by SessionHistoryCache
+Message = Tuple[str, str, str]
+
+
+def split_history(messages: List[Message], summary_through: Optional[str]) -> Tuple[List[Message], List[Message]]:
+    """
+    Splits a session's latest messages into (prompt history, to summarize).
+    Prompt history is everything the summary does not cover yet, so nothing
+    is lost while a refresh is pending; the second list holds the messages
+    outside the recent window that the next refresh should fold in.
+    If `summary_through` is not among them, `messages` must be every message
+    after it (ChatHistoryPipeline reads those from Firestore).
+    """
+    ids = [message[0] for message in messages]
+    start = ids.index(summary_through) + 1 if summary_through in ids else 0
+    unsummarized = messages[start:]
+    older = unsummarized[:-CHAT_RECENT_MESSAGES] if CHAT_RECENT_MESSAGES else unsummarized
+    return unsummarized, older
+
+
+class ConversationSummarizer:
+    """
+    Background rolling summaries. refresh() folds messages that left the
+    recent window into the previous summary with one Gemini call, stores the
+    result on the session document and hands it to `on_done`. At most one
+    refresh runs per session; a failed one is simply retried on a later turn,
+    since the stored `summary_through` does not move.
+    """
+
+    def __init__(self, llm=None, db=None, workers: int = CHAT_SUMMARY_WORKERS):
+        self._llm = llm
+        self._db = db
+        self.policy = gemini_llm("summary")
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="chat-summary")
+        self._lock = threading.Lock()
+        self._in_flight: set = set()
+        self._counters = {"refreshed": 0, "failed": 0, "skipped": 0}
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from AI_Engine.rag.Query import chat_model
+            self._llm = chat_model.get()
+        return self._llm
+
+    @property
+    def db(self):
+        if self._db is None:
+            from core.firebase import db
+            self._db = db
+        return self._db
+
+    def refresh(
+        self,
+        session_path: str,
+        summary: Optional[str],
+        messages: List[Message],
+        on_done: Optional[Callable[[str, str], None]] = None,
+    ) -> bool:
+        """Schedules a refresh; False if one is already running for this session."""
+        with self._lock:
+            if session_path in self._in_flight:
+                self._counters["skipped"] += 1
+                return False
+            self._in_flight.add(session_path)
+        self._executor.submit(self._refresh, session_path, summary, messages, on_done)
+        return True
+
+    def _refresh(self, session_path: str, summary: Optional[str], messages: List[Message], on_done):
+        try:
+            transcript = "\n".join(
+                f"{'User' if role == 'user' else 'Reflecto'}: {content}" for _, role, content in messages
+            )
+            inputs = {"summary": summary or "(none yet)", "messages": transcript}
+            response = self.policy.call(
+                lambda timeout: (summary_prompt | self.llm.bind(timeout=timeout)).invoke(inputs),
+                deadline_s=CHAT_SUMMARY_TIMEOUT_S,
+            )
+            updated = truncate_to_tokens(getattr(response, "content", response).strip(), CHAT_SUMMARY_MAX_TOKENS)
+
+            input_tokens, output_tokens = usage_from_response(response)
+            token_usage.record(
+                "chat_summary",
+                {"summary": count_tokens(inputs["summary"]), "messages": count_tokens(transcript)},
+                output_tokens if output_tokens is not None else count_tokens(updated),
+                input_tokens=input_tokens,
+                measured=input_tokens is not None,
+            )
+
+            through = messages[-1][0]
+            self.db.document(session_path).set({
+                "summary": updated,
+                "summary_through": through,
+                "summary_updated_at": datetime.utcnow(),
+            }, merge=True)
+            if on_done is not None:
+                on_done(updated, through)
+            with self._lock:
+                self._counters["refreshed"] += 1
+        except Exception as e:
+            print(f"[ConversationSummarizer] Refresh for {session_path} failed: {e}")
+            with self._lock:
+                self._counters["failed"] += 1
+        finally:
+            with self._lock:
+                self._in_flight.discard(session_path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                "in_flight": len(self._in_flight),
+                "enabled": CHAT_SUMMARY_ENABLED,
+                "recent_messages": CHAT_RECENT_MESSAGES,
+                "trigger": CHAT_SUMMARY_TRIGGER,
+            }
+
+
+conversation_summarizer = ConversationSummarizer()
@@ -0,0 +1,211 @@
+import copy
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from AI_Engine.rag.crisis_detection import crisis_engine, detect_crisis
+from core.resources import resource
+
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# --- Semantic cache configuration ---
+# A stored response is served when a new input's MiniLM embedding has at least
+# SEMANTIC_CACHE_THRESHOLD cosine similarity to a cached one with the same labels.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "1") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.93"))
+SEMANTIC_CACHE_TTL_S = float(os.getenv("SEMANTIC_CACHE_TTL_S", "86400"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+
+
+def _load_embeddings():
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+
+
+embeddings_resource = resource("embeddings", _load_embeddings)
+
+
+def get_embeddings():
+    """Returns the shared MiniLM embedding model (also used by the RAG retriever)."""
+    return embeddings_resource.get()
+
+
+def embed_text(text: str) -> np.ndarray:
+    vector = np.asarray(get_embeddings().embed_query(text), dtype="float32")
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Partition:
+    """Entry ids and vectors of one label partition, row-aligned and updated in place."""
+
+    __slots__ = ("ids", "rows", "vectors")
+
+    def __init__(self, dim: int):
+        self.ids: list = []
+        self.rows: Dict[str, int] = {}
+        self.vectors = np.empty((8, dim), dtype="float32")  # capacity doubles as needed
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self.vectors[:len(self.ids)]
+
+    def add(self, entry_id: str, vector: np.ndarray):
+        row = len(self.ids)
+        if row == len(self.vectors):
+            grown = np.empty((2 * row, self.vectors.shape[1]), dtype="float32")
+            grown[:row] = self.vectors
+            self.vectors = grown
+        self.vectors[row] = vector
+        self.ids.append(entry_id)
+        self.rows[entry_id] = row
+
+    def remove(self, entry_id: str):
+        # The last row moves into the freed slot
+        row, last = self.rows.pop(entry_id), len(self.ids) - 1
+        if row != last:
+            moved = self.ids[last]
+            self.vectors[row] = self.vectors[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+        self.ids.pop()
+
+
+class SemanticCache:
+    """
+    Near-duplicate response cache keyed on MiniLM embeddings.
+
+    Entries are partitioned by `labels` (e.g. sentiment + sarcasm, and the
+    prompt version), so a paraphrase only matches responses generated for the
+    same emotional reading. Entries expire after `ttl_s` and the least recently
+    used ones are evicted beyond `max_entries`. Crisis-flagged inputs are never
+    stored or served.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_s: float = SEMANTIC_CACHE_TTL_S,
+        max_entries: int = SEMANTIC_CACHE_SIZE,
+        enabled: bool = SEMANTIC_CACHE_ENABLED,
+    ):
+        self.name = name
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self.enabled = enabled
+
+        # entry id -> (partition, vector, value, expires_at), in LRU order
+        self._entries: "OrderedDict[str, Tuple[tuple, np.ndarray, Any, float]]" = OrderedDict()
+        # partition -> its ids and vector rows, kept in step with _entries
+        self._partitions: Dict[tuple, _Partition] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "evicted": 0, "crisis_skipped": 0}
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """
+        Embeds `text` for get/put, or returns None when it must bypass the cache
+        (disabled, empty, crisis-flagged, or the embedding model failed).
+        """
+        if not self.enabled or not text or not text.strip():
+            return None
+        if detect_crisis(text):
+            with self._lock:
+                self._counters["crisis_skipped"] += 1
+            return None
+        try:
+            vector = embed_text(text)
+        except Exception as e:
+            print(f"[SemanticCache:{self.name}] Embedding failed, bypassing cache: {e}")
+            return None
+        return self._unless_crisis(vector)
+
+    def from_vector(self, vector: np.ndarray) -> Optional[np.ndarray]:
+        """Like embed(), for a MiniLM vector the caller already computed (e.g. by the retriever)."""
+        if not self.enabled or vector is None:
+            return None
+        norm = np.linalg.norm(vector)
+        return self._unless_crisis(vector / norm if norm else vector)
+
+    def _unless_crisis(self, vector: np.ndarray) -> Optional[np.ndarray]:
+        # Inputs close to a crisis exemplar are never cached either (stage 2)
+        if crisis_engine.check_vector(vector).is_crisis:
+            with self._lock:
+                self._counters["crisis_skipped"] += 1
+            return None
+        return vector
+
+    def get(self, text: str, labels: Sequence = (), vector: Optional[np.ndarray] = None) -> Optional[Any]:
+        """Returns the closest cached response above the threshold, or None."""
+        vector = self.embed(text) if vector is None else vector
+        if vector is None:
+            return None
+        partition = tuple(labels)
+        now = time.time()
+
+        with self._lock:
+            part = self._partitions.get(partition)
+            if part is not None:
+                scores = part.matrix @ vector
+                above = np.flatnonzero(scores >= self.threshold)
+                # Ids are read before any drop below reorders the rows
+                for entry_id in [part.ids[i] for i in above[np.argsort(-scores[above])]]:
+                    entry = self._entries[entry_id]
+                    if entry[3] <= now:
+                        self._drop(entry_id)
+                        self._counters["expired"] += 1
+                        continue
+                    self._entries.move_to_end(entry_id)
+                    self._counters["hits"] += 1
+                    return copy.deepcopy(entry[2])
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, text: str, value: Any, labels: Sequence = (), vector: Optional[np.ndarray] = None):
+        vector = self.embed(text) if vector is None else vector
+        if vector is None:
+            return
+        partition = tuple(labels)
+
+        with self._lock:
+            entry_id = uuid.uuid4().hex
+            self._entries[entry_id] = (partition, vector, copy.deepcopy(value), time.time() + self.ttl_s)
+            if partition not in self._partitions:
+                self._partitions[partition] = _Partition(len(vector))
+            self._partitions[partition].add(entry_id, vector)
+            self._counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._counters["evicted"] += 1
+
+    def _drop(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            part = self._partitions[entry[0]]
+            part.remove(entry_id)
+            if not len(part):
+                del self._partitions[entry[0]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_s": self.ttl_s,
+            "enabled": self.enabled,
+        }
@@ -1,45 +1,204 @@
+import asyncio
+import os
+import threading
+import time
+from typing import List
+
 import torch
-from AI_Engine.model_loader import global_tokenizer, global_model, DEVICE, MAX_LEN, REVERSE_SENTIMENT, REVERSE_SARCASM
+from AI_Engine.model_loader import (
+    DEVICE, MAX_LEN, LENGTH_BUCKET_SIZE, PAD_TO_MULTIPLE_OF, REVERSE_SENTIMENT, REVERSE_SARCASM,
+    CASCADE_ENABLED, CASCADE_CONFIDENCE_THRESHOLD,
+    get_model, get_small_model, wait_for_model, model_status
+)
+from AI_Engine.batching import MicroBatcher
+
+# --- Micro-batching configuration ---
+# Concurrent requests are collected for up to BATCH_WINDOW_MS (or until
+# MAX_BATCH_SIZE texts are waiting) and run through one batched forward pass
+# per length bucket (see _tokenize_buckets).
+BATCH_WINDOW_MS = float(os.getenv("SENTIMENT_BATCH_WINDOW_MS", "10"))
+MAX_BATCH_SIZE = int(os.getenv("SENTIMENT_MAX_BATCH_SIZE", "16"))
+
+
+def _tokenize_buckets(tokenizer, texts: List[str]):
+    """
+    Tokenize a batch without padding, sort it by token length and yield
+    (original_indices, input_ids, attention_mask) per length bucket.
+    Each bucket is padded only to its own longest item.
+    """
+    encoded = tokenizer(texts, max_length=MAX_LEN, truncation=True)["input_ids"]
+    order = sorted(range(len(texts)), key=lambda i: len(encoded[i]))
+
+    groups, current, current_bucket = [], [], None
+    for i in order:
+        bucket = -(-len(encoded[i]) // LENGTH_BUCKET_SIZE)
+        if current and bucket != current_bucket:
+            groups.append(current)
+            current = []
+        current.append(i)
+        current_bucket = bucket
+    if current:
+        groups.append(current)
+
+    pad_id = tokenizer.pad_token_id
+    for indices in groups:
+        longest = max(len(encoded[i]) for i in indices)
+        width = min(MAX_LEN, -(-longest // PAD_TO_MULTIPLE_OF) * PAD_TO_MULTIPLE_OF)
+
+        input_ids = torch.full((len(indices), width), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(indices), width), dtype=torch.long)
+        for row, i in enumerate(indices):
+            ids = encoded[i]
+            input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, :len(ids)] = 1
+        yield indices, input_ids, attention_mask
+
+
+def _run_model(tokenizer, model, texts: List[str]):
+    """Runs one model over the texts (bucketed) and returns softmax probabilities in the caller's order."""
+    sentiment_probs = torch.empty((len(texts), len(REVERSE_SENTIMENT)))
+    sarcasm_probs = torch.empty((len(texts), len(REVERSE_SARCASM)))
+
+    for indices, input_ids, attention_mask in _tokenize_buckets(tokenizer, texts):
+        # Inference
+        with torch.no_grad():
+            sentiment_logits, sarcasm_logits = model(
+                input_ids=input_ids.to(DEVICE),
+                attention_mask=attention_mask.to(DEVICE)
+            )
+        rows = torch.tensor(indices, dtype=torch.long)
+        sentiment_probs[rows] = torch.softmax(sentiment_logits.float().cpu(), dim=1)
+        sarcasm_probs[rows] = torch.softmax(sarcasm_logits.float().cpu(), dim=1)
+
+    return sentiment_probs, sarcasm_probs
+
+
+def _to_labels(sentiment_probs, sarcasm_probs) -> List[dict]:
+    """Maps predicted classes (argmax) to readable strings."""
+    sentiment_preds = torch.argmax(sentiment_probs, dim=1).tolist()
+    sarcasm_preds = torch.argmax(sarcasm_probs, dim=1).tolist()
+    return [
+        {
+            "sentiment": REVERSE_SENTIMENT[s],
+            "sarcasm": REVERSE_SARCASM[c]
+        }
+        for s, c in zip(sentiment_preds, sarcasm_preds)
+    ]
+
+
+def cascade_confidence(sentiment_probs, sarcasm_probs):
+    """Per-text confidence of a prediction: the lower of the two heads' top softmax probability."""
+    return torch.minimum(sentiment_probs.max(dim=1).values, sarcasm_probs.max(dim=1).values)
+
+
+# --- Per-tier latency metrics ---
+_tier_lock = threading.Lock()
+_tier_stats = {
+    "small": {"batches": 0, "items": 0, "total_ms": 0.0},
+    "large": {"batches": 0, "items": 0, "total_ms": 0.0},
+    "cascade_items": 0,
+    "escalated": 0,
+}
+
+
+def _record_tier(tier: str, items: int, started: float):
+    with _tier_lock:
+        stats = _tier_stats[tier]
+        stats["batches"] += 1
+        stats["items"] += items
+        stats["total_ms"] += (time.perf_counter() - started) * 1000.0
 
-def analyze_sentiment(text: str):
-    """Analyze sentiment and sarcasm using the trained RoBERTa model."""
-    
-    # Ensure the model is loaded
-    if global_model is None or global_tokenizer is None:
-        raise RuntimeError("❌ AI model is not initialized or failed to load.")
-
-    # Tokenization and tensor conversion
-    encoding = global_tokenizer.encode_plus(
-        text, 
-        max_length=MAX_LEN, 
-        padding='max_length', 
-        return_tensors='pt', 
-        truncation=True
-    )
-    input_ids = encoding['input_ids'].to(DEVICE)
-    attention_mask = encoding['attention_mask'].to(DEVICE)
-
-    # Inference
-    with torch.no_grad():
-        sentiment_logits, sarcasm_logits = global_model(input_ids=input_ids, attention_mask=attention_mask)
-
-    # Get predicted class (argmax)
-    _, sentiment_pred = torch.max(sentiment_logits, dim=1)
-    _, sarcasm_pred = torch.max(sarcasm_logits, dim=1)
-
-    # Map to readable strings
-    sentiment_label = REVERSE_SENTIMENT[sentiment_pred.item()]
-    sarcasm_label = REVERSE_SARCASM[sarcasm_pred.item()]
+
+def _predict_batch(texts: List[str]) -> List[dict]:
+    """
+    Runs batched forward passes and returns a {sentiment, sarcasm} dict per text.
+    With the cascade enabled, the small model answers first and only texts below
+    CASCADE_CONFIDENCE_THRESHOLD are escalated to roberta-large.
+    """
+
+    # Ensure the model is loaded (raises ModelNotReadyError otherwise)
+    tokenizer, model = get_model()
+    small = get_small_model()
+
+    if small is None:
+        started = time.perf_counter()
+        probs = _run_model(tokenizer, model, texts)
+        _record_tier("large", len(texts), started)
+        return _to_labels(*probs)
+
+    started = time.perf_counter()
+    sentiment_probs, sarcasm_probs = _run_model(*small, texts)
+    _record_tier("small", len(texts), started)
+
+    confidence = cascade_confidence(sentiment_probs, sarcasm_probs).tolist()
+    escalate = [i for i, c in enumerate(confidence) if c < CASCADE_CONFIDENCE_THRESHOLD]
+    if escalate:
+        started = time.perf_counter()
+        large_sentiment, large_sarcasm = _run_model(tokenizer, model, [texts[i] for i in escalate])
+        _record_tier("large", len(escalate), started)
+        rows = torch.tensor(escalate, dtype=torch.long)
+        sentiment_probs[rows] = large_sentiment
+        sarcasm_probs[rows] = large_sarcasm
+
+    with _tier_lock:
+        _tier_stats["cascade_items"] += len(texts)
+        _tier_stats["escalated"] += len(escalate)
+
+    return _to_labels(sentiment_probs, sarcasm_probs)
+
+
+def get_tier_stats() -> dict:
+    """Per-tier latency and the cascade's escalation rate."""
+    with _tier_lock:
+        snapshot = {tier: dict(_tier_stats[tier]) for tier in ("small", "large")}
+        cascade_items, escalated = _tier_stats["cascade_items"], _tier_stats["escalated"]
+
+    for stats in snapshot.values():
+        stats["avg_ms_per_batch"] = round(stats["total_ms"] / stats["batches"], 3) if stats["batches"] else 0.0
+        stats["avg_ms_per_item"] = round(stats["total_ms"] / stats["items"], 3) if stats["items"] else 0.0
+        stats["total_ms"] = round(stats["total_ms"], 3)
 
     return {
-        "sentiment": sentiment_label,
-        "sarcasm": sarcasm_label
+        "cascade_enabled": CASCADE_ENABLED,
+        "confidence_threshold": CASCADE_CONFIDENCE_THRESHOLD,
+        "tiers": snapshot,
+        "escalation_rate": round(escalated / cascade_items, 4) if cascade_items else 0.0,
     }
 
+
+# Shared batching queue in front of the loaded model
+sentiment_batcher = MicroBatcher(
+    _predict_batch,
+    max_batch_size=MAX_BATCH_SIZE,
+    window_ms=BATCH_WINDOW_MS,
+    name="sentiment",
+)
+
+
+def analyze_sentiment(text: str):
+    """Analyze sentiment and sarcasm using the trained RoBERTa model."""
+    wait_for_model()  # bounded wait while the model is still loading
+    return sentiment_batcher.submit(text).result()
+
+
+async def analyze_sentiment_async(text: str):
+    """Same as analyze_sentiment, but awaits the batch without blocking the event loop."""
+    if not model_status()["ready"]:
+        await asyncio.to_thread(wait_for_model)
+    return await asyncio.wrap_future(sentiment_batcher.submit(text))
+
+
+def get_batching_stats() -> dict:
+    """Batch-size and queue-wait statistics for the sentiment queue."""
+    return sentiment_batcher.stats()
+
 # ✅ This allows running the file standalone for quick testing
 if __name__ == "__main__":
     print("🔍 Testing Sentiment and Sarcasm Analyzer with RoBERTa...\n")
 
+    print("⏳ Loading model...")
+    wait_for_model(timeout=600)
+
     sample_text = input("Enter a sample journal entry: ")
     result = analyze_sentiment(sample_text)
 
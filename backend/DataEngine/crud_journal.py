@@ -1,13 +1,34 @@
+import asyncio
+import base64
+import json
+import os
+import uuid
 from datetime import datetime
 from firebase_admin import firestore
 from core.firebase import db
-from AI_Engine.sentiment_analyzer import analyze_sentiment
-from AI_Engine.gemini_advisor import generate_dynamic_advice
+from AI_Engine.analysis_cache import analyze_entry, analyze_entry_async
+from DataEngine.enrichment_queue import EnrichmentQueue, ENRICHMENT_SWEEP_S
 from pydantic import BaseModel, Field
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 JOURNAL_COLLECTION = "journals"
 
+# "sync": analyze before saving (default). "background": save at once with
+# analysis_status "pending" and enrich on the local worker queue.
+ENRICHMENT_MODE = os.getenv("JOURNAL_ENRICHMENT_MODE", "sync").lower()
+ENRICHMENT_LEASE_S = float(os.getenv("ENRICHMENT_LEASE_S", "300"))
+ENRICHMENT_RECOVER_BATCH = 200
+
+# --- Listing configuration ---
+JOURNAL_PAGE_SIZE = int(os.getenv("JOURNAL_PAGE_SIZE", "50"))
+JOURNAL_MAX_PAGE_SIZE = int(os.getenv("JOURNAL_MAX_PAGE_SIZE", "200"))
+# ?fields=summary: everything except the description and the analysis blob
+# (fetch those per journal, e.g. GET /api/journals/{journal_id}/analysis)
+JOURNAL_SUMMARY_FIELDS = (
+    "user_uid", "title", "mood", "productivity", "sentiment", "sarcasm",
+    "analysis_status", "created_at", "updated_at",
+)
+
 # Input schema from API request
 class JournalCreate(BaseModel):
     user_uid: str = Field(..., description="Firebase User UID of logged-in user")
@@ -19,17 +40,12 @@ class JournalCreate(BaseModel):
 
 # ✅ CREATE Journal
 
-def create_journal(journal_data: JournalCreate):
-    print(f"👤 Creating journal for user: {journal_data.user_uid}")
-
-    # 🔍 Run sentiment + sarcasm analysis and Gemini AI advice
-    sentiment_result = analyze_sentiment(journal_data.description)
-    analysis = generate_dynamic_advice(journal_data.description, sentiment_result)
-
+def _save_new_journal(journal_data: JournalCreate, sentiment_result: dict, analysis: dict):
     journal_dict = journal_data.model_dump()
     journal_dict["sentiment"] = sentiment_result["sentiment"]
     journal_dict["sarcasm"] = sentiment_result["sarcasm"]
     journal_dict["analysis"] = analysis
+    journal_dict["analysis_status"] = "complete"
     
     # ✅ Use timezone-aware UTC datetime
     now = datetime.now(timezone.utc)
@@ -42,18 +58,294 @@ def create_journal(journal_data: JournalCreate):
     return {**journal_dict, "id": doc_ref.id}
 
 
+def create_journal(journal_data: JournalCreate):
+    print(f"👤 Creating journal for user: {journal_data.user_uid}")
+
+    # 🔍 Run sentiment + sarcasm analysis and Gemini AI advice (cached by content)
+    sentiment_result, analysis = analyze_entry(journal_data.description)
+    return _save_new_journal(journal_data, sentiment_result, analysis)
+
+
+async def create_journal_async(journal_data: JournalCreate):
+    """Same as create_journal, but awaits the AI steps without blocking the event loop."""
+    print(f"👤 Creating journal for user: {journal_data.user_uid}")
+
+    sentiment_result, analysis = await analyze_entry_async(journal_data.description)
+    return await asyncio.to_thread(_save_new_journal, journal_data, sentiment_result, analysis)
+
+
+# ⏳ Background enrichment: save first, analyze later
+
+def _pending_fields() -> dict:
+    return {
+        "sentiment": None,
+        "sarcasm": None,
+        "analysis": None,
+        "analysis_status": "pending",
+        "analysis_token": uuid.uuid4().hex,  # lets a newer edit supersede an older job
+        "analysis_requested_at": datetime.now(timezone.utc),
+    }
+
+
+def _save_pending_journal(journal_data: JournalCreate):
+    journal_dict = journal_data.model_dump()
+    journal_dict.update(_pending_fields())
+
+    now = datetime.now(timezone.utc)
+    journal_dict["created_at"] = now
+    journal_dict["updated_at"] = now
+
+    doc_ref = db.collection(JOURNAL_COLLECTION).document()
+    doc_ref.set(journal_dict)
+    return {**journal_dict, "id": doc_ref.id}
+
+
+async def create_journal_deferred(journal_data: JournalCreate):
+    """Persists the journal immediately and queues sentiment + advice in the background."""
+    print(f"👤 Creating journal for user: {journal_data.user_uid} (analysis deferred)")
+
+    result = await asyncio.to_thread(_save_pending_journal, journal_data)
+    enrichment_queue.enqueue({
+        "journal_id": result["id"],
+        "text": journal_data.description,
+        "token": result["analysis_token"],
+    })
+    return result
+
+
+async def update_journal_deferred(journal_id: str, updates: dict):
+    """Applies the edit immediately; a changed description is re-analyzed in the background."""
+    updates["updated_at"] = datetime.now()
+    if "description" in updates:
+        updates.update(_pending_fields())
+
+    result = await asyncio.to_thread(_apply_update, journal_id, updates)
+    if result is not None and "description" in updates:
+        enrichment_queue.enqueue({
+            "journal_id": journal_id,
+            "text": updates["description"],
+            "token": updates["analysis_token"],
+        })
+    return result
+
+
+@firestore.transactional
+def _claim_in_transaction(transaction, doc_ref, job: dict, claim: str) -> bool:
+    doc = doc_ref.get(transaction=transaction)
+    if not doc.exists:
+        return False
+    data = doc.to_dict()
+    if data.get("analysis_token") != job["token"]:
+        return False  # Superseded by a newer edit
+    status = data.get("analysis_status")
+    lease_expired = (data.get("analysis_lease_until") or datetime.now(timezone.utc)) <= datetime.now(timezone.utc)
+    own_retry = job.get("claim") is not None and data.get("analysis_claim") == job["claim"]
+    if not (status == "pending" or (status == "processing" and (lease_expired or own_retry))):
+        return False  # Done, failed, or leased by another worker
+    transaction.update(doc_ref, {
+        "analysis_status": "processing",
+        "analysis_claim": claim,
+        "analysis_lease_until": datetime.now(timezone.utc) + timedelta(seconds=ENRICHMENT_LEASE_S),
+    })
+    return True
+
+
+def _claim(job: dict) -> bool:
+    """
+    Marks the job as processing (with a lease) in a transaction, so only one
+    worker process runs it. Allowed when the journal is pending, its lease
+    expired, or this job holds it from a previous attempt; never after a
+    newer edit superseded it.
+    """
+    doc_ref = db.collection(JOURNAL_COLLECTION).document(job["journal_id"])
+    claim = uuid.uuid4().hex
+    if not _claim_in_transaction(db.transaction(), doc_ref, job, claim):
+        return False
+    job["claim"] = claim  # lets this job's own retries re-claim before the lease expires
+    return True
+
+
+@firestore.transactional
+def _store_in_transaction(transaction, doc_ref, job: dict, fields: dict) -> bool:
+    doc = doc_ref.get(transaction=transaction)
+    if not doc.exists:
+        return False
+    data = doc.to_dict()
+    if data.get("analysis_token") != job["token"] or data.get("analysis_claim") != job.get("claim"):
+        return False  # Journal re-edited (or re-claimed) while we were working
+    transaction.update(doc_ref, {**fields, "analysis_completed_at": datetime.now(timezone.utc)})
+    return True
+
+
+def _store_enrichment(job: dict, fields: dict) -> bool:
+    """Stores the result in a transaction, only if this job's edit and claim are still current."""
+    doc_ref = db.collection(JOURNAL_COLLECTION).document(job["journal_id"])
+    return _store_in_transaction(db.transaction(), doc_ref, job, fields)
+
+
+async def _enrich_journal(job: dict, final: bool):
+    """Queue handler: raises to request a retry, records "failed" on the last attempt."""
+    if not await asyncio.to_thread(_claim, job):
+        return
+
+    try:
+        sentiment_result, analysis = await analyze_entry_async(job["text"])
+        if "error" in analysis and not final:
+            raise RuntimeError(analysis["error"])
+    except Exception as e:
+        if final:
+            await asyncio.to_thread(_store_enrichment, job, {
+                "analysis_status": "failed",
+                "analysis_error": str(e),
+            })
+        raise
+
+    fields = {"analysis_status": "failed" if "error" in analysis else "complete"}
+    _with_analysis(fields, sentiment_result, analysis)
+    await asyncio.to_thread(_store_enrichment, job, fields)
+
+
+def _pending_jobs():
+    """Durable backlog: pending journals (and processing ones whose lease expired)."""
+    now = datetime.now(timezone.utc)
+    settle = timedelta(seconds=ENRICHMENT_SWEEP_S)
+    jobs = []
+    for status in ("pending", "processing"):
+        docs = (
+            db.collection(JOURNAL_COLLECTION)
+            .where("analysis_status", "==", status)
+            .limit(ENRICHMENT_RECOVER_BATCH)
+            .stream()
+        )
+        for doc in docs:
+            data = doc.to_dict()
+            if status == "processing" and (data.get("analysis_lease_until") or now) > now:
+                continue
+            # Fresh pending docs are most likely queued in the worker that created them
+            if status == "pending" and (data.get("analysis_requested_at") or now) > now - settle:
+                continue
+            jobs.append({
+                "journal_id": doc.id,
+                "text": data.get("description", ""),
+                "token": data.get("analysis_token"),
+            })
+    return jobs
+
+
+enrichment_queue = EnrichmentQueue(_enrich_journal, _pending_jobs)
+
+
+def get_analysis_status(journal_id: str):
+    doc = db.collection(JOURNAL_COLLECTION).document(journal_id).get()
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    return {
+        "id": journal_id,
+        # Journals saved before background enrichment existed are always complete
+        "analysis_status": data.get("analysis_status", "complete"),
+        "sentiment": data.get("sentiment"),
+        "sarcasm": data.get("sarcasm"),
+        "analysis": data.get("analysis"),
+        "analysis_error": data.get("analysis_error"),
+        "analysis_token": data.get("analysis_token"),  # used by ?wait=, not returned
+    }
+
+
 # ✅ READ All Journals for a User
-def get_all_journals(user_id: str):
+def _journal_fields(fields: str = None):
+    """Field paths for a Firestore projection, or None for whole documents."""
+    if fields is None or fields.strip() in ("", "all"):
+        return None
+    if fields.strip() == "summary":
+        return list(JOURNAL_SUMMARY_FIELDS)
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    if "created_at" not in names:
+        names.append("created_at")  # pages are ordered and resumed by it
+    return names
+
+
+def _to_journal(doc):
+    journal = doc.to_dict()
+    journal["id"] = doc.id
+    return journal
+
+
+def _user_journals(user_id: str, field_paths=None):
+    query = db.collection(JOURNAL_COLLECTION).where("user_uid", "==", user_id)
+    if field_paths is not None:
+        query = query.select(field_paths)
+    return query
+
+
+def get_all_journals(user_id: str, fields: str = None):
     print(f"📚 Fetching journals for user: {user_id}")
-    docs = db.collection(JOURNAL_COLLECTION).where("user_uid", "==", user_id).stream()
+    docs = _user_journals(user_id, _journal_fields(fields)).stream()
+    return [_to_journal(doc) for doc in docs]
+
+
+def _encode_cursor(journal: dict) -> str:
+    raw = json.dumps({"created_at": journal["created_at"].isoformat(), "id": journal["id"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["created_at"]), data["id"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _page(user_id: str, limit: int, after, field_paths):
+    """One page, newest first; the document id breaks created_at ties so no journal is skipped."""
+    query = (
+        _user_journals(user_id, field_paths)
+        .order_by("created_at", direction=firestore.Query.DESCENDING)
+        .order_by("__name__", direction=firestore.Query.DESCENDING)
+    )
+    if after is not None:
+        created_at, journal_id = after
+        query = query.start_after({"created_at": created_at, "__name__": journal_id})
+    # One extra document tells whether another page exists
+    journals = [_to_journal(doc) for doc in query.limit(limit + 1).stream()]
+    next_cursor = _encode_cursor(journals[limit - 1]) if len(journals) > limit else None
+    return journals[:limit], next_cursor
 
-    journals = []
-    for doc in docs:
-        journal = doc.to_dict()
-        journal["id"] = doc.id
-        journals.append(journal)
-    
-    return journals
+
+def get_journal_page(user_id: str, limit: int = JOURNAL_PAGE_SIZE, cursor: str = None, fields: str = None):
+    """
+    A page of a user's journals ordered by created_at (newest first).
+    Pass the returned `next_cursor` back as `cursor` for the next page; it is
+    None on the last one.
+    """
+    limit = max(1, min(limit, JOURNAL_MAX_PAGE_SIZE))
+    after = _decode_cursor(cursor) if cursor else None
+    journals, next_cursor = _page(user_id, limit, after, _journal_fields(fields))
+    return {"journals": journals, "next_cursor": next_cursor}
+
+
+def iter_journals(user_id: str, cursor: str = None, fields: str = None, page_size: int = JOURNAL_PAGE_SIZE):
+    """
+    Every journal from `cursor` on, fetched page by page, so a streamed
+    listing holds one page in memory. Arguments are checked before the first
+    page is read (ValueError for a bad cursor).
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    field_paths = _journal_fields(fields)
+    page_size = max(1, min(page_size, JOURNAL_MAX_PAGE_SIZE))
+
+    def pages():
+        position = after
+        while True:
+            journals, next_cursor = _page(user_id, page_size, position, field_paths)
+            yield from journals
+            if next_cursor is None:
+                return
+            position = journals[-1]["created_at"], journals[-1]["id"]
+
+    return pages()
 
 
 # ✅ READ Journal by ID
@@ -68,16 +360,7 @@ def get_journal_by_id(journal_id: str):
 
 
 # ✅ UPDATE Journal
-def update_journal(journal_id: str, updates: dict):
-    updates["updated_at"] = datetime.now()
-
-    # 🔁 Re-run sentiment and AI analysis if description is updated
-    if "description" in updates:
-        sentiment_result = analyze_sentiment(updates["description"])
-        updates["sentiment"] = sentiment_result["sentiment"]
-        updates["sarcasm"] = sentiment_result["sarcasm"]
-        updates["analysis"] = generate_dynamic_advice(updates["description"], sentiment_result)
-
+def _apply_update(journal_id: str, updates: dict):
     doc_ref = db.collection(JOURNAL_COLLECTION).document(journal_id)
     doc = doc_ref.get()
     if not doc.exists:
@@ -89,6 +372,35 @@ def update_journal(journal_id: str, updates: dict):
     return updated
 
 
+def _with_analysis(updates: dict, sentiment_result: dict, analysis: dict):
+    updates["sentiment"] = sentiment_result["sentiment"]
+    updates["sarcasm"] = sentiment_result["sarcasm"]
+    updates["analysis"] = analysis
+
+
+def update_journal(journal_id: str, updates: dict):
+    updates["updated_at"] = datetime.now()
+
+    # 🔁 Re-run sentiment and AI analysis if description is updated
+    # (unchanged text is served from the analysis cache without any AI calls)
+    if "description" in updates:
+        _with_analysis(updates, *analyze_entry(updates["description"]))
+        updates.update(analysis_status="complete", analysis_token=None)  # supersede any queued job
+
+    return _apply_update(journal_id, updates)
+
+
+async def update_journal_async(journal_id: str, updates: dict):
+    """Same as update_journal, but awaits the AI steps without blocking the event loop."""
+    updates["updated_at"] = datetime.now()
+
+    if "description" in updates:
+        _with_analysis(updates, *(await analyze_entry_async(updates["description"])))
+        updates.update(analysis_status="complete", analysis_token=None)  # supersede any queued job
+
+    return await asyncio.to_thread(_apply_update, journal_id, updates)
+
+
 # ✅ DELETE Journal
 def delete_journal_entry(journal_id: str):
     doc_ref = db.collection(JOURNAL_COLLECTION).document(journal_id)
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import random
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+# --- Background enrichment configuration ---
+ENRICHMENT_CONCURRENCY = int(os.getenv("ENRICHMENT_CONCURRENCY", "4"))
+ENRICHMENT_QUEUE_SIZE = int(os.getenv("ENRICHMENT_QUEUE_SIZE", "1000"))
+ENRICHMENT_MAX_ATTEMPTS = int(os.getenv("ENRICHMENT_MAX_ATTEMPTS", "4"))
+ENRICHMENT_RETRY_BASE_S = float(os.getenv("ENRICHMENT_RETRY_BASE_S", "2"))
+# How often the durable backlog (pending docs in Firestore) is swept for jobs
+# that were never queued here, e.g. after a restart or a full queue
+ENRICHMENT_SWEEP_S = float(os.getenv("ENRICHMENT_SWEEP_S", "60"))
+
+
+def _key(job: dict) -> Tuple[str, Optional[str]]:
+    return job["journal_id"], job.get("token")
+
+
+class EnrichmentQueue:
+    """
+    Local background worker queue for journal enrichment.
+
+    Jobs are dicts with a "journal_id" and the "token" of the edit they
+    analyze. Each (journal_id, token) is queued at most once at a time, so
+    a newer edit is queued even while an older one is still running.
+
+    The queue itself is only a fast path: the durable backlog is the set of
+    documents still marked pending in Firestore, which `recover` returns on
+    startup and on every sweep, so nothing is lost if the process dies or
+    the queue is full.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict, bool], Awaitable[None]],
+        recover: Callable[[], List[dict]],
+        concurrency: int = ENRICHMENT_CONCURRENCY,
+        max_attempts: int = ENRICHMENT_MAX_ATTEMPTS,
+    ):
+        self.handler = handler
+        self.recover = recover
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()  # backoff sleeps, held so they are not collected
+        self._in_flight: set = set()  # (journal_id, token)
+        self._waiters: Dict[Tuple[str, Optional[str]], asyncio.Event] = {}
+        self._counters = {"enqueued": 0, "completed": 0, "retried": 0, "failed": 0, "dropped": 0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=ENRICHMENT_QUEUE_SIZE)
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"enrichment-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._sweeper(), name="enrichment-sweeper"))
+        print(f"🧵 Enrichment queue started ({self.concurrency} workers)")
+
+    async def stop(self):
+        # Retries waiting on their backoff stay pending in Firestore for the next start
+        tasks = self._tasks + list(self._retries)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._retries.clear()
+
+    def enqueue(self, job: dict, attempt: int = 1) -> bool:
+        """Queues a job; returns False if it was left for the next backlog sweep."""
+        key = _key(job)
+        if self._queue is None or (attempt == 1 and key in self._in_flight):
+            return False
+        try:
+            self._queue.put_nowait((job, attempt))
+        except asyncio.QueueFull:
+            self._counters["dropped"] += 1
+            return False
+        self._in_flight.add(key)
+        self._counters["enqueued"] += 1
+        return True
+
+    async def wait_for(self, journal_id: str, token: Optional[str], timeout: float) -> bool:
+        """Waits until this process finishes the job for this edit of the journal; False on timeout."""
+        key = (journal_id, token)
+        if key not in self._in_flight:
+            return False
+        event = self._waiters.setdefault(key, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _finish(self, job: dict):
+        key = _key(job)
+        self._in_flight.discard(key)
+        event = self._waiters.pop(key, None)
+        if event is not None:
+            event.set()
+
+    async def _retry_later(self, job: dict, attempt: int):
+        delay = ENRICHMENT_RETRY_BASE_S * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self._finish(job)  # stopped: the lease expires and a sweep retries it
+            raise
+        try:
+            self._queue.put_nowait((job, attempt + 1))
+        except asyncio.QueueFull:
+            # Still pending in Firestore, so the sweeper will pick it up again
+            self._counters["dropped"] += 1
+            self._finish(job)
+
+    async def _worker(self, index: int):
+        while True:
+            job, attempt = await self._queue.get()
+            final = attempt >= self.max_attempts
+            try:
+                await self.handler(job, final)
+                self._counters["completed"] += 1
+                self._finish(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if final:
+                    self._counters["failed"] += 1
+                    print(f"[EnrichmentQueue] Giving up on {job['journal_id']} after {attempt} attempts: {e}")
+                    self._finish(job)
+                else:
+                    self._counters["retried"] += 1
+                    print(f"[EnrichmentQueue] Attempt {attempt} for {job['journal_id']} failed, retrying: {e}")
+                    retry = asyncio.create_task(self._retry_later(job, attempt))
+                    self._retries.add(retry)
+                    retry.add_done_callback(self._retries.discard)
+            finally:
+                self._queue.task_done()
+
+    async def _sweeper(self):
+        while True:
+            try:
+                jobs = await asyncio.to_thread(self.recover)
+                queued = sum(self.enqueue(job) for job in jobs)
+                if queued:
+                    print(f"[EnrichmentQueue] Recovered {queued} pending journals from the backlog")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[EnrichmentQueue] Backlog sweep failed: {e}")
+            await asyncio.sleep(ENRICHMENT_SWEEP_S)
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": len(self._in_flight),
+            "retrying": len(self._retries),
+            "workers": self.concurrency,
+        }
@@ -0,0 +1,25 @@
+from datetime import date, datetime
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _default(obj):
+    # Firestore returns DatetimeWithNanoseconds (a datetime subclass)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def json_dumps(content) -> bytes:
+    """orjson encoding of Firestore documents (datetimes as ISO 8601, like FastAPI's encoder)."""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson, skipping FastAPI's jsonable_encoder pass."""
+
+    def render(self, content) -> bytes:
+        return json_dumps(content)
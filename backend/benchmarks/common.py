@@ -0,0 +1,99 @@
+import csv
+import os
+import random
+import resource
+import subprocess
+import sys
+from typing import Dict, List
+
+DATA_CSV = os.path.join(os.path.dirname(__file__), "..", "DataEngine", "data", "reflecto_dataset.csv")
+
+# Word-count ranges for journal length profiles; "mixed" mirrors production traffic
+# (mostly short entries with a tail of long ones that hit MAX_LEN truncation)
+LENGTH_PROFILES = {
+    "short": (10, 30),
+    "medium": (40, 90),
+    "long": (120, 220),
+}
+MIXED_WEIGHTS = {"short": 0.7, "medium": 0.2, "long": 0.1}
+
+_SYNTHETIC_VOCAB = (
+    "today i felt tired anxious calm happy work meeting friends family sleep "
+    "walk coffee rain deadline proud lonely stressed grateful exam project "
+    "call mom dinner gym music late morning evening honestly again nothing "
+    "went right okay better worse maybe really just so very little bit day"
+).split()
+
+
+def _word_count(rng: random.Random, profile: str) -> int:
+    if profile == "mixed":
+        profile = rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()))[0]
+    low, high = LENGTH_PROFILES[profile]
+    return rng.randint(low, high)
+
+
+def _dataset_sentences() -> List[str]:
+    with open(DATA_CSV, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return [row["user_input"] for row in rows if row.get("user_input")] + \
+           [row["bot_response"] for row in rows if row.get("bot_response")]
+
+
+def make_texts(spec: str, n: int, seed: int = 7) -> List[str]:
+    """
+    Deterministic benchmark texts. `spec` is "<source>:<profile>" where source is
+    "synthetic" (random vocabulary) or "dataset" (sentences from reflecto_dataset.csv
+    joined into journal-length entries) and profile is short | medium | long | mixed.
+    """
+    source, _, profile = spec.partition(":")
+    profile = profile or "mixed"
+    rng = random.Random(seed)
+    sentences = _dataset_sentences() if source == "dataset" else None
+
+    texts = []
+    for _ in range(n):
+        target = _word_count(rng, profile)
+        words: List[str] = []
+        while len(words) < target:
+            if sentences is not None:
+                words.extend(rng.choice(sentences).split())
+            else:
+                words.append(rng.choice(_SYNTHETIC_VOCAB))
+        texts.append(" ".join(words[:target]))
+    return texts
+
+
+def summarize(latencies_s: List[float], items: int, wall_s: float) -> Dict[str, float]:
+    """p50/p95/p99 latency (ms) per call plus overall items/sec."""
+    ordered = sorted(latencies_s)
+
+    def pct(q):
+        if not ordered:
+            return 0.0
+        return round(1000 * ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        "calls": len(ordered),
+        "items": items,
+        "mean_ms": round(1000 * sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "items_per_sec": round(items / wall_s, 3) if wall_s else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
@@ -0,0 +1,60 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json --tolerance 0.10
+
+Exits with status 1 if any matching case got slower (p95) or lost
+throughput (items/sec) by more than the tolerance.
+"""
+
+import argparse
+import json
+import sys
+
+CASE_KEYS = ("suite", "backend", "threads", "batch_size", "texts", "n")
+
+
+def _index(path):
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    return report.get("meta", {}), {
+        tuple(r.get(k) for k in CASE_KEYS): r for r in report["results"] if "error" not in r
+    }
+
+
+def compare(baseline_path, candidate_path, tolerance=0.10):
+    base_meta, base = _index(baseline_path)
+    cand_meta, cand = _index(candidate_path)
+    print(f"baseline {base_meta.get('commit')}  →  candidate {cand_meta.get('commit')}\n")
+
+    regressions = 0
+    for key in sorted(set(base) & set(cand), key=str):
+        b, c = base[key], cand[key]
+        p95_change = (c["p95_ms"] - b["p95_ms"]) / b["p95_ms"] if b["p95_ms"] else 0.0
+        tput_change = (c["items_per_sec"] - b["items_per_sec"]) / b["items_per_sec"] if b["items_per_sec"] else 0.0
+        regressed = p95_change > tolerance or tput_change < -tolerance
+        regressions += regressed
+
+        label = " ".join(f"{k}={v}" for k, v in zip(CASE_KEYS, key))
+        flag = "❌" if regressed else "✅"
+        print(f"{flag} {label}\n    p95 {b['p95_ms']} → {c['p95_ms']} ms ({p95_change:+.1%})"
+              f"   items/s {b['items_per_sec']} → {c['items_per_sec']} ({tput_change:+.1%})"
+              f"   rss {b.get('peak_rss_mb')} → {c.get('peak_rss_mb')} MB")
+
+    missing = set(base) - set(cand)
+    if missing:
+        print(f"\n⚠️ {len(missing)} baseline cases missing from candidate")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args(argv)
+    return 1 if compare(args.baseline, args.candidate, args.tolerance) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
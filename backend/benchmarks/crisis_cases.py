@@ -0,0 +1,60 @@
+"""
+Held-out crisis detection cases for the "crisis" benchmark suite.
+
+None of these appear in CRISIS_PATTERNS or CRISIS_EXEMPLARS; they measure how
+well each stage generalizes beyond the phrasings it was written from. The
+is_crisis rows of reflecto_dataset.csv are scored separately.
+"""
+
+# Should be flagged: spelling variants, slang and indirect phrasings
+CRISIS_PARAPHRASES = [
+    "i dont wanna be alive anymore",
+    "I'm soooo done, I want to die",
+    "Honestly I think everyone would be happier if I was gone",
+    "i keep thinking about ending everything",
+    "I cant do this anymore. I just want it to stop forever",
+    "I've been cutting again",
+    "thinking of taking all my pills tonight",
+    "I want to go to sleep and never wake up",
+    "there is no point in me being here",
+    "I'm writing goodbye letters to my friends",
+    "I'm a burden to everyone, they'd be better off without me",
+    "Life feels pointless and I don't want to keep living",
+    "I looked up ways to kill myself",
+    "I wish I had never been born and I want it to end",
+    "I've made up my mind, this is my last night",
+    "I want to disappear and never come back",
+    "I'm planning to end my life this weekend",
+    "nothing matters, I just want to stop existing",
+    "I can't see any way out except dying",
+    "I feel like hurting myself right now",
+]
+
+# Should NOT be flagged: everyday hyperbole and negative-but-safe entries
+HARD_NEGATIVES = [
+    "This traffic is killing me",
+    "I could die of embarrassment after that meeting",
+    "My phone died halfway through the call",
+    "I'm dead tired after the gym",
+    "The deadline is going to be the end of me lol",
+    "I killed it at my presentation today",
+    "I'm so done with this group project",
+    "I wanted to disappear into my blanket all weekend",
+    "I hurt my ankle on the run this morning",
+    "The movie ending made me cry so much",
+    "I feel stuck at work and I'm not sure what to do next",
+    "I'm exhausted and stressed about exams",
+    "My grandmother passed away last year and I still miss her",
+    "I can't wait for this week to end",
+    "I'm tired of cooking the same dinner every night",
+    "Sleep is the only thing I want right now",
+    "I feel lonely since my friends moved away",
+    "I'm anxious about the doctor's appointment tomorrow",
+    "I argued with my mom and felt awful afterwards",
+    "I'm worried I'll fail the exam and disappoint everyone",
+    "I didn't wake up until noon today",
+    "Please do not wake up the baby",
+    "I hurt myself playing football",
+    "I'm going to die of boredom in this lecture",
+    "I cut myself while chopping onions",
+]
@@ -0,0 +1,81 @@
+"""
+Offline stand-ins for Firestore and Gemini so the end-to-end journal
+benchmark measures our own code path without network calls.
+"""
+
+import sys
+import time
+import types
+import uuid
+
+
+class InMemoryDocument:
+    def __init__(self, store, doc_id):
+        self._store = store
+        self.id = doc_id
+
+    @property
+    def exists(self):
+        return self.id in self._store
+
+    def set(self, data):
+        self._store[self.id] = dict(data)
+
+    def update(self, data):
+        self._store[self.id].update(data)
+
+    def get(self):
+        return self
+
+    def to_dict(self):
+        return dict(self._store.get(self.id, {}))
+
+    def delete(self):
+        self._store.pop(self.id, None)
+
+
+class InMemoryCollection:
+    def __init__(self):
+        self._docs = {}
+
+    def document(self, doc_id=None):
+        return InMemoryDocument(self._docs, doc_id or uuid.uuid4().hex[:20])
+
+    def where(self, field, op, value):
+        assert op == "==", "only equality filters are supported offline"
+        matches = [doc_id for doc_id, data in self._docs.items() if data.get(field) == value]
+        query = InMemoryCollection()
+        query._docs = {doc_id: self._docs[doc_id] for doc_id in matches}
+        return query
+
+    def stream(self):
+        return [InMemoryDocument(self._docs, doc_id) for doc_id in list(self._docs)]
+
+
+class InMemoryFirestore:
+    def __init__(self):
+        self._collections = {}
+
+    def collection(self, name):
+        return self._collections.setdefault(name, InMemoryCollection())
+
+
+def install_offline_firebase():
+    """Registers a `core.firebase` module backed by InMemoryFirestore (before crud imports)."""
+    module = types.ModuleType("core.firebase")
+    module.db = InMemoryFirestore()
+    sys.modules["core.firebase"] = module
+    return module.db
+
+
+def make_offline_advice(latency_ms: float = 0.0):
+    """Returns a generate_dynamic_advice replacement with a fixed simulated latency."""
+    def generate_dynamic_advice(journal_text, sentiment_data):
+        if latency_ms:
+            time.sleep(latency_ms / 1000.0)
+        return {
+            "emotional_summary": f"Feels {sentiment_data.get('sentiment', 'neutral')}.",
+            "reflection": "Offline benchmark reflection.",
+            "suggestions": ["Take a short walk.", "Drink some water.", "Write one more line."],
+        }
+    return generate_dynamic_advice
@@ -0,0 +1,140 @@
+"""
+Offline inference benchmarks for the AI engine.
+
+    python -m benchmarks.run --suites sentiment,retriever,journal,crisis \
+        --backends torch,int8 --threads 1,4 --batch-sizes 1,8,32 \
+        --texts synthetic:mixed,dataset:long -n 256 --output bench.json
+
+Every case runs in a fresh subprocess so peak RSS and thread settings are
+isolated. Results are written as JSON (with the git commit) and can be
+compared across commits with `python -m benchmarks.compare old.json new.json`.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.common import git_commit, peak_rss_mb
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_MARKER = "BENCH_RESULT "
+SUITES = ("sentiment", "retriever", "journal", "crisis")
+
+
+def _csv(value, cast=str):
+    return [cast(v.strip()) for v in value.split(",") if v.strip()]
+
+
+def run_case(case: dict) -> dict:
+    """Runs a single benchmark case in this process."""
+    import torch
+
+    torch.set_num_threads(case["threads"])
+    from benchmarks import suites
+
+    if case["suite"] == "sentiment":
+        result = suites.bench_sentiment(case["backend"], case["batch_size"], case["texts"], case["n"])
+    elif case["suite"] == "retriever":
+        result = suites.bench_retriever(case["batch_size"], case["texts"], case["n"])
+    elif case["suite"] == "crisis":
+        result = suites.bench_crisis(case["batch_size"], case["texts"], case["n"])
+    else:
+        result = suites.bench_journal(case["batch_size"], case["texts"], case["n"], case["advice_latency_ms"])
+
+    return {**case, **result, "peak_rss_mb": peak_rss_mb()}
+
+
+def spawn_case(case: dict) -> dict:
+    """Runs a case in a fresh interpreter and parses its result line."""
+    env = {
+        **os.environ,
+        "SENTIMENT_BACKEND": case["backend"],
+        "TORCH_NUM_THREADS": str(case["threads"]),
+        "TOKENIZERS_PARALLELISM": "false",
+    }
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--case", json.dumps(case)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    return {**case, "error": (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ["no output"]}
+
+
+def build_cases(args) -> list:
+    cases = []
+    for suite in args.suites:
+        # The retriever and crisis suites do not use the RoBERTa backend
+        backends = ["torch"] if suite in ("retriever", "crisis") else args.backends
+        for backend, threads, batch_size, texts in itertools.product(
+            backends, args.threads, args.batch_sizes, args.texts
+        ):
+            cases.append({
+                "suite": suite,
+                "backend": backend,
+                "threads": threads,
+                "batch_size": batch_size,
+                "texts": texts,
+                "n": args.n,
+                "advice_latency_ms": args.advice_latency_ms,
+            })
+    return cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reflecto offline inference benchmarks")
+    parser.add_argument("--suites", type=_csv, default=list(SUITES))
+    parser.add_argument("--backends", type=_csv, default=["torch"])
+    parser.add_argument("--threads", type=lambda v: _csv(v, int), default=[os.cpu_count() or 1])
+    parser.add_argument("--batch-sizes", type=lambda v: _csv(v, int), default=[1, 8, 32])
+    parser.add_argument("--texts", type=_csv, default=["synthetic:mixed", "dataset:mixed"])
+    parser.add_argument("-n", type=int, default=256, help="texts per case")
+    parser.add_argument("--advice-latency-ms", type=float, default=0.0,
+                        help="simulated Gemini latency for the journal suite")
+    parser.add_argument("--output", default=None, help="write JSON results here (default: stdout)")
+    parser.add_argument("--case", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(RESULT_MARKER + json.dumps(run_case(json.loads(args.case))))
+        return 0
+
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    results = []
+    for case in build_cases(args):
+        print(f"⏱️  {case['suite']} backend={case['backend']} threads={case['threads']} "
+              f"batch={case['batch_size']} texts={case['texts']}", file=sys.stderr)
+        results.append(spawn_case(case))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"✅ Wrote {len(results)} results to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    return 1 if any("error" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from benchmarks.common import make_texts, summarize
+
+RETRIEVER_K = 5
+
+
+def bench_sentiment(backend: str, batch_size: int, texts: str, n: int) -> Dict:
+    """RoBERTa forward passes (bucketed tokenization included) over `n` texts."""
+    from AI_Engine.model_loader import load_and_initialize_model
+    from AI_Engine.sentiment_analyzer import _run_model
+
+    tokenizer, model = load_and_initialize_model(backend)
+    samples = make_texts(texts, n)
+    _run_model(tokenizer, model, samples[:batch_size])  # warm-up
+
+    latencies = []
+    started = time.perf_counter()
+    for start in range(0, n, batch_size):
+        call = time.perf_counter()
+        _run_model(tokenizer, model, samples[start:start + batch_size])
+        latencies.append(time.perf_counter() - call)
+    return summarize(latencies, n, time.perf_counter() - started)
+
+
+def bench_retriever(batch_size: int, texts: str, n: int) -> Dict:
+    """Query embedding + FAISS top-k search (with document reads) against the saved vector store."""
+    import numpy as np
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from AI_Engine.rag.BuildStore import DB_FAISS_PATH, EMBED_MODEL
+    from AI_Engine.rag.compact_store import load_vector_store
+
+    embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+    vectorstore = load_vector_store(DB_FAISS_PATH, embeddings)
+    queries = make_texts(texts, n)
+    vectorstore.similarity_search(queries[0], embeddings, k=RETRIEVER_K)  # warm-up
+
+    latencies = []
+    started = time.perf_counter()
+    for start in range(0, n, batch_size):
+        batch = queries[start:start + batch_size]
+        call = time.perf_counter()
+        if batch_size == 1:
+            vectorstore.similarity_search(batch[0], embeddings, k=RETRIEVER_K)
+        else:
+            vectors = np.asarray(embeddings.embed_documents(batch), dtype="float32")
+            vectorstore.search_by_vectors(vectors, RETRIEVER_K)
+        latencies.append(time.perf_counter() - call)
+    return summarize(latencies, n, time.perf_counter() - started)
+
+
+def bench_journal(batch_size: int, texts: str, n: int, advice_latency_ms: float = 0.0) -> Dict:
+    """
+    End-to-end create_journal with in-memory Firestore and an offline advisor.
+    `batch_size` is the number of concurrent callers sharing the sentiment batcher.
+    """
+    from benchmarks.fakes import install_offline_firebase, make_offline_advice
+
+    install_offline_firebase()
+    from AI_Engine import analysis_cache
+    from AI_Engine.model_loader import load_model_blocking
+    from DataEngine.crud_journal import create_journal
+    from DataEngine.models import Journal
+
+    analysis_cache.generate_dynamic_advice = make_offline_advice(advice_latency_ms)
+    load_model_blocking()
+
+    # Unique texts so every call misses the analysis cache
+    entries = [
+        Journal(user_uid="bench-user", title=f"Entry {i}", description=f"{text} (#{i})", mood=5, productivity=5)
+        for i, text in enumerate(make_texts(texts, n))
+    ]
+
+    def timed(entry):
+        call = time.perf_counter()
+        create_journal(entry)
+        return time.perf_counter() - call
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=batch_size) as pool:
+        latencies = list(pool.map(timed, entries))
+    return summarize(latencies, n, time.perf_counter() - started)
+
+
+def _crisis_eval_sets():
+    import csv
+    from benchmarks.common import DATA_CSV
+    from benchmarks.crisis_cases import CRISIS_PARAPHRASES, HARD_NEGATIVES
+
+    with open(DATA_CSV, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    flagged = lambda row: str(row.get("is_crisis", "0")).strip().lower() in {"1", "true", "yes"}
+    return {
+        "dataset_crisis": (sorted({r["user_input"] for r in rows if flagged(r)}), True),
+        "dataset_other": (sorted({r["user_input"] for r in rows if not flagged(r)}), False),
+        "paraphrases": (CRISIS_PARAPHRASES, True),
+        "hard_negatives": (HARD_NEGATIVES, False),
+    }
+
+
+def bench_crisis(batch_size: int, texts: str, n: int) -> Dict:
+    """
+    Both crisis stages: pattern-matcher latency per message, exemplar-similarity
+    latency per batch of already-embedded messages (as in the chat path, where
+    the retriever supplies the vector), and per-stage detection rates on the
+    dataset plus the held-out cases in benchmarks/crisis_cases.py.
+    """
+    import numpy as np
+    from AI_Engine.rag.crisis_detection import CrisisEngine, detect_crisis
+    from AI_Engine.semantic_cache import get_embeddings
+
+    engine = CrisisEngine(semantic=True)
+    embeddings = get_embeddings()
+    samples = make_texts(texts, n)
+    engine.similarity(embeddings.embed_query(samples[0]))  # warm-up (embeds the exemplars)
+
+    pattern_latencies = []
+    started = time.perf_counter()
+    for text in samples:
+        call = time.perf_counter()
+        detect_crisis(text)
+        pattern_latencies.append(time.perf_counter() - call)
+    pattern_wall = time.perf_counter() - started
+
+    vectors = np.asarray(embeddings.embed_documents(samples), dtype="float32")
+    semantic_latencies = []
+    started = time.perf_counter()
+    for start in range(0, n, batch_size):
+        call = time.perf_counter()
+        for vector in vectors[start:start + batch_size]:
+            engine.check_vector(vector)
+        semantic_latencies.append(time.perf_counter() - call)
+    semantic_wall = time.perf_counter() - started
+
+    detection = {}
+    for name, (cases, positive) in _crisis_eval_sets().items():
+        case_vectors = np.asarray(embeddings.embed_documents(cases), dtype="float32")
+        pattern = [detect_crisis(text) for text in cases]
+        semantic = [engine.check_vector(vector).is_crisis for vector in case_vectors]
+        combined = [p or s for p, s in zip(pattern, semantic)]
+        # Recall for crisis sets, false-positive rate for the others
+        rate = lambda hits: round(sum(hits) / len(cases), 4) if cases else 0.0
+        detection[name] = {
+            "cases": len(cases),
+            "metric": "recall" if positive else "false_positive_rate",
+            "pattern": rate(pattern),
+            "semantic": rate(semantic),
+            "combined": rate(combined),
+        }
+
+    return {
+        **summarize(semantic_latencies, n, semantic_wall),
+        "pattern": summarize(pattern_latencies, n, pattern_wall),
+        "threshold": engine.threshold,
+        "detection": detection,
+    }
@@ -1,14 +1,10 @@
 import os
-import firebase_admin
 from dotenv import load_dotenv
-from firebase_admin import credentials, firestore
 
 load_dotenv()
 
-#Firebase
-cred = credentials.Certificate("firebase_secret.json")
-firebase_admin.initialize_app(cred)
-firestoreDB = firestore.client()
+#Firebase (shared, lazily initialized client)
+from core.firebase import db as firestoreDB
 
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
\ No newline at end of file
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -1,9 +1,33 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import os
 
-# Initialize Firebase with credentials
-cred = credentials.Certificate("firebase_secret.json")
-firebase_admin.initialize_app(cred)
+from core.resources import resource
 
-# Firestore client instance
-db = firestore.client()
+# Service account file (relative to the working directory, as before)
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "firebase_secret.json")
+
+
+def _create_client():
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    # Initialize Firebase with credentials (once per process)
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS))
+    return firestore.client()
+
+
+firestore_client = resource("firestore", _create_client)
+
+
+class _LazyClient:
+    """Stands in for the Firestore client; the real one is created on first attribute access."""
+
+    def __getattr__(self, name):
+        return getattr(firestore_client.get(), name)
+
+    def __repr__(self):
+        return f"<lazy Firestore client ({firestore_client.status()['status']})>"
+
+
+# Firestore client instance (the only one in the process)
+db = _LazyClient()
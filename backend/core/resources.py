@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Startup configuration ---
+# Resources built on a background thread once the server is up, so the first
+# request does not pay for them ("none" = build everything on first use)
+STARTUP_WARM = os.getenv("STARTUP_WARM", "embeddings,retrieval,chat_model")
+
+# Measured from the first import of this module (main.py imports it first)
+_PROCESS_T0 = time.perf_counter()
+
+
+class Resource:
+    """
+    A heavy, process-wide object (model client, vector store, DB client)
+    built exactly once by `factory`: on first `get()` or by `warm()` on a
+    background thread, whichever comes first. Import never builds it.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+        self._state = {"status": "not_loaded", "seconds": None, "error": None}
+
+    @property
+    def ready(self) -> bool:
+        return self._state["status"] == "ready"
+
+    def get(self) -> Any:
+        if self._state["status"] == "ready":
+            return self._value
+        with self._lock:
+            if self._state["status"] != "ready":
+                self._state.update(status="loading", error=None)
+                started = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                except Exception as e:
+                    # Not cached: the next get() tries again
+                    self._state.update(status="failed", error=str(e))
+                    raise
+                self._state.update(status="ready", seconds=round(time.perf_counter() - started, 3))
+        return self._value
+
+    def peek(self) -> Optional[Any]:
+        """The value if it is already built, without building it."""
+        return self._value if self.ready else None
+
+    def status(self) -> Dict[str, Any]:
+        return dict(self._state)
+
+
+_registry: Dict[str, Resource] = {}
+_phases: List[Dict[str, Any]] = []
+_phases_lock = threading.Lock()
+
+
+def resource(name: str, factory: Callable[[], Any]) -> Resource:
+    """Registers a lazily built resource (one per name)."""
+    if name not in _registry:
+        _registry[name] = Resource(name, factory)
+    return _registry[name]
+
+
+@contextmanager
+def phase(name: str):
+    """Times a startup step (an import, a lifespan action) for the startup report."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _phases_lock:
+            _phases.append({
+                "phase": name,
+                "at_s": round(started - _PROCESS_T0, 3),
+                "seconds": round(time.perf_counter() - started, 3),
+            })
+
+
+def _names(names: Optional[Iterable[str]]) -> List[str]:
+    if names is None:
+        names = [] if STARTUP_WARM.strip().lower() in ("", "none", "0") else STARTUP_WARM.split(",")
+    names = [name.strip() for name in names if name.strip()]
+    unknown = [name for name in names if name not in _registry]
+    if unknown:
+        print(f"[resources] Unknown resources in STARTUP_WARM, ignored: {', '.join(unknown)}")
+    return [name for name in names if name in _registry]
+
+
+def warm(names: Iterable[str] = None) -> List[str]:
+    """Builds the named resources (default: STARTUP_WARM) one by one; returns those that failed."""
+    failed = []
+    for name in _names(names):
+        try:
+            with phase(f"warm:{name}"):
+                _registry[name].get()
+        except Exception as e:
+            print(f"[resources] Warming {name} failed (will retry on first use): {e}")
+            failed.append(name)
+    return failed
+
+
+def warm_in_background(names: Iterable[str] = None) -> Optional[threading.Thread]:
+    """Runs warm() on a daemon thread so startup does not wait for it."""
+    names = _names(names)
+    if not names:
+        return None
+
+    def run():
+        warm(names)
+        print(f"🔥 Warmed {', '.join(names)} ({time.perf_counter() - _PROCESS_T0:.1f}s after start)")
+
+    thread = threading.Thread(target=run, name="resource-warmer", daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_report() -> Dict[str, Any]:
+    """Import/startup phase timings and the state of every registered resource."""
+    with _phases_lock:
+        phases = list(_phases)
+    return {
+        "uptime_s": round(time.perf_counter() - _PROCESS_T0, 3),
+        "phases": phases,
+        "resources": {name: res.status() for name, res in _registry.items()},
+    }
@@ -0,0 +1,47 @@
+# 📄 gunicorn.conf.py
+#
+#   gunicorn main:app -c gunicorn.conf.py
+#
+# Worker count comes from WEB_CONCURRENCY. With MODEL_SHARE_MODE=preload the
+# master imports the app and loads the model, the MiniLM embeddings and the
+# FAISS index once before forking, so workers share them copy-on-write.
+# With the default "mmap" mode each worker maps the same weights file instead.
+
+import gc
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+os.environ["WEB_CONCURRENCY"] = str(workers)  # read by configure_threads() in each worker
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+preload_app = os.getenv("MODEL_SHARE_MODE", "mmap").lower() == "preload"
+
+# Rust tokenizers must not start their thread pool before fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    import torch
+    from AI_Engine.model_loader import load_model_blocking
+    from core.resources import warm
+
+    # Keep the master single-threaded so no OpenMP pool exists at fork time
+    torch.set_num_threads(1)
+    load_model_blocking()
+    # Importing the app no longer builds these. Not the Firestore or Gemini
+    # clients: their gRPC channels must be created after fork.
+    warm(["embeddings", "retrieval"])
+    # Move everything loaded so far out of the GC's reach so collections in
+    # the workers don't touch (and copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from AI_Engine.model_loader import configure_threads
+
+    threads = configure_threads(workers)
+    server.log.info(f"Worker {worker.pid}: torch threads = {threads}")
@@ -1,14 +1,48 @@
 # 📄 main.py
 
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from core.resources import phase, startup_report, warm_in_background  # first: starts the startup clock
+
+import asyncio
+from contextlib import asynccontextmanager
+
+with phase("import:fastapi"):
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse
+
+# Imports only: models, the vector store and the Firebase client are built
+# later (core/resources.py), so these stay cheap
+with phase("import:ai_routes"):
+    from routes.ai_routes import router as ai_router
+with phase("import:journal_routes"):
+    from routes.journal_routes import router as journal_router
+with phase("import:analytics_routes"):
+    from routes.analytics_routes import router as analytics_router  # ✅ Analytics routes import
+from AI_Engine.model_loader import configure_threads, start_background_load, model_status
+from DataEngine.crud_journal import enrichment_queue
+from AI_Engine.rag.history_writer import history_writer
+
+
+# ✅ Load the RoBERTa model in the background once the server is up
+# (no-op when the gunicorn master already preloaded it, see gunicorn.conf.py)
+# and warm the RAG stack (STARTUP_WARM) on another thread
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with phase("lifespan:configure_threads"):
+        configure_threads()
+    start_background_load()
+    warm_in_background()
+    with phase("lifespan:enrichment_queue"):
+        await enrichment_queue.start()  # also recovers journals left pending by a previous run
+    with phase("lifespan:history_writer"):
+        history_writer.start()  # also replays chat turns spooled by a previous run
+    yield
+    await enrichment_queue.stop()
+    await asyncio.to_thread(history_writer.stop)
 
-from routes.ai_routes import router as ai_router
-from routes.journal_routes import router as journal_router
-from routes.analytics_routes import router as analytics_router  # ✅ Analytics routes import
 
 # ✅ Initialize FastAPI app
-app = FastAPI(title="Reflecto AI Engine")
+app = FastAPI(title="Reflecto AI Engine", lifespan=lifespan)
 
 # ✅ Add CORS Middleware
 app.add_middleware(
@@ -31,3 +65,22 @@ app.include_router(analytics_router, prefix="/api/analytics")
 @app.get("/")
 def root():
     return {"message": "Reflecto AI backend is running 🚀"}
+
+
+# ✅ Readiness probe: 200 once the model is loaded and warmed up, 503 otherwise
+@app.get("/ready")
+def ready():
+    status = model_status()
+    if status["ready"]:
+        return {"ready": True, "model": status}
+    return JSONResponse(
+        status_code=503,
+        content={"ready": False, "model": status},
+        headers={"Retry-After": "5"},
+    )
+
+
+# ✅ Startup profile: import/lifespan phase timings and which heavy resources are built
+@app.get("/startup")
+def startup():
+    return {**startup_report(), "model": model_status()}
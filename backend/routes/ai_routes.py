@@ -1,7 +1,11 @@
 # 📄 routes/ai_routes.py
 
 from fastapi import APIRouter, FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List
+import asyncio
+import json
 import uvicorn
 import os
 import sys
@@ -12,23 +16,40 @@ if BASE_DIR not in sys.path:
     sys.path.append(BASE_DIR)
 
 # ✅ Existing imports
-from AI_Engine.sentiment_analyzer import analyze_sentiment
-from AI_Engine.gemini_advisor import generate_dynamic_advice
+from AI_Engine.sentiment_analyzer import get_batching_stats, get_tier_stats
+from DataEngine.crud_journal import enrichment_queue
+from AI_Engine.analysis_cache import analyze_entry_async, analyze_entries_async, analysis_cache
+from AI_Engine.gemini_advisor import advice_llm, advice_semantic_cache
+from AI_Engine.rag.crisis_detection import crisis_engine
+from AI_Engine.rag.Query import chat_llm, chat_semantic_cache, get_stream_stats, retrieval_resource
+from AI_Engine.prompt_budget import token_usage
+from AI_Engine.model_loader import ModelNotReadyError, model_status, wait_for_model
 
 # ✅ NEW: ChatHistoryPipeline from Reflecto RAG
-from AI_Engine.rag.chat_history import ChatHistoryPipeline
+from AI_Engine.rag.chat_history import ChatHistoryPipeline, chat_stage_stats
+from AI_Engine.rag.history_writer import history_writer
+from AI_Engine.rag.session_cache import session_cache
+from AI_Engine.rag.summarizer import conversation_summarizer
 
 pipeline = ChatHistoryPipeline()
 
 # Create FastAPI router
 router = APIRouter()
-chat_pipeline = ChatHistoryPipeline()  # pipeline with Firestore + Query.py
 
 
 class JournalRequest(BaseModel):
     entry: str
 
 
+# Upper bound on entries accepted by one batch request
+BATCH_MAX_ENTRIES = int(os.getenv("BATCH_MAX_ENTRIES", "500"))
+
+
+class JournalBatchRequest(BaseModel):
+    entries: List[str] = Field(..., min_length=1)
+    stream: bool = False  # stream results as NDJSON lines (still in input order)
+
+
 class ChatRequest(BaseModel):
     user_id: str
     session_id: str
@@ -38,11 +59,9 @@ class ChatRequest(BaseModel):
 @router.post("/analyze-journal")
 async def analyze_journal(request: JournalRequest):
     try:
-        # Analyze sentiment + sarcasm using RoBERTa model
-        sentiment_result = analyze_sentiment(request.entry)  # Now returns {'sentiment': ..., 'sarcasm': ...}
-
-        # Generate dynamic advice based on the updated sentiment result
-        gemini_result = generate_dynamic_advice(request.entry, sentiment_result)
+        # Analyze sentiment + sarcasm using RoBERTa model, then generate dynamic advice
+        # based on the sentiment result (both served from the cache for repeated text)
+        sentiment_result, gemini_result = await analyze_entry_async(request.entry)
 
         return {
             "status": "success",
@@ -50,11 +69,69 @@ async def analyze_journal(request: JournalRequest):
             "gemini_advice": gemini_result           # Includes JSON from Gemini response
         }
 
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
 
+@router.post("/analyze-journal/batch")
+async def analyze_journal_batch(request: JournalBatchRequest):
+    """
+    Batch variant of /analyze-journal for imports and re-scoring jobs.
+    Results come back in input order, with per-item errors.
+    """
+    if len(request.entries) > BATCH_MAX_ENTRIES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ENTRIES} entries per batch")
+
+    try:
+        if not model_status()["ready"]:
+            await asyncio.to_thread(wait_for_model)
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    if request.stream:
+        async def ndjson_lines():
+            async for item in analyze_entries_async(request.entries):
+                yield json.dumps(item) + "\n"
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    results = [item async for item in analyze_entries_async(request.entries)]
+    return {
+        "status": "success",
+        "count": len(results),
+        "errors": sum(1 for item in results if item["status"] == "error"),
+        "results": results,
+    }
+
+
+@router.get("/sentiment/stats")
+async def sentiment_stats():
+    """Batch-size and queue-wait statistics for the RoBERTa inference queue, plus per-tier latency."""
+    return {"status": "success", "batching": get_batching_stats(), "tiers": get_tier_stats()}
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the exact analysis cache and the semantic advice/chat caches."""
+    return {
+        "status": "success",
+        "analysis_cache": analysis_cache.stats(),
+        "semantic_cache": {
+            "advice": advice_semantic_cache.stats(),
+            "chat": chat_semantic_cache.stats(),
+        },
+    }
+
+
+@router.get("/enrichment/stats")
+async def enrichment_stats():
+    """Queue depth and completion/retry/failure counters for background journal enrichment."""
+    return {"status": "success", "enrichment": enrichment_queue.stats()}
+
+
 @router.get("/chat/health")
 async def chat_health():
     return {"ok": True, "service": "reflecto-chat", "stage": "rag-ready"}
@@ -69,7 +146,9 @@ async def chat_reflecto(request: ChatRequest):
         if not request.user_id.strip() or not request.message.strip():
             raise HTTPException(status_code=400, detail="user_id and message are required")
 
-        result = pipeline.process(
+        # process() blocks on Firestore and Gemini, so keep it off the event loop
+        result = await asyncio.to_thread(
+            pipeline.process,
             user_id=request.user_id,
             session_id=request.session_id,
             query=request.message
@@ -86,6 +165,84 @@ async def chat_reflecto(request: ChatRequest):
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
 
+@router.post("/chat/stream")
+async def chat_reflecto_stream(request: ChatRequest):
+    """
+    Streaming chat over Server-Sent Events: `token` events carry answer text as
+    Gemini generates it, and a final `done` event carries crisis/num_docs. The
+    full answer is saved to the session history when the stream completes.
+    """
+    if not request.user_id.strip() or not request.message.strip():
+        raise HTTPException(status_code=400, detail="user_id and message are required")
+
+    async def sse_events():
+        try:
+            async for event in pipeline.process_stream(
+                user_id=request.user_id,
+                session_id=request.session_id,
+                query=request.message
+            ):
+                if event["type"] == "token":
+                    payload = {"text": event["text"]}
+                else:
+                    payload = {k: v for k, v in event.items() if k not in ("type", "answer")}
+                yield f"event: {event['type']}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': f'Chat error: {str(e)}'})}\n\n"
+
+    return StreamingResponse(
+        sse_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/chat/stats")
+async def chat_stats():
+    """
+    Per-stage chat latency (history, retrieval wait, Gemini, store, total),
+    time-to-first-token for streamed answers, crisis-check counters, the
+    background history writer's queue/retry/spool counters, the session
+    history cache hit rate and rolling-summary refresh counters.
+    """
+    return {
+        "status": "success",
+        "stages": chat_stage_stats.stats(),
+        "streaming": get_stream_stats(),
+        "crisis": crisis_engine.stats(),
+        "history_writer": history_writer.stats(),
+        "history_cache": session_cache.stats(),
+        "summaries": conversation_summarizer.stats(),
+    }
+
+
+@router.get("/retrieval/stats")
+async def retrieval_stats():
+    """Batch-size/queue-wait statistics and query-embedding cache hit rate for RAG retrieval."""
+    service = retrieval_resource.peek()
+    if service is None:
+        # Not built yet (startup warming or first chat request builds it)
+        return {"status": "success", "retrieval": retrieval_resource.status()}
+    return {"status": "success", "retrieval": service.stats()}
+
+
+@router.get("/llm/stats")
+async def llm_stats():
+    """Retry/hedge/short-circuit counters, latency and breaker state per Gemini call site."""
+    return {
+        "status": "success",
+        "advice": advice_llm.stats(),
+        "chat": chat_llm.stats(),
+        "summary": conversation_summarizer.policy.stats(),
+    }
+
+
+@router.get("/llm/usage")
+async def llm_usage():
+    """Prompt (per section) and answer token usage per endpoint since startup."""
+    return {"status": "success", "usage": token_usage.stats()}
+
+
 # ✅ For direct testing only
 if __name__ == "__main__":
     app = FastAPI(title="Reflecto AI Route Tester")
@@ -1,24 +1,22 @@
 # 📄 routes/journal_routes.py
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from datetime import datetime
-from google.cloud import firestore
-from google.oauth2 import service_account
-import os
-from DataEngine.crud_journal import get_all_journals, create_journal, update_journal, get_journal_by_id, delete_journal_entry
+import asyncio
+from DataEngine.crud_journal import (
+    get_all_journals, create_journal_async, update_journal_async, get_journal_by_id, delete_journal_entry,
+    create_journal_deferred, update_journal_deferred, get_analysis_status, enrichment_queue, ENRICHMENT_MODE,
+    get_journal_page, iter_journals, JOURNAL_PAGE_SIZE, JOURNAL_MAX_PAGE_SIZE
+)
+from Utils.helpers import FastJSONResponse, json_dumps
 from DataEngine.models import Journal  # ✅ Import the Pydantic Journal model
+from AI_Engine.model_loader import ModelNotReadyError
 
 
 router = APIRouter()
 
-# ✅ Firebase connection setup
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-CRED_PATH = os.path.join(BASE_DIR, "firebase_secret.json")
-creds = service_account.Credentials.from_service_account_file(CRED_PATH)
-db = firestore.Client(credentials=creds)
-journals_ref = db.collection("journals")
-
 # ✅ Journal Schema (request validation)
 class JournalCreate(BaseModel):
     user_uid: str = Field(..., description="Firebase User UID of logged-in user")
@@ -28,19 +26,33 @@ class JournalCreate(BaseModel):
     productivity: int = Field(..., ge=1, le=10)
 
 
+def _defer_analysis(background: bool = None) -> bool:
+    # Per-request override, otherwise JOURNAL_ENRICHMENT_MODE decides
+    if background is None:
+        background = ENRICHMENT_MODE == "background"
+    return background and enrichment_queue.running
+
+
 # ✅ Create Journal Entry
 @router.post("/", summary="Create a new journal entry")
-async def create_journal_entry(entry: JournalCreate):
+async def create_journal_entry(entry: JournalCreate, background: bool = Query(None)):
     try:
         print(entry.user_uid)
 
         # ✅ Convert to full Journal model for compatibility with create_journal()
         journal = Journal(**entry.model_dump())
 
+        # ✅ Background mode: saved at once with analysis_status "pending", enriched by the worker queue
+        if _defer_analysis(background):
+            return await create_journal_deferred(journal)
+
         # ✅ This ensures analysis, sentiment, sarcasm, timestamps etc. are added inside create_journal()
-        result = create_journal(journal)
+        # Awaits RoBERTa (shared batch) and Gemini without blocking the event loop
+        result = await create_journal_async(journal)
         return result
     
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -48,28 +60,71 @@ async def create_journal_entry(entry: JournalCreate):
 
 
 # ✅ Get All Journals by User UID
+# Without limit/cursor/stream this is the original response: a list of every journal.
+# With limit or cursor: {"journals": [...], "next_cursor": ...}, newest first.
+# With stream=true: NDJSON, one journal per line, read from Firestore page by page.
 @router.get("/{user_uid}", summary="Get all journals for a user")
-async def get_user_journals(user_uid: str):
+async def get_user_journals(
+    user_uid: str,
+    limit: int = Query(None, ge=1, le=JOURNAL_MAX_PAGE_SIZE),
+    cursor: str = Query(None, description="next_cursor of the previous page"),
+    fields: str = Query(None, description="all (default), summary, or a comma-separated field list"),
+    stream: bool = Query(False),
+):
     try:
-        result = get_all_journals(user_uid)
-        print(len(result))
-        return result
+        if stream:
+            journals = iter_journals(user_uid, cursor, fields, limit or JOURNAL_PAGE_SIZE)
+            ndjson_lines = (json_dumps(journal) + b"\n" for journal in journals)
+            return StreamingResponse(ndjson_lines, media_type="application/x-ndjson")
+
+        if limit is None and cursor is None:
+            result = await asyncio.to_thread(get_all_journals, user_uid, fields)
+            print(len(result))
+            return FastJSONResponse(result)
+
+        page = await asyncio.to_thread(get_journal_page, user_uid, limit or JOURNAL_PAGE_SIZE, cursor, fields)
+        return FastJSONResponse(page)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ✅ Poll (or long-poll with ?wait=N seconds) for background analysis
+@router.get("/{journal_id}/analysis", summary="Get analysis status for a journal entry")
+async def get_journal_analysis(journal_id: str, wait: float = Query(0, ge=0, le=30)):
+    try:
+        status = await asyncio.to_thread(get_analysis_status, journal_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Journal not found")
+
+        if wait and status["analysis_status"] in ("pending", "processing"):
+            # Wait for the job analyzing the current edit, not a superseded one
+            await enrichment_queue.wait_for(journal_id, status["analysis_token"], wait)
+            status = await asyncio.to_thread(get_analysis_status, journal_id)
+        status.pop("analysis_token", None)
+        return status
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ✅ Update a Journal
 @router.put("/{journal_id}", summary="Update journal entry by ID")
-async def update_journal_entry(journal_id: str, entry: JournalCreate):
+async def update_journal_entry(journal_id: str, entry: JournalCreate, background: bool = Query(None)):
     try:
-        result = update_journal(journal_id, entry.model_dump())
+        if _defer_analysis(background):
+            result = await update_journal_deferred(journal_id, entry.model_dump())
+        else:
+            result = await update_journal_async(journal_id, entry.model_dump())
         return {
             "success": True,
             "message": "Journal updated successfully",
             "updated_entry": result
         }
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e: